@@ -1,21 +1,138 @@
 from aws_cdk import (
-    # Duration,
+    Duration,
     Stack,
+    aws_autoscaling as autoscaling,
     aws_ec2 as ec2,
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_iam as iam,
+    Annotations,
     CfnOutput,
     CfnTag,
 )
 from constructs import Construct
+import re
+
+
+def context_bool(value):
+    """
+    Context values passed with `cdk -c key=value` arrive as strings, so
+    "false" and "0" have to be read as False.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "yes", "1")
+    return bool(value)
+
+
+def context_int(value, name, default):
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"context value '{name}' must be an integer, got {value!r}")
+
+
+# Performance presets (context key performancePreset). Each one only supplies
+# defaults: any of these keys given explicitly with -c wins over the preset.
+PERFORMANCE_PRESETS = {
+    # Burstable Graviton instance that may run above baseline when traffic spikes
+    "web": {
+        "instanceType": "t4g.medium",
+        "cpuCredits": "unlimited",
+        "rootVolumeType": "gp3",
+        "rootVolumeSize": 20,
+    },
+    # Storage-optimized Nitro instance: local NVMe scratch space plus a
+    # provisioned-IOPS root volume, spread across distinct hardware
+    "io-heavy": {
+        "instanceType": "i4i.xlarge",
+        "ebsOptimized": True,
+        "placementStrategy": "spread",
+        "rootVolumeType": "io2",
+        "rootVolumeSize": 100,
+        "rootVolumeIops": 16000,
+        "instanceStoreMount": "/mnt/nvme",
+    },
+    # Compute-optimized Graviton instances packed into one cluster placement
+    # group for low-latency, high-throughput networking between them
+    "compute": {
+        "instanceType": "c7g.2xlarge",
+        "ebsOptimized": True,
+        "placementStrategy": "cluster",
+        "rootVolumeType": "gp3",
+        "rootVolumeSize": 30,
+        "rootVolumeIops": 6000,
+        "rootVolumeThroughput": 250,
+    },
+}
+
+PLACEMENT_STRATEGIES = {
+    "cluster": ec2.PlacementGroupStrategy.CLUSTER,
+    "partition": ec2.PlacementGroupStrategy.PARTITION,
+    "spread": ec2.PlacementGroupStrategy.SPREAD,
+}
+
+# Volume type -> (min IOPS, max IOPS, max IOPS per GiB); None means the type
+# has no provisioned IOPS. Only gp3 takes a throughput setting.
+VOLUME_TYPES = {
+    "gp2": (ec2.EbsDeviceVolumeType.GP2, None),
+    "gp3": (ec2.EbsDeviceVolumeType.GP3, (3000, 16000, 500)),
+    "io1": (ec2.EbsDeviceVolumeType.IO1, (100, 64000, 50)),
+    "io2": (ec2.EbsDeviceVolumeType.IO2, (100, 256000, 1000)),
+}
+GP3_THROUGHPUT = (125, 1000)
+
+
+def has_instance_store(instance_type_str):
+    """
+    Best-effort check for instance types with local NVMe storage: the storage
+    optimized classes (i, im, is, d, h) and any type with a "d" attribute
+    (m6id, c6gd, r5dn, ...).
+    """
+    match = re.match(r"^([a-z]+)(\d+)([a-z-]*)\.", instance_type_str)
+    if not match:
+        return False
+    family, _, attributes = match.groups()
+    return family in ("i", "im", "is", "d", "h") or "d" in attributes
+
+
+def instance_store_commands(mount_point):
+    """
+    Shell commands that format the NVMe instance-store volumes (striped as
+    RAID 0 when there are several) and mount them at `mount_point`.
+    Instance storage is wiped on stop, so this only has to run at first boot.
+    """
+    return [
+        "devices=$(lsblk -d -n -o NAME,MODEL | awk '/Amazon EC2 NVMe Instance Storage/ {print \"/dev/\" $1}')",
+        "count=$(echo \"$devices\" | grep -c /dev/)",
+        'if [ "$count" -gt 1 ]; then yum install -y mdadm && '
+        'mdadm --create /dev/md0 --level=0 --raid-devices="$count" $devices && target=/dev/md0; '
+        'elif [ "$count" -eq 1 ]; then target="$devices"; fi',
+        f'if [ -n "$target" ]; then mkfs.xfs -f "$target" && mkdir -p {mount_point} && '
+        f'mount -o noatime "$target" {mount_point}; fi',
+    ]
+
 
 class LaunchNewEc2InstanceStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        preset_name = self.node.try_get_context("performancePreset")
+        if preset_name and preset_name not in PERFORMANCE_PRESETS:
+            raise ValueError(f"unknown performancePreset '{preset_name}', "
+                             f"expected one of: {', '.join(PERFORMANCE_PRESETS)}")
+        self.preset = PERFORMANCE_PRESETS.get(preset_name, {})
+
         instance_name = self.node.try_get_context('instanceName') or "my-Instance"
-        instance_type_str = self.node.try_get_context("instanceType") or "t2.micro"
+        instance_type_str = self.preset_context("instanceType") or "t2.micro"
         instance_type = ec2.InstanceType(instance_type_str)
-        machine_image = self.node.try_get_context('machineImage') or ec2.AmazonLinuxImage(generation=ec2.AmazonLinuxGeneration.AMAZON_LINUX_2)
+        # Graviton types need an arm64 image
+        cpu_type = (ec2.AmazonLinuxCpuType.ARM_64 if instance_type.architecture == ec2.InstanceArchitecture.ARM_64
+                    else ec2.AmazonLinuxCpuType.X86_64)
+        machine_image = self.node.try_get_context('machineImage') or ec2.AmazonLinuxImage(
+            generation=ec2.AmazonLinuxGeneration.AMAZON_LINUX_2, cpu_type=cpu_type)
+        performance = self.performance_options(instance_type, instance_type_str)
         
         vpc_id = self.node.try_get_context("vpcId")
         if vpc_id:
@@ -57,9 +174,11 @@ class LaunchNewEc2InstanceStack(Stack):
             key_pair = None
 
         public_ip_enabled = self.node.try_get_context("publicIPEnabled")
+        if public_ip_enabled is not None:
+            public_ip_enabled = context_bool(public_ip_enabled)
         
         public_subnet = self.node.try_get_context("publicSubnet")
-        vpc_subnets = ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC) if public_subnet else ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE) 
+        vpc_subnets = ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC) if public_subnet else ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS)
 
 
         user_data_file = self.node.try_get_context("userDataFile")
@@ -75,6 +194,37 @@ class LaunchNewEc2InstanceStack(Stack):
         else:
             user_data = None
 
+        instance_store_mount = self.preset_context("instanceStoreMount")
+        if instance_store_mount:
+            if not has_instance_store(instance_type_str):
+                Annotations.of(self).add_warning(
+                    f"instanceStoreMount is set but {instance_type_str} does not appear to have instance storage")
+            # Custom user data can't be appended to, so the file goes after the mount commands
+            mount_user_data = ec2.UserData.for_linux()
+            mount_user_data.add_commands(*instance_store_commands(instance_store_mount))
+            if user_data_file:
+                mount_user_data.add_commands(*[line for line in user_data_script.splitlines()
+                                               if not line.startswith("#!")])
+            user_data = mount_user_data
+
+        # Fleet mode: an Auto Scaling group behind an Application Load Balancer
+        # instead of a single instance
+        if context_bool(self.node.try_get_context("fleetMode")):
+            self.create_fleet(vpc, vpc_subnets, sec_group, instance_type, machine_image, key_pair, user_data,
+                              public_ip_enabled, performance)
+            if self.node.try_get_context("eipAllocationId"):
+                Annotations.of(self).add_warning("eipAllocationId is ignored in fleet mode; use the load balancer DNS name")
+            if sg_id:
+                Annotations.of(self).add_warning(f"{sg_id} is imported read-only: it must allow port 80 from the load balancer")
+            return
+
+        # AWS::EC2::Instance has no Throughput in its EBS mappings, so a gp3
+        # throughput setting reaches the instance through a launch template
+        volume_template = None
+        if performance["root_throughput"]:
+            volume_template = ec2.LaunchTemplate(self, "RootVolumeLaunchTemplate",
+                                                 block_devices=performance["block_devices"])
+
         instance = ec2.Instance(
             self,
             instance_name,
@@ -86,9 +236,19 @@ class LaunchNewEc2InstanceStack(Stack):
             key_pair=key_pair,
             ssm_session_permissions=True,
             vpc_subnets=vpc_subnets,
-            user_data=user_data
+            user_data=user_data,
+            block_devices=None if volume_template else performance["block_devices"],
+            ebs_optimized=performance["ebs_optimized"],
+            placement_group=performance["placement_group"],
+            credit_specification=performance["cpu_credits"]
             )
         
+        if volume_template:
+            instance.instance.launch_template = ec2.CfnInstance.LaunchTemplateSpecificationProperty(
+                launch_template_id=volume_template.launch_template_id,
+                version=volume_template.latest_version_number
+            )
+
         # Existing Elastic IP allocation ID.
         
         eip_allocation_id = self.node.try_get_context("eipAllocationId")
@@ -105,3 +265,223 @@ class LaunchNewEc2InstanceStack(Stack):
             eip_association.node.add_dependency(instance)
 
         CfnOutput(self, "InstanceId", value=instance.instance_id)
+
+    def preset_context(self, key):
+        """
+        Context value for `key`, falling back to the performance preset.
+        """
+        value = self.node.try_get_context(key)
+        return self.preset.get(key) if value is None else value
+
+    def performance_options(self, instance_type, instance_type_str):
+        """
+        Validate the compute and storage context keys and return the settings
+        shared by the single instance and the fleet launch template:
+
+        cpuCredits ("standard" | "unlimited", burstable types only),
+        ebsOptimized, placementStrategy ("cluster" | "partition" | "spread") or
+        placementGroupName (an existing group), and the root volume:
+        rootVolumeType (gp2 | gp3 | io1 | io2), rootVolumeSize (GiB),
+        rootVolumeIops, rootVolumeThroughput (MiB/s, gp3 only) and
+        rootDeviceName ("/dev/xvda").
+        """
+        cpu_credits = self.preset_context("cpuCredits")
+        if cpu_credits is not None:
+            cpu_credits = str(cpu_credits).lower()
+            if cpu_credits not in ("standard", "unlimited"):
+                raise ValueError(f"cpuCredits must be 'standard' or 'unlimited', got {cpu_credits!r}")
+            if not instance_type.is_burstable():
+                raise ValueError(f"cpuCredits only applies to burstable (T family) instances, not {instance_type_str}")
+            cpu_credits = ec2.CpuCredits.UNLIMITED if cpu_credits == "unlimited" else ec2.CpuCredits.STANDARD
+
+        ebs_optimized = self.preset_context("ebsOptimized")
+        if ebs_optimized is not None:
+            ebs_optimized = context_bool(ebs_optimized)
+
+        placement_strategy = self.preset_context("placementStrategy")
+        placement_group_name = self.node.try_get_context("placementGroupName")
+        if placement_group_name:
+            placement_group = ec2.PlacementGroup.from_placement_group_name(
+                self, "ExistingPlacementGroup", placement_group_name)
+        elif placement_strategy:
+            if placement_strategy not in PLACEMENT_STRATEGIES:
+                raise ValueError(f"placementStrategy must be one of {', '.join(PLACEMENT_STRATEGIES)}, "
+                                 f"got {placement_strategy!r}")
+            placement_group = ec2.PlacementGroup(self, "PlacementGroup",
+                                                 strategy=PLACEMENT_STRATEGIES[placement_strategy])
+        else:
+            placement_group = None
+
+        block_devices = self.root_block_devices()
+        return {
+            "cpu_credits": cpu_credits,
+            "ebs_optimized": ebs_optimized,
+            "placement_group": placement_group,
+            "placement_strategy": None if placement_group_name else placement_strategy,
+            "block_devices": block_devices,
+            "root_throughput": block_devices is not None and self.preset_context("rootVolumeThroughput") is not None,
+        }
+
+    def root_block_devices(self):
+        """
+        Block device mapping for the root volume, or None to keep the AMI's
+        own mapping when no rootVolume* key is set.
+        """
+        keys = ("rootVolumeType", "rootVolumeSize", "rootVolumeIops", "rootVolumeThroughput")
+        if all(self.preset_context(key) is None for key in keys):
+            return None
+
+        volume_type_name = str(self.preset_context("rootVolumeType") or "gp3").lower()
+        if volume_type_name not in VOLUME_TYPES:
+            raise ValueError(f"rootVolumeType must be one of {', '.join(VOLUME_TYPES)}, got {volume_type_name!r}")
+        volume_type, iops_limits = VOLUME_TYPES[volume_type_name]
+        size = context_int(self.preset_context("rootVolumeSize"), "rootVolumeSize", 8)
+        iops = context_int(self.preset_context("rootVolumeIops"), "rootVolumeIops", None)
+        throughput = context_int(self.preset_context("rootVolumeThroughput"), "rootVolumeThroughput", None)
+
+        if size < 1:
+            raise ValueError(f"rootVolumeSize must be at least 1 GiB, got {size}")
+        if iops is not None:
+            if iops_limits is None:
+                raise ValueError(f"rootVolumeIops can't be set for {volume_type_name} volumes")
+            min_iops, max_iops, iops_per_gib = iops_limits
+            if not min_iops <= iops <= max_iops:
+                raise ValueError(f"rootVolumeIops for {volume_type_name} must be between {min_iops} and {max_iops}, "
+                                 f"got {iops}")
+            if iops > size * iops_per_gib and iops > min_iops:
+                raise ValueError(f"rootVolumeIops {iops} exceeds {iops_per_gib} IOPS per GiB "
+                                 f"for a {size} GiB {volume_type_name} volume")
+        elif volume_type_name in ("io1", "io2"):
+            raise ValueError(f"{volume_type_name} volumes need rootVolumeIops")
+        if throughput is not None:
+            if volume_type_name != "gp3":
+                raise ValueError("rootVolumeThroughput can only be set for gp3 volumes")
+            if not GP3_THROUGHPUT[0] <= throughput <= GP3_THROUGHPUT[1]:
+                raise ValueError(f"rootVolumeThroughput must be between {GP3_THROUGHPUT[0]} and "
+                                 f"{GP3_THROUGHPUT[1]} MiB/s, got {throughput}")
+            # gp3 allows at most 0.25 MiB/s per provisioned IOPS
+            if throughput * 4 > (iops or 3000):
+                raise ValueError(f"rootVolumeThroughput {throughput} MiB/s needs at least "
+                                 f"{throughput * 4} rootVolumeIops")
+
+        return [
+            ec2.BlockDevice(
+                device_name=self.node.try_get_context("rootDeviceName") or "/dev/xvda",
+                volume=ec2.BlockDeviceVolume.ebs(
+                    size,
+                    volume_type=volume_type,
+                    iops=iops,
+                    throughput=throughput,
+                    encrypted=True,
+                    delete_on_termination=True
+                )
+            )
+        ]
+
+    def create_fleet(self, vpc, vpc_subnets, sec_group, instance_type, machine_image, key_pair, user_data,
+                     public_ip_enabled, performance):
+        """
+        Launch template + Auto Scaling group + internet-facing ALB on port 80,
+        scaled by target tracking on CPU and on requests per target.
+
+        Context: fleetMinCapacity (2), fleetMaxCapacity (6), fleetDesiredCapacity
+        (min), fleetCpuTarget (50 %), fleetRequestsPerTarget (1000 per minute),
+        healthCheckPath ("/"), healthCheckGracePeriod (300 s).
+
+        The group replaces instances that fail the load balancer's health check
+        only when a userDataFile is set; without one nothing listens on port 80,
+        so it falls back to EC2 status checks.
+        """
+        min_capacity = context_int(self.node.try_get_context("fleetMinCapacity"), "fleetMinCapacity", 2)
+        max_capacity = context_int(self.node.try_get_context("fleetMaxCapacity"), "fleetMaxCapacity", 6)
+        desired_capacity = context_int(self.node.try_get_context("fleetDesiredCapacity"), "fleetDesiredCapacity", None)
+        cpu_target = context_int(self.node.try_get_context("fleetCpuTarget"), "fleetCpuTarget", 50)
+        requests_target = context_int(self.node.try_get_context("fleetRequestsPerTarget"), "fleetRequestsPerTarget", 1000)
+        health_check_path = self.node.try_get_context("healthCheckPath") or "/"
+        grace_period = context_int(self.node.try_get_context("healthCheckGracePeriod"), "healthCheckGracePeriod", 300)
+
+        if not 0 <= min_capacity <= max_capacity or max_capacity < 1:
+            raise ValueError(f"fleet capacity must satisfy 0 <= fleetMinCapacity ({min_capacity}) "
+                             f"<= fleetMaxCapacity ({max_capacity}) and fleetMaxCapacity >= 1")
+        if desired_capacity is not None and not min_capacity <= desired_capacity <= max_capacity:
+            raise ValueError(f"fleetDesiredCapacity ({desired_capacity}) must be between "
+                             f"{min_capacity} and {max_capacity}")
+        if not 1 <= cpu_target <= 100:
+            raise ValueError(f"fleetCpuTarget must be a percentage between 1 and 100, got {cpu_target}")
+        if requests_target < 1:
+            raise ValueError(f"fleetRequestsPerTarget must be positive, got {requests_target}")
+
+        # Same SSM access as the single instance gets from ssm_session_permissions
+        role = iam.Role(
+            self, "FleetInstanceRole",
+            assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"),
+            managed_policies=[iam.ManagedPolicy.from_aws_managed_policy_name("AmazonSSMManagedInstanceCore")]
+        )
+
+        launch_template = ec2.LaunchTemplate(
+            self, "FleetLaunchTemplate",
+            instance_type=instance_type,
+            machine_image=machine_image,
+            security_group=sec_group,
+            key_pair=key_pair,
+            role=role,
+            user_data=user_data,
+            associate_public_ip_address=public_ip_enabled,
+            require_imdsv2=True,
+            block_devices=performance["block_devices"],
+            ebs_optimized=performance["ebs_optimized"],
+            cpu_credits=performance["cpu_credits"]
+        )
+
+        if self.node.try_get_context("userDataFile"):
+            health_check = autoscaling.HealthCheck.elb(grace=Duration.seconds(grace_period))
+        else:
+            # ELB health checks would fail on every instance and keep the group replacing them
+            Annotations.of(self).add_warning(
+                "fleetMode without a userDataFile: nothing serves port 80, so every load balancer target is "
+                "unhealthy; the Auto Scaling group uses EC2 health checks instead")
+            health_check = autoscaling.HealthCheck.ec2(grace=Duration.seconds(grace_period))
+
+        asg = autoscaling.AutoScalingGroup(
+            self, "FleetAutoScalingGroup",
+            vpc=vpc,
+            vpc_subnets=vpc_subnets,
+            launch_template=launch_template,
+            min_capacity=min_capacity,
+            max_capacity=max_capacity,
+            desired_capacity=desired_capacity,
+            health_check=health_check
+        )
+        if performance["placement_group"]:
+            # Launch templates have no placement group prop; the group goes on the ASG itself
+            asg.node.default_child.placement_group = performance["placement_group"].placement_group_name
+            if performance["placement_strategy"] == "cluster":
+                Annotations.of(self).add_warning("a cluster placement group is confined to one Availability Zone; "
+                                                 "fleet instances in other zones will fail to launch")
+
+        alb = elbv2.ApplicationLoadBalancer(
+            self, "FleetLoadBalancer",
+            vpc=vpc,
+            internet_facing=True,
+            vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC)
+        )
+        listener = alb.add_listener("HttpListener", port=80, open=True)
+        listener.add_targets(
+            "Fleet",
+            port=80,
+            targets=[asg],
+            health_check=elbv2.HealthCheck(
+                path=health_check_path,
+                healthy_http_codes="200-399",
+                interval=Duration.seconds(15),
+                healthy_threshold_count=2,
+                unhealthy_threshold_count=3
+            ),
+            deregistration_delay=Duration.seconds(30)
+        )
+
+        asg.scale_on_cpu_utilization("CpuTargetTracking", target_utilization_percent=cpu_target)
+        asg.scale_on_request_count("RequestCountTargetTracking", target_requests_per_minute=requests_target)
+
+        CfnOutput(self, "LoadBalancerDNS", value=alb.load_balancer_dns_name)
+        CfnOutput(self, "AutoScalingGroupName", value=asg.auto_scaling_group_name)
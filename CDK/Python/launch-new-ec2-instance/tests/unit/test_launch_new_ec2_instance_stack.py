@@ -1,15 +1,240 @@
+import pytest
+
 import aws_cdk as core
 import aws_cdk.assertions as assertions
 
 from launch_new_ec2_instance.launch_new_ec2_instance_stack import LaunchNewEc2InstanceStack
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in launch_new_ec2_instance/launch_new_ec2_instance_stack.py
-def test_sqs_queue_created():
-    app = core.App()
-    stack = LaunchNewEc2InstanceStack(app, "launch-new-ec2-instance")
+# Vpc.from_lookup needs an explicit account/region; without a cached lookup
+# CDK synthesizes a dummy VPC with public and private subnets in two AZs.
+TEST_ENV = core.Environment(account="123456789012", region="us-east-1")
+
+
+# The shipped user data, which starts httpd on port 80
+USER_DATA = {"userDataFile": "user_data.sh"}
+
+
+def synth(context=None, with_stack=False):
+    app = core.App(context=context or {})
+    stack = LaunchNewEc2InstanceStack(app, "launch-new-ec2-instance", env=TEST_ENV)
     template = assertions.Template.from_stack(stack)
+    return (template, stack) if with_stack else template
+
+
+def test_single_instance_by_default():
+    template = synth()
+
+    template.resource_count_is("AWS::EC2::Instance", 1)
+    template.resource_count_is("AWS::AutoScaling::AutoScalingGroup", 0)
+    template.resource_count_is("AWS::ElasticLoadBalancingV2::LoadBalancer", 0)
+
+
+def test_fleet_mode_creates_launch_template_asg_and_alb():
+    template = synth(dict(USER_DATA, fleetMode=True))
+
+    template.resource_count_is("AWS::EC2::Instance", 0)
+    template.resource_count_is("AWS::EC2::LaunchTemplate", 1)
+    template.has_resource_properties("AWS::AutoScaling::AutoScalingGroup", {
+        "MinSize": "2",
+        "MaxSize": "6",
+        "HealthCheckType": "ELB",
+        "HealthCheckGracePeriod": 300,
+        "LaunchTemplate": assertions.Match.object_like({
+            "LaunchTemplateId": assertions.Match.any_value(),
+        }),
+    })
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::LoadBalancer", {
+        "Scheme": "internet-facing",
+        "Type": "application",
+    })
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::Listener", {
+        "Port": 80,
+        "Protocol": "HTTP",
+    })
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::TargetGroup", {
+        "Port": 80,
+        "HealthCheckPath": "/",
+        "TargetType": "instance",
+    })
+    template.has_output("LoadBalancerDNS", {})
+
+
+def test_fleet_mode_without_user_data_uses_ec2_health_checks():
+    template, stack = synth({"fleetMode": True}, with_stack=True)
+
+    template.has_resource_properties("AWS::AutoScaling::AutoScalingGroup", {
+        "HealthCheckType": "EC2",
+        "HealthCheckGracePeriod": 300,
+    })
+    warnings = assertions.Annotations.from_stack(stack).find_warning(
+        "*", assertions.Match.string_like_regexp("without a userDataFile"))
+    assert len(warnings) == 1
+
+
+def test_fleet_mode_target_tracking_on_cpu_and_request_count():
+    template = synth({"fleetMode": True})
+
+    template.resource_count_is("AWS::AutoScaling::ScalingPolicy", 2)
+    template.has_resource_properties("AWS::AutoScaling::ScalingPolicy", {
+        "PolicyType": "TargetTrackingScaling",
+        "TargetTrackingConfiguration": {
+            "PredefinedMetricSpecification": {"PredefinedMetricType": "ASGAverageCPUUtilization"},
+            "TargetValue": 50,
+        },
+    })
+    template.has_resource_properties("AWS::AutoScaling::ScalingPolicy", {
+        "PolicyType": "TargetTrackingScaling",
+        "TargetTrackingConfiguration": {
+            "PredefinedMetricSpecification": assertions.Match.object_like({
+                "PredefinedMetricType": "ALBRequestCountPerTarget",
+            }),
+            "TargetValue": 1000,
+        },
+    })
+
+
+def test_fleet_mode_reads_cli_context_strings():
+    template = synth({
+        "fleetMode": "true",
+        "fleetMinCapacity": "3",
+        "fleetMaxCapacity": "10",
+        "fleetDesiredCapacity": "4",
+        "fleetCpuTarget": "60",
+        "fleetRequestsPerTarget": "500",
+        "healthCheckPath": "/health",
+    })
+
+    template.has_resource_properties("AWS::AutoScaling::AutoScalingGroup", {
+        "MinSize": "3",
+        "MaxSize": "10",
+        "DesiredCapacity": "4",
+    })
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::TargetGroup", {
+        "HealthCheckPath": "/health",
+    })
+    template.has_resource_properties("AWS::AutoScaling::ScalingPolicy", {
+        "TargetTrackingConfiguration": assertions.Match.object_like({"TargetValue": 60}),
+    })
+
+
+def test_fleet_mode_false_string_keeps_single_instance():
+    template = synth({"fleetMode": "false"})
+
+    template.resource_count_is("AWS::EC2::Instance", 1)
+
+
+@pytest.mark.parametrize("context", [
+    {"fleetMinCapacity": 5, "fleetMaxCapacity": 2},
+    {"fleetDesiredCapacity": 9},
+    {"fleetCpuTarget": 150},
+    {"fleetMaxCapacity": "many"},
+])
+def test_fleet_mode_rejects_invalid_sizes(context):
+    with pytest.raises(ValueError):
+        synth(dict(context, fleetMode=True))
+
+
+def test_default_instance_keeps_ami_block_devices_and_credits():
+    template = synth()
+
+    template.has_resource_properties("AWS::EC2::Instance", {
+        "InstanceType": "t2.micro",
+        "BlockDeviceMappings": assertions.Match.absent(),
+        "CreditSpecification": assertions.Match.absent(),
+    })
+    template.resource_count_is("AWS::EC2::PlacementGroup", 0)
+
+
+def test_web_preset_uses_graviton_image_and_unlimited_credits():
+    template = synth({"performancePreset": "web"})
+
+    template.has_resource_properties("AWS::EC2::Instance", {
+        "InstanceType": "t4g.medium",
+        "CreditSpecification": {"CPUCredits": "unlimited"},
+        "BlockDeviceMappings": [{
+            "DeviceName": "/dev/xvda",
+            "Ebs": assertions.Match.object_like({"VolumeType": "gp3", "VolumeSize": 20, "Encrypted": True}),
+        }],
+    })
+    # The AMI parameter for Graviton types is the arm64 image
+    parameters = template.find_parameters("*")
+    assert any("arm64" in name for name in parameters)
+
+
+def test_io_heavy_preset_provisions_io2_root_spread_group_and_nvme_mount():
+    template = synth({"performancePreset": "io-heavy"})
+
+    template.has_resource_properties("AWS::EC2::PlacementGroup", {"Strategy": "spread"})
+    template.has_resource_properties("AWS::EC2::Instance", {
+        "InstanceType": "i4i.xlarge",
+        "EbsOptimized": True,
+        "PlacementGroupName": assertions.Match.any_value(),
+        "BlockDeviceMappings": [{
+            "DeviceName": "/dev/xvda",
+            "Ebs": assertions.Match.object_like({"VolumeType": "io2", "VolumeSize": 100, "Iops": 16000}),
+        }],
+        "UserData": {"Fn::Base64": assertions.Match.string_like_regexp("mount -o noatime .* /mnt/nvme")},
+    })
+
+
+def test_compute_preset_in_fleet_mode_configures_launch_template_and_asg_placement():
+    template = synth({"performancePreset": "compute", "fleetMode": True})
+
+    template.has_resource_properties("AWS::EC2::PlacementGroup", {"Strategy": "cluster"})
+    template.has_resource_properties("AWS::EC2::LaunchTemplate", {
+        "LaunchTemplateData": assertions.Match.object_like({
+            "InstanceType": "c7g.2xlarge",
+            "EbsOptimized": True,
+            "BlockDeviceMappings": [{
+                "DeviceName": "/dev/xvda",
+                "Ebs": assertions.Match.object_like({"VolumeType": "gp3", "Iops": 6000, "Throughput": 250}),
+            }],
+        }),
+    })
+    template.has_resource_properties("AWS::AutoScaling::AutoScalingGroup", {
+        "PlacementGroup": assertions.Match.any_value(),
+    })
+
+
+def test_explicit_context_overrides_preset():
+    template = synth({
+        "performancePreset": "compute",
+        "instanceType": "c7i.large",
+        "rootVolumeIops": "4000",
+        "rootVolumeThroughput": "200",
+        "placementGroupName": "existing-group",
+    })
+
+    template.resource_count_is("AWS::EC2::PlacementGroup", 0)
+    template.has_resource_properties("AWS::EC2::Instance", {
+        "InstanceType": "c7i.large",
+        "PlacementGroupName": "existing-group",
+        "LaunchTemplate": assertions.Match.object_like({"LaunchTemplateId": assertions.Match.any_value()}),
+    })
+    # Instance mappings can't carry gp3 throughput, so the root volume comes from a launch template
+    template.has_resource_properties("AWS::EC2::LaunchTemplate", {
+        "LaunchTemplateData": {
+            "BlockDeviceMappings": [{
+                "DeviceName": "/dev/xvda",
+                "Ebs": assertions.Match.object_like({"Iops": 4000, "Throughput": 200}),
+            }],
+        },
+    })
+
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+@pytest.mark.parametrize("context", [
+    {"performancePreset": "turbo"},
+    {"instanceType": "c7g.large", "cpuCredits": "unlimited"},
+    {"cpuCredits": "infinite"},
+    {"placementStrategy": "nearby"},
+    {"rootVolumeType": "st1"},
+    {"rootVolumeType": "gp3", "rootVolumeIops": 20000},
+    {"rootVolumeType": "gp2", "rootVolumeIops": 3000},
+    {"rootVolumeType": "io2", "rootVolumeSize": 10},
+    {"rootVolumeType": "io2", "rootVolumeSize": 10, "rootVolumeIops": 20000},
+    {"rootVolumeType": "io2", "rootVolumeIops": 3000, "rootVolumeThroughput": 250},
+    {"rootVolumeThroughput": 1000},
+])
+def test_rejects_invalid_performance_options(context):
+    with pytest.raises(ValueError):
+        synth(context)
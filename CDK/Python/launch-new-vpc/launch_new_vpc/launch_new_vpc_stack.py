@@ -1,40 +1,121 @@
 from aws_cdk import (
+    Annotations,
     CfnOutput,
     Stack,
     aws_ec2 as ec2,
 )
 from constructs import Construct
 
+PRIVATE_SUBNET_TYPES = {
+    "isolated": ec2.SubnetType.PRIVATE_ISOLATED,
+    "egress": ec2.SubnetType.PRIVATE_WITH_EGRESS,
+}
+
+# Gateway endpoints are free and add a route to every subnet's route table
+GATEWAY_ENDPOINTS = {
+    "s3": ec2.GatewayVpcEndpointAwsService.S3,
+    "dynamodb": ec2.GatewayVpcEndpointAwsService.DYNAMODB,
+}
+
+# Interface endpoints are billed per AZ per hour, so none are created by default
+INTERFACE_ENDPOINTS = {
+    "ssm": ec2.InterfaceVpcEndpointAwsService.SSM,
+    "ssmmessages": ec2.InterfaceVpcEndpointAwsService.SSM_MESSAGES,
+    "ec2messages": ec2.InterfaceVpcEndpointAwsService.EC2_MESSAGES,
+    "ecr.api": ec2.InterfaceVpcEndpointAwsService.ECR,
+    "ecr.dkr": ec2.InterfaceVpcEndpointAwsService.ECR_DOCKER,
+    "logs": ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_LOGS,
+    "monitoring": ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_MONITORING,
+    "sts": ec2.InterfaceVpcEndpointAwsService.STS,
+}
+
+
+def context_bool(value, default=False):
+    """
+    Context values passed with `cdk -c key=value` arrive as strings, so
+    "false" and "0" have to be read as False.
+    """
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "yes", "1")
+    return bool(value)
+
+
+def context_list(value, default):
+    """
+    A list from context: either a JSON list (cdk.json) or a comma-separated
+    string (-c key=a,b). An empty string means an empty list.
+    """
+    if value is None:
+        return list(default)
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return list(value)
+
+
 class LaunchNewVpcStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
-        
+
         # Retrieve configuration from context, falling back to defaults if not provided.
         vpc_id = self.node.try_get_context("vpcId") or "LaunchNewVpcStack"
 
         vpc_cidr = self.node.try_get_context("vpcCidr") or "10.10.0.0/16"
         max_azs = int(self.node.try_get_context("maxAzs") or 2)
-        num_nat_gateways = int(self.node.try_get_context("numNatGateways") or 1)
+        # None when not set, so an explicit 0 can still be rejected for egress subnets
+        num_nat_gateways = self.node.try_get_context("numNatGateways")
+        if num_nat_gateways is not None:
+            num_nat_gateways = int(num_nat_gateways)
 
         public_cidr_mask = int(self.node.try_get_context("publicCidrMask") or 24)
         private_cidr_mask = int(self.node.try_get_context("privateCidrMask") or 24)
-        
-        map_public_ip = self.node.try_get_context("mapPublicIp")
-        if map_public_ip is None:
-            map_public_ip = False
 
-        create_internet_gateway = self.node.try_get_context("createInternetGateway")
-        if create_internet_gateway is None:
-            create_internet_gateway = False  
+        map_public_ip = context_bool(self.node.try_get_context("mapPublicIp"))
+
+        create_internet_gateway = context_bool(self.node.try_get_context("createInternetGateway"))
+
+        dns_hostnames = context_bool(self.node.try_get_context("dnsHostnames"))
+
+        dns_support = context_bool(self.node.try_get_context("dnsSupport"))
 
-        dns_hostnames = self.node.try_get_context("dnsHostnames")
-        if dns_hostnames is None:
-            dns_hostnames = False  
+        # "isolated" private subnets have no route out of the VPC; "egress" ones
+        # route through NAT gateways in the public subnets
+        private_subnet_type = self.node.try_get_context("privateSubnetType") or "isolated"
+        if private_subnet_type not in PRIVATE_SUBNET_TYPES:
+            raise ValueError(f"privateSubnetType must be one of {', '.join(PRIVATE_SUBNET_TYPES)}, "
+                             f"got {private_subnet_type!r}")
+        nat_per_az = context_bool(self.node.try_get_context("natPerAz"))
 
-        dns_support = self.node.try_get_context("dnsSupport")
-        if dns_support is None:
-            dns_support = False 
+        if private_subnet_type == "isolated":
+            # Nothing would route through a NAT gateway, so don't pay for one
+            if num_nat_gateways or nat_per_az:
+                Annotations.of(self).add_warning(
+                    "numNatGateways/natPerAz are ignored with isolated private subnets; "
+                    "use -c privateSubnetType=egress for NAT egress")
+            nat_gateways = 0
+        elif nat_per_az:
+            # One NAT per AZ keeps egress inside each AZ and survives an AZ outage
+            nat_gateways = max_azs
+        else:
+            # Unset means the single shared NAT gateway
+            nat_gateways = 1 if num_nat_gateways is None else num_nat_gateways
+            if not 1 <= nat_gateways <= max_azs:
+                raise ValueError(f"numNatGateways must be between 1 and maxAzs ({max_azs}) for egress subnets, "
+                                 f"got {nat_gateways}")
+
+        gateway_endpoints = context_list(self.node.try_get_context("gatewayEndpoints"), GATEWAY_ENDPOINTS)
+        interface_endpoints = context_list(self.node.try_get_context("interfaceEndpoints"), [])
+        for name, services, known in (("gatewayEndpoints", gateway_endpoints, GATEWAY_ENDPOINTS),
+                                      ("interfaceEndpoints", interface_endpoints, INTERFACE_ENDPOINTS)):
+            unknown = [service for service in services if service not in known]
+            if unknown:
+                raise ValueError(f"unknown {name} {', '.join(unknown)}; expected any of {', '.join(known)}")
+        if interface_endpoints and not (dns_support and dns_hostnames):
+            # Private DNS resolves the public service names to the endpoint ENIs,
+            # which only works with both VPC DNS attributes turned on
+            raise ValueError("interfaceEndpoints need private DNS: set dnsSupport and dnsHostnames to true")
 
         self.vpc = ec2.Vpc(self, vpc_id,
                            max_azs=max_azs,
@@ -47,16 +128,31 @@ class LaunchNewVpcStack(Stack):
                                    map_public_ip_on_launch=map_public_ip
                                ),
                                ec2.SubnetConfiguration(
-                                   subnet_type=ec2.SubnetType.PRIVATE_ISOLATED,
+                                   subnet_type=PRIVATE_SUBNET_TYPES[private_subnet_type],
                                    name="Private",
                                    cidr_mask=private_cidr_mask
                                )
                            ],
                            enable_dns_support=dns_support,
                            enable_dns_hostnames=dns_hostnames,
-                           nat_gateways=num_nat_gateways,
+                           nat_gateways=nat_gateways,
                            )
 
-        CfnOutput(self, "VPCIdOutput", value=self.vpc.vpc_id)
+        # Keep S3/DynamoDB and AWS API traffic on the VPC instead of sending it
+        # through NAT, where it adds latency and per-GB processing charges
+        for service in gateway_endpoints:
+            self.vpc.add_gateway_endpoint(
+                f"{service.capitalize()}GatewayEndpoint",
+                service=GATEWAY_ENDPOINTS[service]
+            )
 
+        private_subnets = ec2.SubnetSelection(subnet_type=PRIVATE_SUBNET_TYPES[private_subnet_type])
+        for service in interface_endpoints:
+            self.vpc.add_interface_endpoint(
+                "".join(part.capitalize() for part in service.split(".")) + "Endpoint",
+                service=INTERFACE_ENDPOINTS[service],
+                subnets=private_subnets,
+                private_dns_enabled=True
+            )
 
+        CfnOutput(self, "VPCIdOutput", value=self.vpc.vpc_id)
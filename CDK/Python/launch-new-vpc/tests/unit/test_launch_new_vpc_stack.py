@@ -1,15 +1,116 @@
+import json
+import os
+
+import pytest
+
 import aws_cdk as core
 import aws_cdk.assertions as assertions
 
 from launch_new_vpc.launch_new_vpc_stack import LaunchNewVpcStack
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in launch_new_vpc/launch_new_vpc_stack.py
-def test_sqs_queue_created():
-    app = core.App()
-    stack = LaunchNewVpcStack(app, "launch-new-vpc")
+# A fixed environment gives the stack a known set of availability zones
+TEST_ENV = core.Environment(account="123456789012", region="us-east-1")
+
+ENDPOINT_DNS = {"dnsSupport": True, "dnsHostnames": True}
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def project_context(**overrides):
+    """
+    The context shipped in cdk.json, with `overrides` as if passed with -c.
+    """
+    with open(os.path.join(PROJECT_DIR, "cdk.json")) as f:
+        context = json.load(f)["context"]
+    context.update(overrides)
+    return context
+
+
+def synth(context=None, with_stack=False):
+    app = core.App(context=context or {})
+    stack = LaunchNewVpcStack(app, "launch-new-vpc", env=TEST_ENV)
     template = assertions.Template.from_stack(stack)
+    return (template, stack) if with_stack else template
+
+
+def test_project_context_synthesizes_without_warnings():
+    template, stack = synth(project_context(), with_stack=True)
+
+    template.resource_count_is("AWS::EC2::NatGateway", 0)
+    assert assertions.Annotations.from_stack(stack).find_warning("*", assertions.Match.any_value()) == []
+
+
+def test_project_context_with_egress_subnets():
+    template = synth(project_context(privateSubnetType="egress", interfaceEndpoints="ssm,sts"))
+
+    template.resource_count_is("AWS::EC2::NatGateway", 1)
+    template.resource_count_is("AWS::EC2::VPCEndpoint", 4)
+
+
+def test_isolated_private_subnets_have_no_nat():
+    template = synth()
+
+    template.resource_count_is("AWS::EC2::Subnet", 4)
+    template.resource_count_is("AWS::EC2::NatGateway", 0)
+    template.resource_count_is("AWS::EC2::Route", 2)
+
+
+def test_gateway_endpoints_for_s3_and_dynamodb_by_default():
+    template = synth()
+
+    template.resource_count_is("AWS::EC2::VPCEndpoint", 2)
+    for service in ("s3", "dynamodb"):
+        template.has_resource_properties("AWS::EC2::VPCEndpoint", {
+            "VpcEndpointType": "Gateway",
+            "ServiceName": {"Fn::Join": ["", ["com.amazonaws.", {"Ref": "AWS::Region"}, f".{service}"]]},
+        })
+
+
+def test_gateway_endpoints_can_be_disabled():
+    template = synth({"gatewayEndpoints": ""})
+
+    template.resource_count_is("AWS::EC2::VPCEndpoint", 0)
+
+
+def test_egress_subnets_use_a_single_nat_by_default():
+    template = synth({"privateSubnetType": "egress"})
+
+    template.resource_count_is("AWS::EC2::NatGateway", 1)
+    template.has_resource_properties("AWS::EC2::Route", {
+        "DestinationCidrBlock": "0.0.0.0/0",
+        "NatGatewayId": assertions.Match.any_value(),
+    })
+
+
+def test_egress_subnets_with_nat_per_az():
+    template = synth({"privateSubnetType": "egress", "natPerAz": "true", "maxAzs": 3})
+
+    template.resource_count_is("AWS::EC2::NatGateway", 3)
+
+
+def test_interface_endpoints_use_private_dns_in_private_subnets():
+    template = synth(dict(ENDPOINT_DNS, interfaceEndpoints="ssm,ecr.api,ecr.dkr,logs,monitoring,sts"))
+
+    template.resource_count_is("AWS::EC2::VPCEndpoint", 8)
+    template.has_resource_properties("AWS::EC2::VPCEndpoint", {
+        "VpcEndpointType": "Interface",
+        "ServiceName": "com.amazonaws.us-east-1.ecr.dkr",
+        "PrivateDnsEnabled": True,
+        "SubnetIds": assertions.Match.array_with([{"Ref": assertions.Match.string_like_regexp("Private")}]),
+    })
+    template.has_resource_properties("AWS::EC2::SecurityGroup", {
+        "SecurityGroupIngress": [assertions.Match.object_like({"FromPort": 443, "ToPort": 443})],
+    })
+
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+@pytest.mark.parametrize("context", [
+    {"privateSubnetType": "public"},
+    {"privateSubnetType": "egress", "numNatGateways": 5},
+    {"privateSubnetType": "egress", "numNatGateways": "0"},
+    {"gatewayEndpoints": "s3,efs"},
+    dict(ENDPOINT_DNS, interfaceEndpoints=["ssm", "lambda"]),
+    {"interfaceEndpoints": "ssm"},
+])
+def test_rejects_invalid_options(context):
+    with pytest.raises(ValueError):
+        synth(context)
@@ -1,4 +1,3 @@
-CDK/PYTHON
 # import the necessary classes
 import aws_cdk as cdk
 from aws_cdk import (
@@ -7,6 +6,38 @@ from aws_cdk import (
     CfnOutput
 )
 
+# Performance presets, selected with -c performancePreset=<name>. Context
+# values given explicitly (e.g. -c instanceType=c7i.large) override them.
+PERFORMANCE_PRESETS = {
+    "web": {"instanceType": "t4g.medium", "cpuCredits": "unlimited", "volumeType": "gp3", "volumeSize": 20},
+    "io-heavy": {"instanceType": "i4i.xlarge", "ebsOptimized": True, "placementStrategy": "spread",
+                 "volumeType": "io2", "volumeSize": 100, "volumeIops": 16000},
+    "compute": {"instanceType": "c7g.2xlarge", "ebsOptimized": True, "placementStrategy": "cluster",
+                "volumeType": "gp3", "volumeSize": 30, "volumeIops": 6000, "volumeThroughput": 250},
+}
+
+# Volume type -> (min IOPS, max IOPS, max IOPS per GiB)
+VOLUME_IOPS_LIMITS = {"gp3": (3000, 16000, 500), "io1": (100, 64000, 50), "io2": (100, 256000, 1000)}
+
+
+def validate_volume(volume_type, size, iops, throughput):
+    if volume_type not in ("gp2", "gp3", "io1", "io2"):
+        raise ValueError(f"volumeType must be gp2, gp3, io1 or io2, got {volume_type!r}")
+    limits = VOLUME_IOPS_LIMITS.get(volume_type)
+    if iops is not None:
+        if limits is None:
+            raise ValueError(f"volumeIops can't be set for {volume_type} volumes")
+        if not limits[0] <= iops <= limits[1] or (iops > limits[0] and iops > size * limits[2]):
+            raise ValueError(f"volumeIops {iops} is out of range for a {size} GiB {volume_type} volume")
+    elif volume_type in ("io1", "io2"):
+        raise ValueError(f"{volume_type} volumes need volumeIops")
+    if throughput is not None:
+        if volume_type != "gp3":
+            raise ValueError("volumeThroughput can only be set for gp3 volumes")
+        if not 125 <= throughput <= 1000 or throughput * 4 > (iops or 3000):
+            raise ValueError(f"volumeThroughput {throughput} MiB/s is out of range (125-1000, at most IOPS / 4)")
+
+
 # class/function/main code definition 
 class EC2InstanceStack(cdk.Stack):
     def __init__(self, scope: cdk.App, id: str, **kwargs):
@@ -14,48 +45,84 @@ class EC2InstanceStack(cdk.Stack):
 
         # Define constants from CLI commands
         AMI_ID = "ami-0c7af5fe939f2677f"
-        INSTANCE_TYPE = "t2.micro"
         KEY_NAME = ""
         USER_DATA = "PLEASE ADD YOUR DATA BACK IN HERE"
         VOLUME_SNAPSHOT_ID = "snap-0d00c5462139042b8"
-        VOLUME_SIZE = 10
-        VOLUME_TYPE = "gp3"
-        VOLUME_IOPS = 3000
-        VOLUME_THROUGHPUT = 125
         SUBNET_ID = ""
         SECURITY_GROUP_ID = ""
-        CPU_CREDITS = "standard"
         INSTANCE_NAME = ""
         ENVIRONMENT = ""
         INSTANCE_PROFILE_ARN = ""
 
+        # Compute and storage settings: context, then the preset, then the old defaults
+        preset_name = self.node.try_get_context("performancePreset")
+        if preset_name and preset_name not in PERFORMANCE_PRESETS:
+            raise ValueError(f"unknown performancePreset '{preset_name}', "
+                             f"expected one of: {', '.join(PERFORMANCE_PRESETS)}")
+        preset = PERFORMANCE_PRESETS.get(preset_name, {})
+
+        def setting(key, default=None):
+            value = self.node.try_get_context(key)
+            return preset.get(key, default) if value is None else value
+
+        INSTANCE_TYPE = setting("instanceType", "t2.micro")
+        CPU_CREDITS = str(setting("cpuCredits", "standard")).lower()
+        EBS_OPTIMIZED = str(setting("ebsOptimized", False)).lower() in ("true", "1", "yes")
+        PLACEMENT_STRATEGY = setting("placementStrategy")
+        VOLUME_TYPE = str(setting("volumeType", "gp3")).lower()
+        VOLUME_SIZE = int(setting("volumeSize", 10))
+        VOLUME_IOPS = setting("volumeIops", 3000 if VOLUME_TYPE == "gp3" else None)
+        VOLUME_IOPS = None if VOLUME_IOPS is None else int(VOLUME_IOPS)
+        VOLUME_THROUGHPUT = setting("volumeThroughput")
+        VOLUME_THROUGHPUT = None if VOLUME_THROUGHPUT is None else int(VOLUME_THROUGHPUT)
+
+        instance_type = ec2.InstanceType(INSTANCE_TYPE)
+        if CPU_CREDITS not in ("standard", "unlimited"):
+            raise ValueError(f"cpuCredits must be 'standard' or 'unlimited', got {CPU_CREDITS!r}")
+        if PLACEMENT_STRATEGY not in (None, "cluster", "partition", "spread"):
+            raise ValueError(f"placementStrategy must be cluster, partition or spread, got {PLACEMENT_STRATEGY!r}")
+        validate_volume(VOLUME_TYPE, VOLUME_SIZE, VOLUME_IOPS, VOLUME_THROUGHPUT)
+
+        # Graviton types need an arm64 build of the image
+        arm64 = instance_type.architecture == ec2.InstanceArchitecture.ARM_64
+        root_volume = [
+            ec2.BlockDevice(
+                device_name="/dev/sda1",
+                volume=ec2.BlockDeviceVolume.ebs_from_snapshot(
+                    VOLUME_SNAPSHOT_ID,
+                    volume_type=ec2.EbsDeviceVolumeType(VOLUME_TYPE.upper()),
+                    iops=VOLUME_IOPS,
+                    throughput=VOLUME_THROUGHPUT,
+                    volume_size=VOLUME_SIZE,
+                    delete_on_termination=True
+                )
+            )
+        ]
+        # AWS::EC2::Instance can't set gp3 throughput, a launch template can
+        volume_template = None
+        if VOLUME_THROUGHPUT is not None:
+            volume_template = ec2.LaunchTemplate(self, "RootVolumeLaunchTemplate", block_devices=root_volume)
+
         # Create EC2 Instance
         instance = ec2.Instance(
             self, "EC2Instance",
-            instance_type=ec2.InstanceType(INSTANCE_TYPE),
+            instance_type=instance_type,
             machine_image=ec2.MachineImage.lookup(
                 name=AMI_ID,
-                owners=["self"]
+                owners=["self"],
+                filters={"architecture": ["arm64" if arm64 else "x86_64"]}
             ),
             key_name=KEY_NAME,
             user_data=ec2.UserData(USER_DATA),
-            block_devices=[
-                ec2.BlockDevice(
-                    device_name="/dev/sda1",
-                    volume=ec2.BlockDeviceVolume.ebs(
-                        snapshot_id=VOLUME_SNAPSHOT_ID,
-                        volume_type=ec2.EbsDeviceVolumeType.GP3,
-                        iops=VOLUME_IOPS,
-                        throughput=VOLUME_THROUGHPUT,
-                        volume_size=VOLUME_SIZE,
-                        encrypted=False,
-                        delete_on_termination=True
-                    )
-                )
-            ],
+            block_devices=None if volume_template else root_volume,
+            ebs_optimized=EBS_OPTIMIZED or None,
+            placement_group=ec2.PlacementGroup(
+                self, "PlacementGroup", strategy=ec2.PlacementGroupStrategy(PLACEMENT_STRATEGY.upper())
+            ) if PLACEMENT_STRATEGY else None,
             vpc_subnets=ec2.SubnetSelection(subnet_ids=[SUBNET_ID]),
             security_group=ec2.SecurityGroup.from_security_group_id(self, "SecurityGroup", SECURITY_GROUP_ID),
-            credit_specification=ec2.CreditSpecification.STANDARD,
+            # CPU credits only apply to burstable (T family) types
+            credit_specification=ec2.CpuCredits(CPU_CREDITS.upper()) if instance_type.is_burstable() else None,
             instance_name=INSTANCE_NAME,
             instance_profile=iam.InstanceProfile.from_instance_profile_arn(self, "InstanceProfile", INSTANCE_PROFILE_ARN),
             metadata_options=ec2.InstanceMetadataOptions(
@@ -70,6 +137,12 @@ class EC2InstanceStack(cdk.Stack):
             )
         )
 
+        if volume_template:
+            instance.instance.launch_template = ec2.CfnInstance.LaunchTemplateSpecificationProperty(
+                launch_template_id=volume_template.launch_template_id,
+                version=volume_template.latest_version_number
+            )
+
         # Add tags to the instance
         cdk.Tags.of(instance).add("Environment", ENVIRONMENT)
 
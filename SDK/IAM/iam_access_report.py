@@ -0,0 +1,872 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Shared pipeline behind the service-level and action-level IAM access reports.
+
+Each policy gets a single ACTION_LEVEL last accessed job. Its response already
+carries each service's LastAuthenticated time next to the tracked actions, so
+the service-level view, the action-level view, or both are produced from the
+same job. With --cloudtrail the rows are built from CloudTrail log files
+instead, without any jobs (see iam_cloudtrail).
+"""
+import argparse
+import os
+from datetime import datetime
+
+from iam_last_accessed_jobs import DEFAULT_MAX_WORKERS, run_last_accessed_jobs
+from iam_rate_governor import (
+    DEFAULT_ACCOUNT_RATE,
+    RateGovernor,
+    governed_client,
+    iam_client_config,
+    parse_api_rates,
+)
+from iam_authorization_graph import load_authorization_graph
+from iam_result_cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL_HOURS, ResultCache
+from iam_user_policies import build_user_policy_map, distinct_policy_arns, read_users_file
+from iam_report_model import (  # noqa: F401 - parsers are re-exported for existing callers
+    JOB_GRANULARITY,
+    LEVELS,
+    PARSERS,
+    ReportInputs,
+    iter_report_rows,
+    parse_action_level_details,
+    parse_service_level_details,
+)
+from iam_report_writers import WRITERS, export_rows, open_writer, output_path, write_rows
+from iam_principal_attribution import iter_principal_report_rows, principal_version
+from iam_org_fanout import (
+    DEFAULT_ACCOUNT_WORKERS,
+    DEFAULT_ROLE_ARN_TEMPLATE,
+    DEFAULT_SESSION_NAME,
+    iter_organization_rows,
+    list_organization_accounts,
+    read_accounts_file,
+)
+from iam_checkpoint import CheckpointError, CheckpointJournal, write_checkpointed_rows
+from iam_metrics import RunMetrics, TimedWriter, instrument_client, profile_run, timed_stage, write_metrics
+from iam_delta import DEFAULT_MAX_AGE_HOURS, SnapshotResults, iter_delta_rows, load_snapshot, save_snapshot, summarize_delta
+from iam_history_store import HistoryStore, default_history_path, service_namespaces
+from iam_report_summary import DEFAULT_STALE_DAYS, SummaryWriter
+from iam_cloudtrail import DEFAULT_CLOUDTRAIL_WORKERS, default_index_path, iter_cloudtrail_permissions_rows
+
+
+def generate_service_level_report(iam_client, policy_arn):
+    """
+    For a single managed policy, run a last accessed job and return the rows
+    described in parse_service_level_details.
+    """
+    [(_, job_details)] = run_last_accessed_jobs(iam_client, [policy_arn], JOB_GRANULARITY)
+    return parse_service_level_details(policy_arn, job_details)
+
+
+def generate_action_level_report(iam_client, policy_arn):
+    """
+    For a single managed policy, run a last accessed job and return the rows
+    described in parse_action_level_details.
+    """
+    [(_, job_details)] = run_last_accessed_jobs(iam_client, [policy_arn], JOB_GRANULARITY)
+    return parse_action_level_details(policy_arn, job_details)
+
+
+JOB_MODES = ('policy', 'principal')
+
+
+def governed_iam_client(governor=None, session=None, max_workers=DEFAULT_MAX_WORKERS, metrics=None):
+    """
+    Create an IAM client from `session` (the default credentials when None)
+    whose calls go through `governor` (a default RateGovernor when None) and
+    are recorded in `metrics` when given. The HTTP connection pool is sized
+    so every job worker keeps a connection.
+    """
+    if session is None:
+        import boto3
+        session = boto3
+    client = session.client("iam", config=iam_client_config(max_pool_connections=max(10, max_workers)))
+    if metrics is not None:
+        client = instrument_client(client, metrics)
+    return governed_client(client, governor or RateGovernor())
+
+
+def collect_report_inputs(usernames=None, max_workers=DEFAULT_MAX_WORKERS, governor=None, cache=None,
+                          session=None, journal=None, metrics=None):
+    """
+    Main logic to:
+      1. Load the account's authorization graph and map every user to its
+         managed policy ARNs (all users in the account when `usernames` is None)
+      2. Submit one ACTION_LEVEL last-access job per distinct policy ARN and
+         poll them concurrently (see iam_last_accessed_jobs). Policies with
+         a result for their current version in `cache` are not resubmitted.
+
+    IAM is called with the credentials of `session` (a boto3 Session, e.g. an
+    assumed role in another account) or the default credentials when None.
+    An optional CheckpointJournal records JobIds and results as they come in,
+    and an optional RunMetrics records API calls, jobs and stage times.
+
+    Returns the ReportInputs the report rows are built from.
+    """
+    iam_client = governed_iam_client(governor, session, max_workers, metrics)
+
+    # One paginated sweep answers every user, group and policy-name lookup
+    with timed_stage(metrics, "authorization_graph"):
+        graph = load_authorization_graph(iam_client)
+        user_policy_map = build_user_policy_map(graph, usernames)
+
+    policy_arns = distinct_policy_arns(user_policy_map)
+    policy_versions = {arn: graph.policy_version(arn) for arn in policy_arns}
+    with timed_stage(metrics, "last_accessed_jobs"):
+        jobs = run_last_accessed_jobs(
+            iam_client,
+            policy_arns,
+            JOB_GRANULARITY,
+            max_workers=max_workers,
+            cache=cache,
+            versions=policy_versions,
+            journal=journal,
+            metrics=metrics
+        )
+
+    return ReportInputs(
+        user_policy_map,
+        {arn: graph.policy_name(arn) for arn in policy_arns},
+        policy_versions,
+        dict(jobs)
+    )
+
+
+def iter_users_permissions_rows(usernames=None, levels=LEVELS, **kwargs):
+    """
+    Collect the report inputs (see collect_report_inputs, which takes the
+    same keyword arguments) and build every requested view from the same job
+    results, fanning each policy's rows out to every user it applies to.
+
+    Yields (level, ReportRow) tuples one at a time, user by user. Only the
+    parsed rows of each distinct policy are held in memory, never the full
+    report. Service-level rows have the columns
+    ["UserName", "PolicyName", "PolicyArn", "ServiceName", "LastAccessed"];
+    action-level rows add "ActionName" before "LastAccessed".
+    """
+    yield from iter_report_rows(collect_report_inputs(usernames, **kwargs), levels)
+
+
+def iter_then(rows, callback, *args):
+    """
+    Yield `rows`, then call callback(*args) (when there is a callback) once
+    they have all been consumed.
+    """
+    yield from rows
+    if callback is not None:
+        callback(*args)
+
+
+def collect_principal_inputs(usernames=None, max_workers=DEFAULT_MAX_WORKERS, governor=None, cache=None,
+                             session=None, journal=None, metrics=None):
+    """
+    Principal-mode counterpart of collect_report_inputs: load the
+    authorization graph and run one ACTION_LEVEL job per user ARN.
+
+    Returns (graph, user_policy_map, user_jobs), the arguments that
+    iter_principal_report_rows builds the rows from.
+    """
+    iam_client = governed_iam_client(governor, session, max_workers, metrics)
+    with timed_stage(metrics, "authorization_graph"):
+        graph = load_authorization_graph(iam_client)
+        user_policy_map = build_user_policy_map(graph, usernames)
+
+    user_arns = {graph.users[username]['Arn']: username for username in user_policy_map}
+    with timed_stage(metrics, "last_accessed_jobs"):
+        jobs = run_last_accessed_jobs(
+            iam_client,
+            list(user_arns),
+            JOB_GRANULARITY,
+            max_workers=max_workers,
+            cache=cache,
+            versions={arn: principal_version(graph, username) for arn, username in user_arns.items()},
+            journal=journal,
+            metrics=metrics
+        )
+    return graph, user_policy_map, {user_arns[arn]: job_details for arn, job_details in jobs}
+
+
+def iter_principal_permissions_rows(usernames=None, levels=LEVELS, max_workers=DEFAULT_MAX_WORKERS,
+                                    governor=None, cache=None, session=None, account_id=None, journal=None,
+                                    metrics=None, on_complete=None):
+    """
+    Principal-level counterpart of iter_users_permissions_rows: one
+    ACTION_LEVEL job per user ARN instead of per policy ARN, with each
+    policy's rows attributed locally from its allowed actions (see
+    iam_principal_attribution). Yields the same (level, ReportRow) tuples.
+
+    Cached user results are keyed by a digest of the user's policies, so
+    they are invalidated by any attachment or policy version change.
+    `session`, `journal` and `metrics` are as for collect_report_inputs;
+    rows are tagged with `account_id` when one is given. `on_complete` is
+    called with (account_id, usernames, namespaces) after the last row,
+    where `namespaces` are the service_namespaces of the user jobs.
+    """
+    graph, user_policy_map, user_jobs = collect_principal_inputs(
+        usernames, max_workers, governor, cache, session, journal, metrics
+    )
+    rows = iter_principal_report_rows(graph, user_policy_map, user_jobs, levels, account_id)
+    if on_complete is not None:
+        rows = iter_then(rows, on_complete, account_id, usernames, service_namespaces(user_jobs.values()))
+    yield from rows
+
+
+def generate_users_permissions_reports(usernames=None, levels=LEVELS, job_mode='policy', **kwargs):
+    """
+    Collect iter_users_permissions_rows (or, with job_mode='principal',
+    iter_principal_permissions_rows) into a dict of level -> list of
+    ReportRow objects. Prefer the iterators for large reports.
+    """
+    reports = {level: [] for level in levels}
+    rows = (iter_principal_permissions_rows if job_mode == 'principal' else iter_users_permissions_rows)
+    for level, row in rows(usernames, levels=levels, **kwargs):
+        reports[level].append(row)
+    return reports
+
+
+def generate_users_permissions_report(usernames=None, level='action', **kwargs):
+    """
+    Produce a single view (`level` is 'service' or 'action') for several users.
+    See generate_users_permissions_reports for the row format and options.
+    """
+    return generate_users_permissions_reports(usernames, levels=(level,), **kwargs)[level]
+
+
+def generate_user_permissions_report(username, level='action', **kwargs):
+    """
+    Produce a single view for a single user.
+    See generate_users_permissions_reports for the row format and options.
+    """
+    return generate_users_permissions_report([username], level=level, **kwargs)
+
+
+def export_csv(report_data, output_file):
+    """
+    Export the report data to a CSV file.
+    `report_data` may be any iterable of ReportRow objects or dicts with
+    consistent keys.
+    """
+    export_rows("csv", report_data, output_file)
+
+
+def export_json(report_data, output_file):
+    """
+    Export the report data to a JSON file (a single array).
+    """
+    export_rows("json", report_data, output_file)
+
+
+def export_ndjson(report_data, output_file):
+    """
+    Export the report data to a newline-delimited JSON file.
+    """
+    export_rows("ndjson", report_data, output_file)
+
+
+def export_yaml(report_data, output_file):
+    """
+    Export the report data to a YAML file.
+    Requires PyYAML to be installed.
+    """
+    export_rows("yaml", report_data, output_file)
+
+
+def export_parquet(report_data, output_file):
+    """
+    Export the report data to a Parquet file. Requires pyarrow; without it
+    the built-in columnar format is written instead (see iam_columnar).
+    """
+    export_rows("parquet", report_data, output_file)
+
+
+def export_arrow(report_data, output_file):
+    """
+    Export the report data to an Arrow IPC file. Requires pyarrow; without it
+    the built-in columnar format is written instead (see iam_columnar).
+    """
+    export_rows("arrow", report_data, output_file)
+
+
+def export_columnar(report_data, output_file):
+    """
+    Export the report data to the built-in dictionary-encoded, compressed
+    .iamcol column file (see iam_columnar).
+    """
+    export_rows("columnar", report_data, output_file)
+
+
+def export_xml(report_data, output_file):
+    """
+    Export the report data to an XML file: a root <Report> element with one
+    <Record> per row, written incrementally.
+    """
+    export_rows("xml", report_data, output_file)
+
+
+EXPORTERS = {
+    "csv": export_csv,
+    "json": export_json,
+    "ndjson": export_ndjson,
+    "yaml": export_yaml,
+    "xml": export_xml,
+    "parquet": export_parquet,
+    "arrow": export_arrow,
+    "columnar": export_columnar,
+}
+
+
+def parse_formats(value):
+    """
+    argparse type for --format: a comma-separated list of output formats.
+    """
+    formats = list(dict.fromkeys(f.strip().lower() for f in value.split(",") if f.strip()))
+    unknown = [f for f in formats if f not in WRITERS]
+    if not formats or unknown:
+        raise argparse.ArgumentTypeError(
+            f"invalid format(s) {', '.join(unknown) or value!r}; choose from {', '.join(WRITERS)}"
+        )
+    return formats
+
+
+def default_output_name(level, prefix="iam-user-access"):
+    """
+    Timestamped base name used when --output is not given.
+    """
+    return f"{prefix}-{level}-level-report-" + datetime.now().strftime('%m-%d-%Y')
+
+
+def default_delta_output_name():
+    """
+    Timestamped base name for the delta report when --output is not given.
+    """
+    return "iam-user-access-delta-report-" + datetime.now().strftime('%m-%d-%Y')
+
+
+def add_target_arguments(parser):
+    """
+    The users to report on: one username, --all-users or --users-file.
+    """
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("username", nargs="?", help="IAM username to analyze")
+    target.add_argument(
+        "--all-users",
+        action="store_true",
+        help="Analyze every IAM user in the account"
+    )
+    target.add_argument(
+        "--users-file",
+        help="Analyze the IAM usernames listed in this file, one per line"
+    )
+
+
+def add_output_arguments(parser, default_level, views="Report view(s) to produce from the same jobs"):
+    """
+    --level, --format and --output.
+    """
+    parser.add_argument(
+        "--level",
+        default=default_level,
+        choices=["service", "action", "both"],
+        help=f"{views} (default: {default_level})"
+    )
+    parser.add_argument(
+        "--format",
+        default=["csv"],
+        type=parse_formats,
+        help=f"Output format, or several separated by commas to write them all in one pass "
+             f"({', '.join(WRITERS)}; default: csv)"
+    )
+    parser.add_argument(
+        "--output",
+        help="Base name (without extension) for the output file. Example: 'report' => 'report.csv'. "
+             "With --level both, '-service-level' and '-action-level' are appended. "
+             "Defaults to a timestamped name per level."
+    )
+
+
+def add_rate_arguments(parser):
+    """
+    Job concurrency and the rate governor's budgets.
+    """
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f"Number of last accessed jobs to poll concurrently (default: {DEFAULT_MAX_WORKERS})"
+    )
+    parser.add_argument(
+        "--max-rps",
+        type=float,
+        default=DEFAULT_ACCOUNT_RATE,
+        help=f"Account-wide IAM request budget per second (default: {DEFAULT_ACCOUNT_RATE})"
+    )
+    parser.add_argument(
+        "--api-rate",
+        action="append",
+        metavar="API=RPS",
+        help="Per-API request budget, e.g. GetPolicy=5. May be given more than once."
+    )
+    parser.add_argument(
+        "--rate-state-file",
+        help="Share the rate budget with other runs through this lock-protected state file"
+    )
+
+
+def add_cache_arguments(parser):
+    """
+    Options of the on-disk result cache.
+    """
+    parser.add_argument(
+        "--cache-file",
+        help="SQLite file that caches job results (default: ~/.cache/iam-access-report/last-accessed.sqlite)"
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_TTL_HOURS,
+        help=f"Hours a cached job result stays valid (default: {DEFAULT_TTL_HOURS:g})"
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help=f"Number of results kept before the least recently used are evicted (default: {DEFAULT_MAX_ENTRIES})"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached results and run new jobs (the cache is still updated)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write the result cache"
+    )
+
+
+def add_metrics_arguments(parser):
+    """
+    --metrics-out, --metrics-format and --profile; see run_with_metrics.
+    """
+    parser.add_argument(
+        "--metrics-out",
+        metavar="PATH",
+        help="Write per-API latency histograms, retry/throttle counts, job timings, stage times and "
+             "exporter throughput to this file (Prometheus text for .prom/.txt, JSON otherwise)"
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=["json", "prometheus"],
+        help="Format of --metrics-out, overriding the file extension"
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Run under cProfile, save the stats to PATH and print the slowest functions"
+    )
+
+
+def requested_usernames(args):
+    """
+    The usernames selected by add_target_arguments, or None for every user.
+    """
+    if args.all_users:
+        return None
+    if args.users_file:
+        return read_users_file(args.users_file)
+    return [args.username]
+
+
+def rate_governor(parser, args):
+    """
+    The RateGovernor configured by add_rate_arguments; bad budgets are
+    reported through `parser`.
+    """
+    try:
+        return RateGovernor(
+            account_rate=args.max_rps,
+            api_rates=parse_api_rates(args.api_rate),
+            state_file=args.rate_state_file
+        )
+    except (ValueError, RuntimeError) as e:
+        parser.error(str(e))
+
+
+def result_cache_options(args):
+    """
+    ResultCache keyword arguments from add_cache_arguments, or None with --no-cache.
+    """
+    if args.no_cache:
+        return None
+    return dict(
+        path=args.cache_file,
+        ttl_hours=args.cache_ttl,
+        max_entries=args.cache_max_entries,
+        refresh=args.refresh
+    )
+
+
+def output_names(args, levels, default_name=default_output_name):
+    """
+    Base output name of each level from --output, or `default_name(level)`.
+    """
+    outputs = {}
+    for level in levels:
+        if args.output is None:
+            outputs[level] = default_name(level)
+        elif len(levels) > 1:
+            outputs[level] = f"{args.output}-{level}-level"
+        else:
+            outputs[level] = args.output
+    return outputs
+
+
+def run_with_metrics(args, run):
+    """
+    Call run(metrics) under the options of add_metrics_arguments: metrics is
+    a RunMetrics written to --metrics-out afterwards (None without it), and
+    --profile runs it under cProfile.
+    """
+    metrics = RunMetrics() if args.metrics_out else None
+    if args.profile:
+        result = profile_run(lambda: run(metrics), args.profile)
+    else:
+        result = run(metrics)
+
+    if metrics is not None:
+        write_metrics(metrics, args.metrics_out, args.metrics_format)
+    return result
+
+
+def build_parser(default_level='action', prog=None):
+    """
+    Build the command line parser shared by both report scripts.
+    """
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Generate IAM user service-level and/or action-level permissions reports "
+                    "and export to CSV, JSON, YAML, or XML."
+    )
+    add_target_arguments(parser)
+    add_output_arguments(parser, default_level)
+    parser.add_argument(
+        "--job-mode",
+        default="policy",
+        choices=JOB_MODES,
+        help="Run one last accessed job per policy (exact per-policy data), or one per user and "
+             "attribute the results to policies from their allowed actions (default: policy)"
+    )
+    add_rate_arguments(parser)
+    add_cache_arguments(parser)
+    parser.add_argument(
+        "--previous",
+        metavar="SNAPSHOT",
+        help="Snapshot of an earlier run (see --snapshot-out). Unchanged policies reuse its results "
+             "and a delta report of added, removed, newly used and newly unused permissions is written."
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=DEFAULT_MAX_AGE_HOURS,
+        help=f"With --previous, re-run jobs for results older than this many hours (default: {DEFAULT_MAX_AGE_HOURS:g})"
+    )
+    parser.add_argument(
+        "--snapshot-out",
+        metavar="SNAPSHOT",
+        help="Write a snapshot of this run for a later --previous (gzip-compressed if it ends in .gz)"
+    )
+    parser.add_argument(
+        "--cloudtrail",
+        metavar="DIR",
+        help="Build the rows from the CloudTrail .json.gz log files under DIR instead of last accessed "
+             "jobs: one row per action each policy grants, with the user's last call from the logs"
+    )
+    parser.add_argument(
+        "--cloudtrail-index",
+        metavar="PATH",
+        help=f"With --cloudtrail, the incremental last-use index (default: {default_index_path()})"
+    )
+    parser.add_argument(
+        "--cloudtrail-workers",
+        type=int,
+        default=DEFAULT_CLOUDTRAIL_WORKERS,
+        help=f"With --cloudtrail, number of processes parsing log files (default: {DEFAULT_CLOUDTRAIL_WORKERS})"
+    )
+    parser.add_argument(
+        "--action-catalog",
+        metavar="FILE",
+        help="With --cloudtrail, action catalog to evaluate policy wildcards against (default: derived "
+             "from the botocore service models)"
+    )
+    parser.add_argument(
+        "--summary",
+        action="store_true",
+        help="Also export per-user, per-policy and per-service rollups (counts, never-used and stale "
+             "fractions, last-use percentiles) as <output>-by-user/-by-policy/-by-service files"
+    )
+    parser.add_argument(
+        "--stale-days",
+        type=int,
+        default=DEFAULT_STALE_DAYS,
+        help=f"With --summary, count permissions not used for this many days as stale (default: {DEFAULT_STALE_DAYS})"
+    )
+    parser.add_argument(
+        "--history",
+        nargs="?",
+        const="",
+        metavar="PATH",
+        help="Append this run to an indexed SQLite history for 'iam-access-report query' "
+             f"(default path: {default_history_path()})"
+    )
+    accounts = parser.add_mutually_exclusive_group()
+    accounts.add_argument(
+        "--accounts-file",
+        help="Audit every account listed in this file (account IDs or role ARNs, one per line); "
+             "rows get an AccountId column"
+    )
+    accounts.add_argument(
+        "--organization",
+        action="store_true",
+        help="Audit every active account of the AWS Organization (run from the management account)"
+    )
+    parser.add_argument(
+        "--role-arn-template",
+        default=DEFAULT_ROLE_ARN_TEMPLATE,
+        help=f"Role assumed in each account, with {{account_id}} as placeholder (default: {DEFAULT_ROLE_ARN_TEMPLATE})"
+    )
+    parser.add_argument(
+        "--role-session-name",
+        default=DEFAULT_SESSION_NAME,
+        help=f"Session name used when assuming account roles (default: {DEFAULT_SESSION_NAME})"
+    )
+    parser.add_argument(
+        "--account-workers",
+        type=int,
+        default=DEFAULT_ACCOUNT_WORKERS,
+        help=f"Number of accounts audited in parallel worker processes (default: {DEFAULT_ACCOUNT_WORKERS})"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="JOURNAL",
+        help="Record submitted jobs, results and exported rows in this SQLite journal so an "
+             "interrupted run can be continued with --resume"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the run recorded in --checkpoint: reattach to its jobs, skip finished "
+             "policies and append to its partial output files"
+    )
+    add_metrics_arguments(parser)
+    return parser
+
+
+def main(default_level='action', argv=None, prog=None):
+    parser = build_parser(default_level, prog)
+    args = parser.parse_args(argv)
+
+    run_with_metrics(args, lambda metrics: run_report(parser, args, metrics))
+
+
+def run_report(parser, args, metrics=None):
+    """
+    Run the report described by parsed command line `args`, recording into
+    `metrics` when given. Invalid combinations are reported through `parser`.
+    """
+    governor = rate_governor(parser, args)
+    cache_options = result_cache_options(args)
+
+    organization_mode = bool(args.accounts_file or args.organization)
+    if (args.job_mode == "principal" or organization_mode) and (args.previous or args.snapshot_out):
+        parser.error("--previous and --snapshot-out need a single-account run with --job-mode policy")
+
+    accounts = None
+    if args.accounts_file:
+        try:
+            accounts = read_accounts_file(args.accounts_file, args.role_arn_template)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    elif args.organization:
+        accounts = list_organization_accounts(args.role_arn_template)
+    if accounts is not None and not accounts:
+        parser.error("no accounts to audit")
+
+    if args.cloudtrail:
+        if not os.path.isdir(args.cloudtrail):
+            parser.error(f"CloudTrail directory {args.cloudtrail} not found")
+        if organization_mode or args.job_mode == "principal" or args.previous or args.snapshot_out or args.checkpoint:
+            parser.error("--cloudtrail cannot be combined with organization mode, --job-mode principal, "
+                         "--previous, --snapshot-out or --checkpoint")
+
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint")
+    if args.checkpoint and organization_mode:
+        parser.error("--checkpoint needs a single-account run")
+
+    result_cache = None
+    if cache_options is not None and not organization_mode:
+        result_cache = ResultCache(**cache_options)
+    cache = result_cache
+
+    try:
+        previous = None
+        if args.previous:
+            try:
+                previous = load_snapshot(args.previous)
+            except (OSError, ValueError, KeyError) as e:
+                parser.error(f"cannot read --previous snapshot: {e}")
+            cache = SnapshotResults(previous, max_age_hours=args.max_age, fallback=cache)
+
+        usernames = requested_usernames(args)
+        levels = LEVELS if args.level == "both" else (args.level,)
+        outputs = output_names(args, levels)
+
+        journal = None
+        if args.checkpoint:
+            # The requested --output, not the resolved names: the default ones are dated
+            fingerprint = {
+                "usernames": usernames,
+                "levels": levels,
+                "formats": args.format,
+                "output": args.output,
+                "job_mode": args.job_mode,
+            }
+            try:
+                journal = CheckpointJournal(args.checkpoint, fingerprint, resume=args.resume)
+            except CheckpointError as e:
+                parser.error(str(e))
+            # A run resumed on a later day keeps appending to the files it started
+            outputs = journal.setdefault("outputs", outputs)
+
+        # 1. Open one writer per (view, format), reopening partial files when resuming
+        writers = {}
+        for level in levels:
+            writers[level] = []
+            for fmt in args.format:
+                path = output_path(outputs[level], fmt)
+                writer = open_writer(fmt, path, journal.output_position(path) if args.resume else None)
+                if writer:
+                    if metrics is not None:
+                        writer = TimedWriter(writer, metrics, fmt, level)
+                    writers[level].append((fmt, writer))
+
+        if args.summary:
+            for level in levels:
+                writer = SummaryWriter(outputs[level], args.format, args.stale_days)
+                if metrics is not None:
+                    writer = TimedWriter(writer, metrics, "summary", level)
+                writers[level].append(("summary", writer))
+
+        history = None
+        on_complete = None
+        if args.history is not None:
+            history = HistoryStore(args.history or None)
+            history_writers = [history.writer(level) for level in levels]
+            for level, writer in zip(levels, history_writers):
+                writers[level].append(("history", writer))
+
+            def on_complete(account_id, covered_usernames, namespaces):
+                # Called once an account's rows are all written: its covered users
+                # without rows have lost every permission
+                for writer in history_writers:
+                    writer.cover(account_id, covered_usernames)
+                history.record_service_namespaces(namespaces)
+
+        # 2. Stream every requested view from one set of jobs into its writers
+        if args.cloudtrail:
+            inputs = None
+            rows = iter_cloudtrail_permissions_rows(
+                args.cloudtrail,
+                usernames,
+                levels=levels,
+                index_path=args.cloudtrail_index,
+                workers=args.cloudtrail_workers,
+                catalog_path=args.action_catalog,
+                governor=governor,
+                metrics=metrics
+            )
+            rows = iter_then(rows, on_complete, "", usernames, set())
+        elif organization_mode:
+            inputs = None
+            rows = iter_organization_rows(
+                accounts,
+                usernames,
+                levels=levels,
+                job_mode=args.job_mode,
+                account_workers=args.account_workers,
+                session_name=args.role_session_name,
+                max_workers=args.max_workers,
+                governor_options=dict(
+                    account_rate=args.max_rps,
+                    api_rates=parse_api_rates(args.api_rate),
+                    state_file=args.rate_state_file
+                ),
+                cache_options=cache_options,
+                on_complete=on_complete
+            )
+        elif args.job_mode == "principal":
+            inputs = None
+            rows = iter_principal_permissions_rows(
+                usernames,
+                levels=levels,
+                max_workers=args.max_workers,
+                governor=governor,
+                cache=cache,
+                journal=journal,
+                metrics=metrics,
+                on_complete=on_complete
+            )
+        else:
+            inputs = collect_report_inputs(
+                usernames,
+                max_workers=args.max_workers,
+                governor=governor,
+                cache=cache,
+                journal=journal,
+                metrics=metrics
+            )
+            rows = iter_report_rows(inputs, levels)
+            if on_complete is not None:
+                rows = iter_then(rows, on_complete, "", usernames, service_namespaces(inputs.job_results.values()))
+        # Principal and organization rows are produced lazily, so this stage includes their jobs
+        with timed_stage(metrics, "rows_and_export"):
+            write_checkpointed_rows(rows, writers, journal)
+        if journal is not None:
+            journal.close()
+        if history is not None:
+            history.close()
+
+        # 3. Optionally snapshot this run and report what changed since the previous one
+        if args.snapshot_out:
+            with timed_stage(metrics, "snapshot"):
+                save_snapshot(args.snapshot_out, inputs, cache.reused if previous else None)
+
+        if previous is not None:
+            print(f"[INFO] Reused {len(cache.reused)} of {len(inputs.job_results)} policy results from {args.previous}")
+            output = f"{args.output}-delta" if args.output else default_delta_output_name()
+            counts, delta_rows = summarize_delta(iter_delta_rows(previous.inputs, inputs))
+            delta_writers = [w for w in (open_writer(fmt, output_path(output, fmt)) for fmt in args.format) if w]
+            with timed_stage(metrics, "delta"):
+                write_rows(delta_rows, delta_writers)
+            print("[INFO] Changes: " + ", ".join(f"{count} {change.lower()}" for change, count in counts.items()))
+    finally:
+        if result_cache is not None:
+            result_cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Catalog of IAM actions with a compiled index for policy action patterns.
+
+IAM evaluates Action / NotAction patterns such as "s3:Get*" or "*:Describe*"
+against every action of every service. To find which concrete actions a
+pattern grants, the catalog keeps all known "service:Action" names sorted and
+case-folded, which makes it a flattened trie: the names that share a prefix
+occupy one contiguous index range, found with two binary searches. A pattern
+compiles to a set of actions represented as an integer bitmask (bit i =
+catalog action i):
+
+- its literal part (up to the first wildcard) selects a prefix range;
+- if the rest is just '*' ("s3:*", "iam:Get*") the whole range matches at
+  once, without looking at a single name;
+- otherwise the pattern is compiled into a regular expression automaton
+  that only scans the names inside the prefix range ("ec2:*Instance*" only
+  looks at ec2 actions).
+
+Compiled patterns are memoized, and bitmasks make the union, intersection and
+difference of thousands of grants cheap.
+
+The default catalog is derived from the operations of every service model
+bundled with botocore, keyed by the service's signing name (which is the IAM
+service prefix for nearly every service). Building it takes a few seconds,
+so it is saved under the cache directory once per botocore version. A
+catalog file (one "service:Action" per line, or a JSON list) can be used
+instead, e.g. one generated from the Service Authorization Reference, which
+also lists actions without an API operation.
+"""
+import gzip
+import json
+import os
+import re
+from bisect import bisect_left
+from fnmatch import translate
+
+from iam_result_cache import default_cache_path
+
+
+# botocore signing names that differ from the IAM service prefix
+SERVICE_PREFIX_OVERRIDES = {
+    "monitoring": "cloudwatch",
+    "tagging": "tag",
+    "iotdata": "iot",
+}
+
+
+def _range_mask(lo, hi):
+    return ((1 << (hi - lo)) - 1) << lo
+
+
+def indices_mask(indices):
+    """
+    Build a bitmask from many indices at once; OR-ing them in one by one would
+    copy the whole integer for every index.
+    """
+    if not indices:
+        return 0
+    bits = bytearray(max(indices) // 8 + 1)
+    for i in indices:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, "little")
+
+
+def iter_bits(mask):
+    """
+    Yield the catalog indices set in `mask`, in ascending order.
+    """
+    bits = bin(mask)[:1:-1]
+    index = bits.find("1")
+    while index >= 0:
+        yield index
+        index = bits.find("1", index + 1)
+
+
+class ActionCatalog:
+    """
+    Sorted, de-duplicated IAM action names ("service:Action") that compile
+    action patterns into bitmasks. Matching is case-insensitive,
+    names keep the case they were first given in.
+    """
+
+    def __init__(self, actions):
+        names = {}
+        for action in actions:
+            if ":" in action:
+                names.setdefault(action.lower(), action)
+        self.keys = sorted(names)
+        self.names = [names[key] for key in self.keys]
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.all = _range_mask(0, len(self.keys))
+        self._compiled = {}
+        self._services = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def compile(self, pattern):
+        """
+        Return the bitmask of catalog actions matched by an IAM action pattern.
+        """
+        pattern = pattern.lower()
+        mask = self._compiled.get(pattern)
+        if mask is None:
+            mask = self._compiled[pattern] = self._match(pattern)
+        return mask
+
+    def compile_all(self, patterns):
+        """
+        Return the union of compile() over `patterns`.
+        """
+        mask = 0
+        for pattern in patterns:
+            mask |= self.compile(pattern)
+        return mask
+
+    def _match(self, pattern):
+        wildcard = min((i for i in (pattern.find("*"), pattern.find("?")) if i >= 0), default=len(pattern))
+        literal, rest = pattern[:wildcard], pattern[wildcard:]
+        if not rest:
+            i = self.index.get(pattern)
+            return 0 if i is None else 1 << i
+
+        lo, hi = self._prefix_range(literal)
+        if not rest.strip("*"):
+            return _range_mask(lo, hi)
+        automaton = re.compile(translate(pattern), re.DOTALL)
+        keys = self.keys
+        return indices_mask([i for i in range(lo, hi) if automaton.match(keys[i])])
+
+    def _prefix_range(self, prefix):
+        """
+        Return the index range [lo, hi) of the names starting with `prefix`.
+        """
+        lo = bisect_left(self.keys, prefix)
+        return lo, bisect_left(self.keys, prefix + "\U0010ffff", lo)
+
+    def service_ranges(self):
+        """
+        Return {service prefix: (lo, hi)}, the index range of each service's actions.
+        """
+        if self._services is None:
+            self._services = {}
+            for i, key in enumerate(self.keys):
+                service = key.split(":", 1)[0]
+                lo, _ = self._services.get(service, (i, i))
+                self._services[service] = (lo, i + 1)
+        return self._services
+
+    def service_mask(self, service):
+        """
+        Return the bitmask of every catalog action of `service`.
+        """
+        lo, hi = self.service_ranges().get(service.lower(), (0, 0))
+        return _range_mask(lo, hi)
+
+    def extended(self, actions):
+        """
+        Return this catalog, or a new one when `actions` adds unknown names.
+        """
+        extra = [a for a in actions if ":" in a and a.lower() not in self.index]
+        if not extra:
+            return self
+        return ActionCatalog(self.names + extra)
+
+
+def botocore_actions():
+    """
+    Derive "prefix:Operation" names from every service model bundled with botocore.
+    """
+    import botocore.session
+
+    loader = botocore.session.get_session().get_component("data_loader")
+    actions = []
+    for service_name in loader.list_available_services("service-2"):
+        model = loader.load_service_model(service_name, "service-2")
+        metadata = model["metadata"]
+        prefix = metadata.get("signingName") or metadata.get("endpointPrefix") or service_name
+        prefix = SERVICE_PREFIX_OVERRIDES.get(prefix, prefix)
+        actions.extend(f"{prefix}:{operation}" for operation in model["operations"])
+    return actions
+
+
+def default_catalog_path():
+    """
+    Return the cached botocore-derived catalog for the installed botocore version.
+    """
+    import botocore
+
+    directory = os.path.dirname(default_cache_path())
+    return os.path.join(directory, f"action-catalog-botocore-{botocore.__version__}.json.gz")
+
+
+def read_catalog_file(path):
+    """
+    Read a catalog file: a JSON list of action names, or one name per line.
+    Files ending in .gz are decompressed.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")]
+
+
+def load_action_catalog(path=None, extra_actions=()):
+    """
+    Return an ActionCatalog from `path`, or from the botocore models (cached
+    in default_catalog_path()) when `path` is None. `extra_actions`, such as
+    the literal actions named in policies and the actions IAM reported as
+    tracked, are always added so exact names never go unmatched.
+    """
+    if path is not None:
+        actions = read_catalog_file(path)
+    else:
+        cached = default_catalog_path()
+        try:
+            actions = read_catalog_file(cached)
+        except (OSError, ValueError):
+            print("[INFO] Building the IAM action catalog from the botocore service models...")
+            actions = sorted(set(botocore_actions()))
+            try:
+                os.makedirs(os.path.dirname(cached), exist_ok=True)
+                with gzip.open(cached, "wt", encoding="utf-8") as f:
+                    json.dump(actions, f)
+            except OSError as e:
+                print(f"[WARN] Could not save the action catalog to {cached}: {e}")
+    return ActionCatalog(list(actions) + list(extra_actions))
@@ -0,0 +1,155 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+In-memory index of the account's users, groups, roles and managed policies.
+
+The whole index is built from one fully paginated sweep of
+get_account_authorization_details, so lookups during a report never need
+further list or get calls and never silently truncate.
+"""
+import json
+from urllib.parse import unquote
+
+
+AUTHORIZATION_DETAIL_FILTERS = ['User', 'Group', 'Role', 'LocalManagedPolicy', 'AWSManagedPolicy']
+
+
+def _decode_document(document):
+    """
+    Policy documents are normally decoded by botocore, but raw responses carry
+    them as URL-encoded JSON strings.
+    """
+    if isinstance(document, str):
+        return json.loads(unquote(document))
+    return document
+
+
+def _inline_policies(detail, key):
+    return {
+        p['PolicyName']: _decode_document(p.get('PolicyDocument'))
+        for p in detail.get(key, [])
+    }
+
+
+class AuthorizationGraph:
+    """
+    Users, groups, roles and managed policies of one account, keyed by name
+    (principals) or ARN (policies).
+
+    Each principal is a dict with 'Arn', 'AttachedPolicyArns', 'InlinePolicies'
+    and 'PermissionsBoundaryArn'; users also carry 'Groups'. Each policy is a
+    dict with 'PolicyName', 'DefaultVersionId' and 'Document' (the default
+    version's document).
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.groups = {}
+        self.roles = {}
+        self.policies = {}
+
+    def add_page(self, page):
+        """
+        Merge one get_account_authorization_details response page into the index.
+        """
+        for detail in page.get('UserDetailList', []):
+            self.users[detail['UserName']] = {
+                'Arn': detail['Arn'],
+                'Groups': list(detail.get('GroupList', [])),
+                'AttachedPolicyArns': [p['PolicyArn'] for p in detail.get('AttachedManagedPolicies', [])],
+                'InlinePolicies': _inline_policies(detail, 'UserPolicyList'),
+                'PermissionsBoundaryArn': detail.get('PermissionsBoundary', {}).get('PermissionsBoundaryArn'),
+            }
+
+        for detail in page.get('GroupDetailList', []):
+            self.groups[detail['GroupName']] = {
+                'Arn': detail['Arn'],
+                'AttachedPolicyArns': [p['PolicyArn'] for p in detail.get('AttachedManagedPolicies', [])],
+                'InlinePolicies': _inline_policies(detail, 'GroupPolicyList'),
+                'PermissionsBoundaryArn': None,
+            }
+
+        for detail in page.get('RoleDetailList', []):
+            self.roles[detail['RoleName']] = {
+                'Arn': detail['Arn'],
+                'AttachedPolicyArns': [p['PolicyArn'] for p in detail.get('AttachedManagedPolicies', [])],
+                'InlinePolicies': _inline_policies(detail, 'RolePolicyList'),
+                'PermissionsBoundaryArn': detail.get('PermissionsBoundary', {}).get('PermissionsBoundaryArn'),
+            }
+
+        for detail in page.get('Policies', []):
+            default_version = detail.get('DefaultVersionId')
+            document = None
+            for version in detail.get('PolicyVersionList', []):
+                if version.get('IsDefaultVersion') or version.get('VersionId') == default_version:
+                    document = _decode_document(version.get('Document'))
+                    break
+            self.policies[detail['Arn']] = {
+                'PolicyName': detail['PolicyName'],
+                'DefaultVersionId': default_version,
+                'Document': document,
+            }
+
+    def usernames(self):
+        """
+        Return the names of every user in the account.
+        """
+        return list(self.users)
+
+    def managed_policies_for_user(self, username):
+        """
+        Return the ARNs of all managed policies attached directly to the user
+        or through any groups the user is in, without duplicates.
+        """
+        user = self.users[username]
+        policy_arns = list(user['AttachedPolicyArns'])
+        for group_name in user['Groups']:
+            group = self.groups.get(group_name)
+            if group:
+                policy_arns.extend(group['AttachedPolicyArns'])
+        return list(dict.fromkeys(policy_arns))
+
+    def policy_name(self, policy_arn):
+        """
+        Return the name of a managed policy. Policies that are not in the index
+        fall back to the last path segment of their ARN, which is the name.
+        """
+        policy = self.policies.get(policy_arn)
+        if policy:
+            return policy['PolicyName']
+        return policy_arn.rsplit('/', 1)[-1]
+
+    def policy_version(self, policy_arn):
+        """
+        Return the default version ID of a managed policy, or None if unknown.
+        """
+        policy = self.policies.get(policy_arn)
+        return policy['DefaultVersionId'] if policy else None
+
+
+def load_authorization_graph(iam_client, filters=None):
+    """
+    Page through get_account_authorization_details until IsTruncated is false
+    and return the resulting AuthorizationGraph.
+    """
+    graph = AuthorizationGraph()
+    kwargs = {'Filter': list(filters or AUTHORIZATION_DETAIL_FILTERS)}
+    while True:
+        page = iam_client.get_account_authorization_details(**kwargs)
+        graph.add_page(page)
+        if not page.get('IsTruncated'):
+            break
+        kwargs['Marker'] = page['Marker']
+    return graph
@@ -0,0 +1,282 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Offline benchmark for the IAM access report pipeline.
+
+Generates a synthetic account (see iam_fake_backend), runs the report
+pipeline against a simulated IAM backend, and then streams the report through
+each exporter. For every stage it measures wall-clock time, rows per second
+and API calls, plus peak traced memory (tracemalloc). Nothing touches the
+network or real AWS credentials.
+
+Results can be saved with --json-out and compared with an earlier run with
+--baseline. The run fails (exit status 1) if a stage's throughput drops by
+more than --tolerance, or if the pipeline makes more API calls than before.
+
+Examples:
+    python iam_benchmark.py --users 2000 --policies 500
+    python iam_benchmark.py --transport http --throttle-rps 50 --json-out bench.json
+    python iam_benchmark.py --baseline bench.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from iam_access_report import collect_principal_inputs, collect_report_inputs
+from iam_fake_backend import DEFAULT_PAGE_SIZE, FakeIAMBackend, FakeIAMServer, FakeIAMSession, SyntheticAccount
+from iam_principal_attribution import iter_principal_report_rows
+from iam_rate_governor import DEFAULT_API_RATES, RateGovernor
+from iam_report_model import iter_report_rows
+from iam_report_writers import WRITERS, export_rows, output_path
+
+
+DEFAULT_TOLERANCE = 0.2
+UNLIMITED_RATE = 1e6
+
+
+class _Stage:
+    """
+    Time one benchmark stage and, optionally, its peak traced memory.
+    """
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.seconds = None
+        self.peak_bytes = None
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        if self.trace_memory:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+
+
+def _result(stage, rows, **extra):
+    result = {
+        "seconds": round(stage.seconds, 4),
+        "rows": rows,
+        "rows_per_second": round(rows / stage.seconds, 1) if stage.seconds else None,
+        "peak_memory_bytes": stage.peak_bytes,
+    }
+    result.update(extra)
+    return result
+
+
+def run_benchmark(account, job_latency=0.2, page_size=DEFAULT_PAGE_SIZE, throttle_rps=None, transport="local",
+                  job_mode="policy", level="action", formats=None, max_workers=8, max_rps=UNLIMITED_RATE,
+                  trace_memory=True, output_dir=None):
+    """
+    Run the pipeline and every exporter in `formats` against a simulated
+    account and return a dict of measurements per stage.
+    """
+    backend = FakeIAMBackend(account, job_latency=job_latency, page_size=page_size, throttle_rps=throttle_rps)
+    governor = RateGovernor(account_rate=max_rps, api_rates={api: max_rps for api in DEFAULT_API_RATES})
+    levels = (level,)
+    results = {}
+
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with ExitStack() as stack:
+            if transport == "http":
+                session = stack.enter_context(FakeIAMServer(backend)).session()
+            else:
+                session = FakeIAMSession(backend)
+
+            # 1. Pipeline: authorization sweep, jobs and row generation
+            with _Stage(trace_memory) as stage:
+                # Both modes keep only their inputs and count the rows they stream
+                if job_mode == "principal":
+                    inputs = collect_principal_inputs(None, max_workers=max_workers, governor=governor, session=session)
+                    row_count = sum(1 for _ in iter_principal_report_rows(*inputs, levels))
+                    policies = None
+                else:
+                    inputs = collect_report_inputs(None, max_workers=max_workers, governor=governor, session=session)
+                    row_count = sum(1 for _ in iter_report_rows(inputs, levels))
+                    policies = len(inputs.job_results)
+            results["pipeline"] = _result(
+                stage, row_count,
+                api_calls=dict(sorted(backend.calls.items())),
+                throttled=backend.throttled,
+                policies=policies,
+            )
+
+        # 2. Exporters: stream the same rows into each format
+        with tempfile.TemporaryDirectory(dir=output_dir) as directory:
+            for fmt in formats or WRITERS:
+                if job_mode == "principal":
+                    source = (row for _, row in iter_principal_report_rows(*inputs, levels))
+                else:
+                    source = (row for _, row in iter_report_rows(inputs, levels))
+                path = output_path(os.path.join(directory, "benchmark"), fmt)
+                with _Stage(trace_memory) as stage:
+                    export_rows(fmt, source, path)
+                written = [p for p in (path, path + ".iamcol") if os.path.exists(p)]
+                results[f"export:{fmt}"] = _result(
+                    stage, row_count, file_bytes=os.path.getsize(written[0]) if written else None
+                )
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return a list of regression messages: stages whose rows/sec fell by more
+    than `tolerance` (a fraction), and API call counts that grew.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous.get("rows_per_second") and current.get("rows_per_second") is not None:
+            floor = previous["rows_per_second"] * (1 - tolerance)
+            if current["rows_per_second"] < floor:
+                regressions.append(
+                    f"{name}: {current['rows_per_second']:.0f} rows/s, baseline {previous['rows_per_second']:.0f} rows/s"
+                )
+        for api, count in current.get("api_calls", {}).items():
+            if count > previous.get("api_calls", {}).get(api, count):
+                regressions.append(f"{name}: {count} {api} calls, baseline {previous['api_calls'][api]}")
+    return regressions
+
+
+def _format_bytes(value):
+    if value is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024 or unit == "GiB":
+            return f"{value:.1f} {unit}" if unit != "B" else f"{value} B"
+        value /= 1024
+
+
+def print_results(results):
+    print(f"{'stage':<18}{'seconds':>10}{'rows/s':>14}{'peak memory':>14}{'output':>12}")
+    for name, result in results.items():
+        print(
+            f"{name:<18}{result['seconds']:>10.3f}{result['rows_per_second'] or 0:>14,.0f}"
+            f"{_format_bytes(result['peak_memory_bytes']):>14}{_format_bytes(result.get('file_bytes')):>12}"
+        )
+    pipeline = results.get("pipeline", {})
+    calls = ", ".join(f"{api}={count}" for api, count in pipeline.get("api_calls", {}).items())
+    print(f"[INFO] API calls: {calls} (throttled: {pipeline.get('throttled', 0)})")
+
+
+def build_parser(prog=None):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Benchmark the IAM access report pipeline and exporters against a simulated IAM backend."
+    )
+    parser.add_argument("--users", type=int, default=1000, help="Synthetic users (default: 1000)")
+    parser.add_argument("--groups", type=int, default=50, help="Synthetic groups (default: 50)")
+    parser.add_argument("--policies", type=int, default=300, help="Synthetic managed policies (default: 300)")
+    parser.add_argument("--policies-per-user", type=int, default=3, help="Policies attached to each user (default: 3)")
+    parser.add_argument("--groups-per-user", type=int, default=2, help="Groups each user belongs to (default: 2)")
+    parser.add_argument("--policies-per-group", type=int, default=3, help="Policies attached to each group (default: 3)")
+    parser.add_argument("--services-per-policy", type=int, default=4, help="Services each policy allows (default: 4)")
+    parser.add_argument("--actions-per-service", type=int, default=5, help="Tracked actions per service (default: 5)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic account (default: 0)")
+    parser.add_argument("--job-latency", type=float, default=0.2,
+                        help="Seconds a simulated job stays IN_PROGRESS (default: 0.2)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"Items per page of paged IAM calls (default: {DEFAULT_PAGE_SIZE})")
+    parser.add_argument("--throttle-rps", type=float,
+                        help="Throttle simulated IAM calls beyond this many per second (default: never)")
+    parser.add_argument("--transport", choices=["local", "http"], default="local",
+                        help="'local' calls the fake backend in-process; 'http' runs real boto3 clients against "
+                             "a local IAM endpoint (default: local)")
+    parser.add_argument("--job-mode", choices=["policy", "principal"], default="policy",
+                        help="Pipeline job mode to benchmark (default: policy)")
+    parser.add_argument("--level", choices=["service", "action"], default="action",
+                        help="Report view to generate and export (default: action)")
+    parser.add_argument("--format", dest="formats", default=",".join(WRITERS),
+                        help=f"Comma-separated exporters to benchmark (default: {','.join(WRITERS)})")
+    parser.add_argument("--max-workers", type=int, default=8, help="Job polling workers (default: 8)")
+    parser.add_argument("--max-rps", type=float, default=UNLIMITED_RATE,
+                        help="Rate governor budget for every API (default: effectively unlimited)")
+    parser.add_argument("--no-trace-memory", action="store_true",
+                        help="Skip tracemalloc (it slows Python down) and only measure time")
+    parser.add_argument("--json-out", help="Write the measurements to this JSON file")
+    parser.add_argument("--baseline", help="Compare against the measurements in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Allowed throughput drop against --baseline, as a fraction (default: {DEFAULT_TOLERANCE})")
+    return parser
+
+
+def main(argv=None, prog=None):
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in WRITERS]
+    if unknown:
+        parser.error(f"unknown format(s): {', '.join(unknown)}")
+
+    account = SyntheticAccount(
+        users=args.users,
+        groups=args.groups,
+        policies=args.policies,
+        policies_per_user=args.policies_per_user,
+        groups_per_user=args.groups_per_user,
+        policies_per_group=args.policies_per_group,
+        services_per_policy=args.services_per_policy,
+        actions_per_service=args.actions_per_service,
+        seed=args.seed
+    )
+    results = run_benchmark(
+        account,
+        job_latency=args.job_latency,
+        page_size=args.page_size,
+        throttle_rps=args.throttle_rps,
+        transport=args.transport,
+        job_mode=args.job_mode,
+        level=args.level,
+        formats=formats,
+        max_workers=args.max_workers,
+        max_rps=args.max_rps,
+        trace_memory=not args.no_trace_memory
+    )
+    print_results(results)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"[INFO] Benchmark results written to {args.json_out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"[ERROR] Regression in {message}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("[INFO] No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Checkpoint journal for resumable report runs.
+
+The journal is a small SQLite file that records, as the run progresses:
+
+- the JobId of every submitted last accessed job, so a resumed run reattaches
+  to jobs IAM is still holding instead of submitting them again,
+- every finished job result, so finished policies are never re-run, and
+- after each batch of users, how far every output file has been written
+  and which users it already contains.
+
+A run started with --resume truncates each text output back to its last
+checkpoint, skips the users already written and appends the rest. Columnar
+outputs cannot be appended to, so they are rewritten from the journaled
+results. That is cheap, because no job is repeated.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from iam_report_writers import RESUMABLE_FORMATS
+from iam_result_cache import dump_job_details, load_job_details
+
+
+CHECKPOINT_INTERVAL = 1.0
+
+
+class CheckpointError(Exception):
+    """
+    The journal cannot be used to resume this run.
+    """
+
+
+class CheckpointJournal:
+    """
+    Journal of one run, identified by a `fingerprint` of its parameters.
+
+    Without `resume` the journal is started over. With `resume` an existing
+    journal is reused, and CheckpointError is raised if it belongs to a run
+    with different parameters.
+    """
+
+    def __init__(self, path, fingerprint, resume=False):
+        self.path = path
+        self.resume = resume
+        self._lock = threading.Lock()
+        self._last_checkpoint = 0.0
+
+        if not resume and os.path.exists(path):
+            os.remove(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS run (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS jobs (
+                arn TEXT NOT NULL,
+                granularity TEXT NOT NULL,
+                version_id TEXT NOT NULL,
+                job_id TEXT,
+                job_details TEXT,
+                PRIMARY KEY (arn, granularity, version_id)
+            );
+            CREATE TABLE IF NOT EXISTS outputs (
+                output_file TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                rows_written INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS exported_users (username TEXT PRIMARY KEY);
+            """
+        )
+
+        encoded = json.dumps(fingerprint, sort_keys=True)
+        row = self._conn.execute("SELECT value FROM run WHERE key = 'fingerprint'").fetchone()
+        if row is None:
+            self._conn.execute("INSERT INTO run VALUES ('fingerprint', ?)", (encoded,))
+            self._conn.commit()
+        elif row[0] != encoded:
+            raise CheckpointError(
+                f"{path} belongs to a run with different arguments; rerun them unchanged or drop --resume"
+            )
+
+    def setdefault(self, key, value):
+        """
+        Record `value` (any JSON value) under `key` unless the journal already
+        holds one, and return the recorded value. Lets a resumed run reuse
+        what the interrupted one decided, such as its dated output names.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO run VALUES (?, ?)", (key, json.dumps(value)))
+            row = self._conn.execute("SELECT value FROM run WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0])
+
+    # Job results: the same get/put interface as ResultCache, plus JobIds
+
+    def get(self, arn, granularity, version_id):
+        """
+        Return the journaled result of a finished job, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_details FROM jobs WHERE arn = ? AND granularity = ? AND version_id = ?",
+                (arn, granularity, version_id or '')
+            ).fetchone()
+        return load_job_details(row[0]) if row and row[0] else None
+
+    def put(self, arn, granularity, version_id, job_details):
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (arn, granularity, version_id, job_details) VALUES (?, ?, ?, ?)
+                ON CONFLICT (arn, granularity, version_id) DO UPDATE SET job_details = excluded.job_details
+                """,
+                (arn, granularity, version_id or '', dump_job_details(job_details))
+            )
+            self._conn.commit()
+
+    def job_id(self, arn, granularity, version_id):
+        """
+        Return the JobId submitted for this ARN by an earlier attempt, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE arn = ? AND granularity = ? AND version_id = ?",
+                (arn, granularity, version_id or '')
+            ).fetchone()
+        return row[0] if row else None
+
+    def record_job_id(self, arn, granularity, version_id, job_id):
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (arn, granularity, version_id, job_id) VALUES (?, ?, ?, ?)
+                ON CONFLICT (arn, granularity, version_id) DO UPDATE SET job_id = excluded.job_id
+                """,
+                (arn, granularity, version_id or '', job_id)
+            )
+            self._conn.commit()
+
+    # Exported rows
+
+    def exported_users(self):
+        """
+        Return the set of users whose rows every output already contains.
+        """
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT username FROM exported_users")}
+
+    def output_position(self, output_file):
+        """
+        Return the (position, rows_written) resume point of an output file, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT position, rows_written FROM outputs WHERE output_file = ?", (output_file,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def checkpoint(self, usernames, writers, force=False):
+        """
+        Record that `usernames` are fully written, together with the current
+        position of every writer, in one transaction. Unless `force` is set,
+        this happens at most once every CHECKPOINT_INTERVAL seconds; it
+        returns True when a checkpoint was written.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_checkpoint < CHECKPOINT_INTERVAL:
+            return False
+        positions = [(writer.output_file,) + writer.position() for writer in writers]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO exported_users VALUES (?)", ((u,) for u in usernames))
+            self._conn.executemany("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?)", positions)
+        self._last_checkpoint = now
+        return True
+
+    def close(self):
+        self._conn.close()
+
+
+def write_checkpointed_rows(rows, writers, journal=None):
+    """
+    Stream (level, ReportRow) tuples into `writers` (a dict of level -> list of
+    (format, writer) pairs) and close them, checkpointing after whole users.
+
+    With a resumed journal, users it has already recorded are only sent to
+    writers that cannot be resumed (the columnar formats); the resumed text
+    writers already contain them. A checkpoint is only written once the
+    rows of a user are complete, and a final one when every row is written,
+    so an interruption never records a partly written user. For the same
+    reason, writers with an abort() method (the history store) are aborted
+    instead of closed when the rows fail.
+    """
+    exported = journal.exported_users() if journal is not None and journal.resume else set()
+    resumable = {level: [w for fmt, w in pairs if fmt in RESUMABLE_FORMATS] for level, pairs in writers.items()}
+    all_writers = {level: [w for _, w in pairs] for level, pairs in writers.items()}
+    to_checkpoint = [w for level_writers in resumable.values() for w in level_writers]
+
+    finished_users = []
+    current_user = None
+    completed = False
+    try:
+        for level, row in rows:
+            username = row.user_name
+            if username != current_user:
+                if current_user is not None:
+                    finished_users.append(current_user)
+                    if journal is not None and journal.checkpoint(finished_users, to_checkpoint):
+                        finished_users = []
+                current_user = username
+            targets = all_writers[level]
+            if username in exported:
+                targets = [w for w in targets if w not in resumable[level]]
+            for writer in targets:
+                writer.write(row)
+
+        if journal is not None:
+            if current_user is not None:
+                finished_users.append(current_user)
+            journal.checkpoint(finished_users, to_checkpoint, force=True)
+        completed = True
+    finally:
+        for level_writers in all_writers.values():
+            for writer in level_writers:
+                abort = None if completed else getattr(writer, "abort", None)
+                if abort is not None:
+                    abort()
+                else:
+                    writer.close()
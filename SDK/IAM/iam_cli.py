@@ -0,0 +1,83 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Single `iam-access-report` entry point with one subcommand per tool.
+
+Startup matters because the reports are run from cron wrappers and CI hooks
+many times a day, so this module imports nothing but argparse and importlib.
+A subcommand's module is only imported once it has been chosen, and within
+the tools boto3, botocore, the exporters' serializers (csv, PyYAML, xml.sax,
+pyarrow) and the process/thread pools are imported where they are first
+used. `python -X importtime` checks in tests/unit/test_startup.py keep the
+startup import cost within STARTUP_BUDGET_MS.
+
+    iam-access-report action    <options>   action-level last accessed report
+    iam-access-report service   <options>   service-level last accessed report
+    iam-access-report effective <options>   granted-vs-used effective permissions
+    iam-access-report serve     <options>   report server for frequent callers
+    iam-access-report query     <query>     query the run history (--history)
+    iam-access-report benchmark <options>   offline benchmark against a fake IAM
+"""
+import argparse
+import importlib
+import sys
+
+
+PROG = "iam-access-report"
+
+# Cumulative import time allowed for this module and for each subcommand
+# module, in milliseconds, checked by tests/unit/test_startup.py when
+# IAM_STARTUP_BUDGETS is set
+STARTUP_BUDGET_MS = 30
+COMMAND_BUDGET_MS = 100
+
+# name -> (module, keyword arguments for its main(), help)
+COMMANDS = {
+    "action": ("iam_access_report", {"default_level": "action"},
+               "Action-level last accessed report (one job per policy or per user)"),
+    "service": ("iam_access_report", {"default_level": "service"},
+                "Service-level last accessed report from the same jobs"),
+    "effective": ("iam_effective_permissions", {},
+                  "Effective permissions evaluated from the policies, next to what was used"),
+    "serve": ("iam_report_server", {},
+              "Serve reports over local HTTP or a Unix socket with warm clients and caches"),
+    "query": ("iam_history_store", {},
+              "Query the history of runs recorded with --history (unused, used, runs)"),
+    "benchmark": ("iam_benchmark", {},
+                  "Benchmark the pipeline and exporters against a simulated IAM backend"),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog=PROG,
+        description="IAM access reports. Run '%(prog)s <command> --help' for the options of a command.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n" + "\n".join(f"  {name:<11} {help}" for name, (_, _, help) in COMMANDS.items()),
+    )
+    parser.add_argument("command", choices=COMMANDS, metavar="command", help="see the commands below")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    module_name, options, _ = COMMANDS[args.command]
+    module = importlib.import_module(module_name)
+    return module.main(argv=args.args, prog=f"{PROG} {args.command}", **options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Action-level last use built locally from CloudTrail log files.
+
+The last accessed APIs are asynchronous, throttled, keep about 400 days and
+only track individual actions for some services. This module reads a
+directory of CloudTrail `.json.gz` files instead, e.g. one kept in sync with
+the trail's bucket (`aws s3 sync s3://<trail-bucket>/AWSLogs/ <dir>`), and
+needs no last accessed jobs at all:
+
+- each file is parsed as a stream, one record at a time, in a pool of worker
+  processes; a worker returns only the latest use of each (principal,
+  action) it saw;
+- the results are merged into an index (SQLite, next to the result cache by
+  default) of the last use of every action by every IAM user ARN, along
+  with the size and mtime of every file read. A later run only parses files
+  that are new or changed since, so the index follows the trail as new
+  files arrive;
+- the report rows have the same schema as generate_action_level_report: one
+  row per action each of the user's managed policies grants (evaluated
+  against the action catalog, see iam_effective_permissions), with the last
+  time the user called it. ServiceName is the IAM service prefix (e.g.
+  "s3"), as CloudTrail has no display names.
+
+Only events of IAM users count, and calls that were denied do not count as
+use. An event's action is its eventSource prefix (with the same overrides as
+the action catalog) and its eventName, e.g. s3.amazonaws.com + GetObject ->
+s3:GetObject.
+"""
+import gzip
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from iam_action_catalog import SERVICE_PREFIX_OVERRIDES, iter_bits
+from iam_report_rows import ReportRow, intern_str
+from iam_result_cache import default_cache_path
+
+
+DEFAULT_CLOUDTRAIL_WORKERS = os.cpu_count() or 4
+LOG_SUFFIX = ".json.gz"
+READ_SIZE = 1 << 16
+COMMIT_FILES = 200
+
+# errorCode values of calls that were refused, which are not a use of the permission
+DENIED_ERROR_CODES = frozenset((
+    "AccessDenied",
+    "AccessDeniedException",
+    "Client.UnauthorizedOperation",
+    "UnauthorizedOperation",
+    "UnauthorizedAccess",
+))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    events INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS last_used (
+    principal_arn TEXT NOT NULL,
+    action TEXT NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (principal_arn, action)
+) WITHOUT ROWID;
+"""
+
+
+def default_index_path():
+    """
+    Return the default CloudTrail index, next to the result cache.
+    """
+    return os.path.join(os.path.dirname(default_cache_path()), "cloudtrail-index.sqlite")
+
+
+def iter_records(path):
+    """
+    Yield the records of a CloudTrail log file ({"Records": [...]}) one at a
+    time, decoding the array incrementally so only one record (and one read
+    buffer) is in memory. Files without a Records array, such as digest
+    files, yield nothing.
+    """
+    decoder = json.JSONDecoder()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        buffer = ""
+        start = -1
+        while start < 0:
+            chunk = f.read(READ_SIZE)
+            buffer += chunk
+            start = buffer.find('"Records"')
+            if not chunk:
+                break
+        if start < 0:
+            return
+        # The array after the key, not an earlier one in another field
+        key = start
+        start = buffer.find("[", key)
+        while start < 0:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                return
+            buffer += chunk
+            start = buffer.find("[", key)
+        pos = start + 1
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError("truncated or invalid CloudTrail log")
+                chunk = f.read(READ_SIZE)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield record
+            pos = end
+            if pos > READ_SIZE:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def event_action(record):
+    """
+    Return the "prefix:Action" name of a record's API call.
+    """
+    prefix = record.get("eventSource", "").split(".", 1)[0]
+    return f"{SERVICE_PREFIX_OVERRIDES.get(prefix, prefix)}:{record.get('eventName', '')}"
+
+
+def parse_event_time(value):
+    """
+    Convert a CloudTrail eventTime ("2025-01-01T12:34:56Z") to epoch seconds.
+    """
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+def scan_log_file(path):
+    """
+    Read one log file and return (path, events, {(user ARN, action): epoch})
+    with the latest use of each action by each IAM user in it. Runs in the
+    worker processes, so it only returns the (small) per-file maximums.
+    A file that cannot be read (e.g. one still being synced) is reported and
+    returned with events None, so it is read again on the next ingest.
+    """
+    latest = {}
+    events = 0
+    try:
+        for record in iter_records(path):
+            events += 1
+            identity = record.get("userIdentity") or {}
+            if identity.get("type") != "IAMUser" or record.get("errorCode") in DENIED_ERROR_CODES:
+                continue
+            key = (identity.get("arn"), event_action(record))
+            event_time = record.get("eventTime", "")
+            # eventTime strings share one format, so they compare in time order
+            if event_time > latest.get(key, ""):
+                latest[key] = event_time
+    except (OSError, EOFError, ValueError) as e:
+        print(f"[WARN] Skipping CloudTrail log {path}: {e}", file=sys.stderr)
+        return path, None, {}
+    return path, events, {key: parse_event_time(value) for key, value in latest.items() if key[0]}
+
+
+def find_log_files(directory):
+    """
+    Return (path, size, mtime) for every CloudTrail log file under `directory`.
+    """
+    found = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith(LOG_SUFFIX) and "CloudTrail-Digest" not in name:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                found.append((path, stat.st_size, int(stat.st_mtime)))
+    found.sort()
+    return found
+
+
+class CloudTrailIndex:
+    """
+    Last use of every action by every IAM user, kept up to date from a
+    directory of CloudTrail log files by ingest().
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(SCHEMA)
+
+    def ingest(self, directory, max_workers=DEFAULT_CLOUDTRAIL_WORKERS):
+        """
+        Parse the log files under `directory` that are new or changed since
+        the last ingest and merge them into the index. Returns the number of
+        files read.
+        """
+        known = {path: (size, mtime) for path, size, mtime in self._conn.execute("SELECT path, size, mtime FROM files")}
+        pending = [entry for entry in find_log_files(directory) if known.get(entry[0]) != entry[1:]]
+        if not pending:
+            print(f"[INFO] CloudTrail index is up to date ({len(known)} files)")
+            return 0
+
+        print(f"[INFO] Reading {len(pending)} new CloudTrail log files from {directory}")
+        stats = {path: (size, mtime) for path, size, mtime in pending}
+        paths = [path for path, _, _ in pending]
+        events = 0
+        if max_workers <= 1 or len(paths) == 1:
+            results = map(scan_log_file, paths)
+            pool = None
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            pool = ProcessPoolExecutor(max_workers=max_workers)
+            results = pool.map(scan_log_file, paths, chunksize=max(1, min(64, len(paths) // (max_workers * 4))))
+        try:
+            for done, (path, file_events, latest) in enumerate(results, 1):
+                if file_events is None:
+                    continue
+                events += file_events
+                self._conn.executemany(
+                    "INSERT INTO last_used VALUES (?, ?, ?) ON CONFLICT (principal_arn, action) "
+                    "DO UPDATE SET last_used = MAX(last_used, excluded.last_used)",
+                    [(arn, action, last_used) for (arn, action), last_used in latest.items()]
+                )
+                self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path,) + stats[path] + (file_events,))
+                # Commit regularly so an interrupted ingest keeps what it read
+                if done % COMMIT_FILES == 0:
+                    self._conn.commit()
+        finally:
+            self._conn.commit()
+            if pool is not None:
+                pool.shutdown()
+        print(f"[INFO] Indexed {events} CloudTrail events from {len(paths)} files")
+        return len(paths)
+
+    def actions(self):
+        """
+        Return every action name in the index.
+        """
+        return [action for (action,) in self._conn.execute("SELECT DISTINCT action FROM last_used")]
+
+    def last_used(self, principal_arn):
+        """
+        Return {lower-case action name: epoch} for one principal ARN.
+        """
+        return {
+            action.lower(): last_used
+            for action, last_used in self._conn.execute(
+                "SELECT action, last_used FROM last_used WHERE principal_arn = ?", (principal_arn,)
+            )
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+def iter_cloudtrail_report_rows(evaluator, user_policy_map, index, levels=('action',)):
+    """
+    Yield (level, ReportRow) tuples, user by user, for every action (and, at
+    the service level, every service) that each managed policy of the user
+    grants after denies and permissions boundaries, with the user's last use
+    from `index` (None when never seen).
+    """
+    catalog = evaluator.catalog
+    graph = evaluator.graph
+    ranges = catalog.service_ranges()
+    # Catalog indices per effective mask, shared by the users of a policy
+    bits = {}
+    for username, policy_arns in user_policy_map.items():
+        username = intern_str(username)
+        permissions = evaluator.evaluate(username)
+        used = index.last_used(graph.users[username]['Arn'])
+        for level in levels:
+            for policy_arn in policy_arns:
+                grants = evaluator.managed_policy(policy_arn)
+                if grants is None:
+                    continue
+                policy_name = intern_str(graph.policy_name(policy_arn))
+                mask = grants.granted & permissions.granted
+                indices = bits.get(mask)
+                if indices is None:
+                    indices = bits[mask] = list(iter_bits(mask))
+                if level == 'action':
+                    for i in indices:
+                        key = catalog.keys[i]
+                        yield level, ReportRow(username, policy_name, policy_arn, intern_str(key.split(":", 1)[0]),
+                                               intern_str(catalog.names[i].split(":", 1)[1]), used.get(key))
+                    continue
+
+                service_last_used = {}
+                for key, last_used in used.items():
+                    i = catalog.index.get(key)
+                    if i is not None and (mask >> i) & 1:
+                        service = key.split(":", 1)[0]
+                        service_last_used[service] = max(last_used, service_last_used.get(service, last_used))
+                for service, (lo, hi) in ranges.items():
+                    if (mask >> lo) & ((1 << (hi - lo)) - 1):
+                        yield level, ReportRow(username, policy_name, policy_arn, intern_str(service), None,
+                                               service_last_used.get(service))
+
+
+def iter_cloudtrail_permissions_rows(cloudtrail_dir, usernames=None, levels=('action',), index_path=None,
+                                     workers=DEFAULT_CLOUDTRAIL_WORKERS, catalog_path=None, governor=None,
+                                     session=None, metrics=None):
+    """
+    Bring the CloudTrail index up to date from `cloudtrail_dir`, load the
+    authorization graph and yield the rows of iter_cloudtrail_report_rows.
+    Only GetAccountAuthorizationDetails (and GetPolicy/GetPolicyVersion for
+    boundaries outside the graph) is called; no last accessed jobs are run.
+    """
+    # Imported here: both are heavier pipeline modules
+    from iam_access_report import governed_iam_client
+    from iam_action_catalog import load_action_catalog
+    from iam_authorization_graph import load_authorization_graph
+    from iam_effective_permissions import EffectivePermissionEvaluator, literal_actions
+    from iam_metrics import timed_stage
+    from iam_user_policies import build_user_policy_map
+
+    index = CloudTrailIndex(index_path)
+    try:
+        with timed_stage(metrics, "cloudtrail_ingest"):
+            index.ingest(cloudtrail_dir, workers)
+
+        iam_client = governed_iam_client(governor, session, metrics=metrics)
+        with timed_stage(metrics, "authorization_graph"):
+            graph = load_authorization_graph(iam_client)
+            user_policy_map = build_user_policy_map(graph, usernames)
+
+        with timed_stage(metrics, "action_catalog"):
+            documents = [policy['Document'] for policy in graph.policies.values()]
+            extra_actions = literal_actions(documents)
+            extra_actions.update(index.actions())
+            catalog = load_action_catalog(catalog_path, extra_actions)
+
+        evaluator = EffectivePermissionEvaluator(graph, catalog, iam_client)
+        yield from iter_cloudtrail_report_rows(evaluator, user_policy_map, index, levels)
+    finally:
+        index.close()
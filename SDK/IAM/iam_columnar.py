@@ -0,0 +1,378 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Columnar, compressed report archives.
+
+Rows are buffered into row groups and written column by column:
+
+- 'parquet' and 'arrow' (Arrow IPC) use pyarrow when it is installed, with
+  dictionary-encoded string columns, a UTC timestamp column and zstd. The
+  schema of report rows comes from the ReportRow fields; plain dict rows
+  (summary tables) have theirs inferred from the first row group.
+- 'columnar' is a built-in fallback (.iamcol) that needs only the standard
+  library. Each row group stores every string column as a dictionary plus an
+  index array, and timestamps as int64 epoch seconds. Each column chunk is
+  compressed with zstd (when the `zstandard` package is installed) or gzip.
+
+.iamcol records min/max/null/distinct statistics for every column of each row
+group, and Parquet its own min/max/null statistics, so readers can skip row
+groups that cannot match a query. Arrow IPC files carry no statistics; they
+are meant to be loaded whole.
+
+.iamcol layout:
+
+    MAGIC | column chunk ... | footer (JSON) | footer length (uint64 LE) | MAGIC
+"""
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from iam_report_rows import ACCOUNT_FIELD, ACTION_FIELDS, SERVICE_FIELDS, ReportRow
+from iam_report_writers import ReportWriter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+
+MAGIC = b"IAMCOL1\n"
+ROW_GROUP_SIZE = 100000
+TIMESTAMP_COLUMN = "LastAccessed"
+NULL_TIMESTAMP = -(2 ** 63)
+
+FORMAT_VERSION = 1
+
+
+def _raw_row(row):
+    """
+    Return (column names, values) with LastAccessed as epoch seconds when the
+    row is a ReportRow; plain dict rows are stored as strings.
+    """
+    if isinstance(row, ReportRow):
+        return row.keys(), row.raw_values()
+    return tuple(row.keys()), tuple(row.values())
+
+
+def _compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data, codec):
+    if codec == "zstd":
+        if not HAS_ZSTD:
+            raise RuntimeError("This file is zstd-compressed; install the 'zstandard' package to read it.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _little_endian(arr):
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_little_endian(typecode, data):
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+class _ColumnBuffer:
+    """
+    Rows of the current row group, kept column by column.
+    """
+
+    def __init__(self):
+        self.columns = None
+        self.values = None
+        self.timestamp_columns = set()
+
+    def add(self, row):
+        columns, values = _raw_row(row)
+        if self.columns is None:
+            self.columns = tuple(columns)
+            self.values = [[] for _ in self.columns]
+            if isinstance(row, ReportRow):
+                self.timestamp_columns = {TIMESTAMP_COLUMN}
+        for column_values, value in zip(self.values, values):
+            column_values.append(value)
+
+    def __len__(self):
+        return len(self.values[0]) if self.values else 0
+
+    def clear(self):
+        self.values = [[] for _ in self.columns]
+
+
+def _column_stats(values):
+    present = [v for v in values if v is not None]
+    stats = {"null_count": len(values) - len(present), "distinct_count": len(set(present))}
+    if present:
+        stats["min"] = min(present)
+        stats["max"] = max(present)
+    return stats
+
+
+class ColumnarWriter(ReportWriter):
+    """
+    Built-in .iamcol writer; see the module docstring for the layout.
+    """
+    label = "Columnar"
+
+    def __init__(self, output_file, row_group_size=ROW_GROUP_SIZE):
+        self.output_file = output_file
+        self.rows_written = 0
+        self.row_group_size = row_group_size
+        self.codec = "zstd" if HAS_ZSTD else "gzip"
+        self._buffer = _ColumnBuffer()
+        self._row_groups = []
+        self._f = open(output_file, "wb")
+        self._f.write(MAGIC)
+
+    def _write(self, row):
+        self._buffer.add(row)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def _write_chunk(self, payload):
+        offset = self._f.tell()
+        data = _compress(payload, self.codec)
+        self._f.write(data)
+        return offset, len(data)
+
+    def _flush(self):
+        buffer = self._buffer
+        if not len(buffer):
+            return
+
+        chunks = {}
+        for name, values in zip(buffer.columns, buffer.values):
+            stats = _column_stats(values)
+            if name in buffer.timestamp_columns:
+                encoded = array("q", (NULL_TIMESTAMP if v is None else v for v in values))
+                offset, length = self._write_chunk(_little_endian(encoded))
+                chunks[name] = {"type": "timestamp", "offset": offset, "length": length, "stats": stats}
+                continue
+
+            # Dictionary-encode the column: distinct values + a compact index array
+            dictionary = {}
+            indices = array("I", (dictionary.setdefault(v, len(dictionary)) for v in values))
+            if len(dictionary) < 2 ** 16:
+                indices = array("H", indices)
+            values_blob = json.dumps(list(dictionary)).encode("utf-8")
+            payload = struct.pack("<Q", len(values_blob)) + values_blob + _little_endian(indices)
+            offset, length = self._write_chunk(payload)
+            chunks[name] = {
+                "type": "dictionary",
+                "index_type": indices.typecode,
+                "offset": offset,
+                "length": length,
+                "stats": stats,
+            }
+
+        self._row_groups.append({"num_rows": len(buffer), "columns": chunks})
+        buffer.clear()
+
+    def _finish(self):
+        self._flush()
+        footer = json.dumps({
+            "version": FORMAT_VERSION,
+            "codec": self.codec,
+            "columns": list(self._buffer.columns or ()),
+            "num_rows": self.rows_written,
+            "row_groups": self._row_groups,
+        }).encode("utf-8")
+        self._f.write(footer)
+        self._f.write(struct.pack("<Q", len(footer)))
+        self._f.write(MAGIC)
+
+
+def read_columnar_metadata(path):
+    """
+    Return the footer of an .iamcol file: schema, codec, row groups and stats.
+    """
+    with open(path, "rb") as f:
+        f.seek(-(len(MAGIC) + 8), os.SEEK_END)
+        footer_length = struct.unpack("<Q", f.read(8))[0]
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an .iamcol file")
+        f.seek(-(len(MAGIC) + 8 + footer_length), os.SEEK_END)
+        return json.loads(f.read(footer_length))
+
+
+def _read_chunk(f, chunk, codec):
+    f.seek(chunk["offset"])
+    payload = _decompress(f.read(chunk["length"]), codec)
+    if chunk["type"] == "timestamp":
+        return [None if v == NULL_TIMESTAMP else v for v in _from_little_endian("q", payload)]
+
+    values_length = struct.unpack("<Q", payload[:8])[0]
+    dictionary = json.loads(payload[8:8 + values_length])
+    indices = _from_little_endian(chunk["index_type"], payload[8 + values_length:])
+    return [dictionary[i] for i in indices]
+
+
+def read_columnar(path, columns=None, row_group_filter=None):
+    """
+    Yield the rows of an .iamcol file as dicts of raw values.
+
+    Only the requested `columns` are decompressed. `row_group_filter`, if
+    given, is called with each row group's {column: stats} dict and the row
+    group is skipped without being read when it returns False.
+    """
+    metadata = read_columnar_metadata(path)
+    columns = list(columns or metadata["columns"])
+    with open(path, "rb") as f:
+        for group in metadata["row_groups"]:
+            if row_group_filter is not None:
+                stats = {name: chunk["stats"] for name, chunk in group["columns"].items()}
+                if not row_group_filter(stats):
+                    continue
+            data = [_read_chunk(f, group["columns"][name], metadata["codec"]) for name in columns]
+            for values in zip(*data):
+                yield dict(zip(columns, values))
+
+
+def report_row_schema(action_level=True, with_account=False):
+    """
+    The Arrow schema of ReportRow exports: the ACTION_FIELDS (or
+    SERVICE_FIELDS) columns, after an AccountId column for multi-account
+    runs, as dictionary-encoded strings and a UTC LastAccessed.
+    """
+    columns = ACTION_FIELDS if action_level else SERVICE_FIELDS
+    if with_account:
+        columns = (ACCOUNT_FIELD,) + columns
+    return pa.schema([
+        pa.field(name, pa.timestamp("s", tz="UTC")) if name == TIMESTAMP_COLUMN
+        else pa.field(name, pa.dictionary(pa.int32(), pa.string()))
+        for name in columns
+    ])
+
+
+class _ArrowWriterBase(ReportWriter):
+    """
+    Shared row-group buffering for the pyarrow-backed writers.
+    """
+
+    def __init__(self, output_file, row_group_size=ROW_GROUP_SIZE):
+        self.output_file = output_file
+        self.rows_written = 0
+        self.row_group_size = row_group_size
+        self._buffer = _ColumnBuffer()
+        self._schema = None
+        self._writer = None
+
+    def _write(self, row):
+        self._buffer.add(row)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def _arrow_schema(self):
+        columns = self._buffer.columns
+        if self._buffer.timestamp_columns:
+            return report_row_schema("ActionName" in columns, ACCOUNT_FIELD in columns)
+        fields = []
+        for name, values in zip(columns, self._buffer.values):
+            # Numeric columns of plain dict rows (e.g. summary tables) keep their type
+            sample = next((v for v in values if v is not None), None)
+            if isinstance(sample, int) and not isinstance(sample, bool):
+                fields.append(pa.field(name, pa.int64()))
+            elif isinstance(sample, float):
+                fields.append(pa.field(name, pa.float64()))
+            else:
+                fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        return pa.schema(fields)
+
+    def _flush(self):
+        buffer = self._buffer
+        if not len(buffer):
+            return
+        if self._writer is None:
+            self._schema = self._arrow_schema()
+            self._writer = self._open(self._schema)
+        arrays = [
+            pa.array(values, type=field.type.value_type).dictionary_encode()
+            if pa.types.is_dictionary(field.type) else pa.array(values, type=field.type)
+            for field, values in zip(self._schema, buffer.values)
+        ]
+        self._writer.write_batch(pa.record_batch(arrays, schema=self._schema))
+        buffer.clear()
+
+    def _open(self, schema):
+        raise NotImplementedError
+
+    def close(self):
+        self._flush()
+        if self._writer is None:
+            print(f"[WARN] No data to export to {self.label}.")
+            return
+        self._writer.close()
+        print(f"[INFO] {self.label} report written to {self.output_file}")
+
+
+class ParquetWriter(_ArrowWriterBase):
+    """
+    Parquet file with one row group per ROW_GROUP_SIZE rows, zstd compression
+    and column statistics.
+    """
+    label = "Parquet"
+
+    def _open(self, schema):
+        return pq.ParquetWriter(self.output_file, schema, compression="zstd", write_statistics=True)
+
+
+class ArrowIpcWriter(_ArrowWriterBase):
+    """
+    Arrow IPC (Feather v2) file with zstd-compressed record batches.
+    """
+    label = "Arrow IPC"
+
+    def _open(self, schema):
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        return pa.ipc.new_file(self.output_file, schema, options=options)
+
+
+def open_columnar_writer(fmt, output_file):
+    """
+    Return a writer for 'parquet', 'arrow' or 'columnar'. Without pyarrow the
+    first two fall back to the built-in format, written next to the requested
+    file with '.iamcol' appended to its name.
+    """
+    if fmt == "columnar":
+        return ColumnarWriter(output_file)
+    if HAS_PYARROW:
+        return ParquetWriter(output_file) if fmt == "parquet" else ArrowIpcWriter(output_file)
+
+    fallback = output_file + ".iamcol"
+    print(f"[WARN] pyarrow is not installed; writing the built-in columnar format to {fallback} instead.",
+          file=sys.stderr)
+    return ColumnarWriter(fallback)
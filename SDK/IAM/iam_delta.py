@@ -0,0 +1,229 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Delta mode: reuse the previous run's results and report what changed.
+
+A snapshot records everything a run was built from (see ReportInputs): each
+user's policy attachments, each policy's DefaultVersionId and its last
+accessed job result, plus when that result was collected. On the next run,
+SnapshotResults hands the stored result back to the job runner for every
+policy whose default version is unchanged and whose result is younger than
+`max_age_hours`, so last accessed jobs only run for new, edited or stale
+policies. Attachment changes need no jobs at all; they are picked up by the
+authorization graph sweep and surface in the diff.
+
+iter_delta_rows compares two runs at action level and yields one row per
+permission that was ADDED, REMOVED, NEWLY_USED or NEWLY_UNUSED.
+"""
+import gzip
+import json
+import time
+from datetime import datetime
+
+from iam_report_model import ReportInputs, policy_row_templates
+from iam_report_rows import format_timestamp
+from iam_result_cache import decode_datetime, encode_datetime
+
+
+SNAPSHOT_VERSION = 1
+DEFAULT_MAX_AGE_HOURS = 168.0
+
+DELTA_FIELDS = (
+    "ChangeType", "UserName", "PolicyName", "PolicyArn", "ServiceName", "ActionName",
+    "PreviousLastAccessed", "LastAccessed",
+)
+CHANGE_TYPES = ("ADDED", "REMOVED", "NEWLY_USED", "NEWLY_UNUSED")
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _collected_at(job_details):
+    completed = job_details.get("JobCompletionDate")
+    if isinstance(completed, datetime):
+        return completed.timestamp()
+    return time.time()
+
+
+class Snapshot:
+    """
+    A loaded snapshot: the run's ReportInputs, when it was generated and,
+    per policy ARN, the epoch time its job result was collected.
+    """
+
+    def __init__(self, inputs, generated_at, collected_at):
+        self.inputs = inputs
+        self.generated_at = generated_at
+        self.collected_at = collected_at
+
+
+def save_snapshot(path, inputs, collected_at=None):
+    """
+    Write `inputs` to `path` as JSON (gzip-compressed when the name ends in
+    .gz). `collected_at` maps ARN -> epoch seconds for results carried over
+    from an earlier snapshot; other results are dated by their job.
+    """
+    collected_at = collected_at or {}
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "generated_at": time.time(),
+        "users": inputs.user_policy_map,
+        "policies": {
+            arn: {
+                "PolicyName": inputs.policy_names[arn],
+                "DefaultVersionId": inputs.policy_versions.get(arn),
+                "CollectedAt": collected_at.get(arn) or _collected_at(job_details),
+                "JobDetails": {k: v for k, v in job_details.items() if k != "ResponseMetadata"},
+            }
+            for arn, job_details in inputs.job_results.items()
+        },
+    }
+    with _open(path, "w") as f:
+        json.dump(snapshot, f, default=encode_datetime)
+    print(f"[INFO] Snapshot written to {path}")
+
+
+def load_snapshot(path):
+    """
+    Read a snapshot written by save_snapshot. Raises ValueError if the file
+    is not a snapshot this version understands.
+    """
+    with _open(path, "r") as f:
+        data = json.load(f, object_hook=decode_datetime)
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} IAM access report snapshot")
+
+    policies = data["policies"]
+    inputs = ReportInputs(
+        data["users"],
+        {arn: p["PolicyName"] for arn, p in policies.items()},
+        {arn: p["DefaultVersionId"] for arn, p in policies.items()},
+        {arn: p["JobDetails"] for arn, p in policies.items()},
+    )
+    return Snapshot(inputs, data["generated_at"], {arn: p["CollectedAt"] for arn, p in policies.items()})
+
+
+class SnapshotResults:
+    """
+    Result source for run_last_accessed_jobs (it has the same get/put
+    interface as ResultCache) that answers from a previous snapshot.
+
+    A policy's stored result is reused when its DefaultVersionId still
+    matches and it was collected less than `max_age_hours` ago. Anything
+    else falls through to `fallback` (normally the ResultCache, or None),
+    which also receives every new result. `reused` records the ARNs answered
+    from the snapshot, with their original collection times.
+    """
+
+    def __init__(self, snapshot, max_age_hours=DEFAULT_MAX_AGE_HOURS, fallback=None):
+        self.snapshot = snapshot
+        self.max_age_seconds = max_age_hours * 3600
+        self.fallback = fallback
+        self.reused = {}
+
+    def get(self, arn, granularity, version_id):
+        inputs = self.snapshot.inputs
+        job_details = inputs.job_results.get(arn)
+        collected_at = self.snapshot.collected_at.get(arn, 0)
+        if (
+            job_details is not None
+            and job_details.get("JobStatus") == "COMPLETED"
+            and inputs.policy_versions.get(arn) == version_id
+            and time.time() - collected_at <= self.max_age_seconds
+        ):
+            self.reused[arn] = collected_at
+            return job_details
+        if self.fallback is not None:
+            return self.fallback.get(arn, granularity, version_id)
+        return None
+
+    def put(self, arn, granularity, version_id, job_details):
+        if self.fallback is not None:
+            self.fallback.put(arn, granularity, version_id, job_details)
+
+
+def _user_permissions(inputs, templates, username):
+    permissions = {}
+    for policy_arn in inputs.user_policy_map.get(username, ()):
+        for policy_name, arn, service, action, epoch in templates.get(policy_arn, ()):
+            permissions[(arn, service, action)] = (policy_name, epoch)
+    return permissions
+
+
+def iter_delta_rows(previous, current):
+    """
+    Compare two ReportInputs at action level and yield one dict row (with
+    the DELTA_FIELDS columns) per change, user by user:
+
+      ADDED         the user can now use an action through a policy it
+                    could not before (new attachment or new policy version)
+      REMOVED       the reverse
+      NEWLY_USED    the action had never been used and now has been
+      NEWLY_UNUSED  the action had a last accessed time and no longer has one
+                    (it aged out of the IAM tracking period)
+    """
+    previous_templates = policy_row_templates(previous, "action")
+    current_templates = policy_row_templates(current, "action")
+
+    usernames = list(current.user_policy_map)
+    usernames += [u for u in previous.user_policy_map if u not in current.user_policy_map]
+
+    for username in usernames:
+        before = _user_permissions(previous, previous_templates, username)
+        after = _user_permissions(current, current_templates, username)
+
+        for key in list(after) + [k for k in before if k not in after]:
+            policy_arn, service, action = key
+            old = before.get(key)
+            new = after.get(key)
+            if old is None:
+                change = "ADDED"
+            elif new is None:
+                change = "REMOVED"
+            elif old[1] is None and new[1] is not None:
+                change = "NEWLY_USED"
+            elif old[1] is not None and new[1] is None:
+                change = "NEWLY_UNUSED"
+            else:
+                continue
+
+            yield dict(zip(DELTA_FIELDS, (
+                change,
+                username,
+                (new or old)[0],
+                policy_arn,
+                service,
+                action,
+                format_timestamp(old[1]) if old else "",
+                format_timestamp(new[1]) if new else "",
+            )))
+
+
+def summarize_delta(rows):
+    """
+    Count delta rows by ChangeType, passing the rows through unchanged.
+    Returns (counts, generator); counts fills in as the generator is consumed.
+    """
+    counts = dict.fromkeys(CHANGE_TYPES, 0)
+
+    def counted():
+        for row in rows:
+            counts[row["ChangeType"]] += 1
+            yield row
+
+    return counts, counted()
@@ -0,0 +1,524 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Effective permissions: what each user is granted, next to what IAM saw used.
+
+The access reports only show what IAM tracked as used. This module reads the
+policy documents themselves, already fetched with the authorization graph,
+and evaluates them against the action catalog (see iam_action_catalog):
+
+- every identity policy of the user counts: managed policies attached to the
+  user or its groups, and the inline policies of both;
+- Allow and Deny statements are compiled from Action or NotAction patterns.
+  A statement applies unconditionally only when its Resource is "*" and it
+  has no Condition. Otherwise its grant is "Conditional" and its deny only
+  removes the unconditional grant, because whether it applies depends on the
+  request;
+- a permissions boundary caps the grants at what the boundary allows.
+
+Each policy is compiled once per version (inline policies once per distinct
+document) and its grants are kept as catalog bitmasks, so a user's effective
+permissions are a handful of integer operations however many actions they
+cover. Service control policies, resource-based policies and session policies
+are not evaluated.
+
+What was used comes from one ACTION_LEVEL last accessed job per user ARN,
+the same jobs (and cache entries) as --job-mode principal. The result is a
+granted-vs-used matrix:
+
+- action level: one row per action the user is granted or was seen using,
+  with how it is granted, which policies grant it and when it was last used
+  ("NotTracked" for actions IAM does not track individually);
+- service level: per service, how many actions are granted, how many of
+  those IAM tracks, and how many of those were used.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from iam_action_catalog import indices_mask, iter_bits, load_action_catalog
+from iam_authorization_graph import load_authorization_graph
+from iam_last_accessed_jobs import DEFAULT_MAX_WORKERS, run_last_accessed_jobs
+from iam_principal_attribution import principal_version
+from iam_report_model import JOB_GRANULARITY, LEVELS
+from iam_report_rows import format_timestamp, to_epoch
+from iam_metrics import TimedWriter, timed_stage
+from iam_report_writers import open_writer, output_path
+from iam_result_cache import ResultCache
+from iam_user_policies import build_user_policy_map
+
+
+FULL = "Full"
+CONDITIONAL = "Conditional"
+NOT_GRANTED = "None"
+NOT_TRACKED = "NotTracked"
+
+SERVICE_FIELDS = ("UserName", "Service", "GrantedActions", "ConditionalActions", "TrackedActions",
+                  "UsedActions", "UnusedActions", "LastAccessed")
+ACTION_FIELDS = ("UserName", "Service", "ActionName", "Access", "GrantedBy", "LastAccessed")
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _count(mask):
+    return bin(mask).count("1")
+
+
+def _statements(document):
+    return [s for s in _as_list((document or {}).get("Statement")) if isinstance(s, dict)]
+
+
+def literal_actions(documents):
+    """
+    Return the wildcard-free action names named in `documents`, so the
+    catalog can be extended with actions it does not know yet.
+    """
+    actions = set()
+    for document in documents:
+        for statement in _statements(document):
+            for pattern in _as_list(statement.get("Action")) + _as_list(statement.get("NotAction")):
+                if isinstance(pattern, str) and "*" not in pattern and "?" not in pattern:
+                    actions.add(pattern)
+    return actions
+
+
+class PolicyGrants:
+    """
+    One compiled policy document: bitmasks of the catalog actions it allows
+    or denies, unconditionally or only for some resources / conditions.
+    """
+    __slots__ = ("allow", "allow_conditional", "deny", "deny_conditional")
+
+    def __init__(self, document, catalog):
+        self.allow = self.allow_conditional = self.deny = self.deny_conditional = 0
+        for statement in _statements(document):
+            if "NotAction" in statement:
+                actions = catalog.all & ~catalog.compile_all(_as_list(statement["NotAction"]))
+            else:
+                actions = catalog.compile_all(_as_list(statement.get("Action")))
+            unconditional = (
+                "*" in _as_list(statement.get("Resource"))
+                and "NotResource" not in statement
+                and not statement.get("Condition")
+            )
+            if statement.get("Effect") == "Deny":
+                if unconditional:
+                    self.deny |= actions
+                else:
+                    self.deny_conditional |= actions
+            elif statement.get("Effect") == "Allow":
+                if unconditional:
+                    self.allow |= actions
+                else:
+                    self.allow_conditional |= actions
+        self.allow_conditional &= ~self.allow
+
+    @property
+    def granted(self):
+        return self.allow | self.allow_conditional
+
+
+class UserPermissions:
+    """
+    A user's effective permissions: `full` and `conditional` bitmasks and,
+    per granting policy label, the bitmask of effective actions it grants.
+    """
+    __slots__ = ("full", "conditional", "granted_by")
+
+    def __init__(self, full, conditional, granted_by):
+        self.full = full
+        self.conditional = conditional
+        self.granted_by = granted_by
+
+    @property
+    def granted(self):
+        return self.full | self.conditional
+
+
+def fetch_policy_document(iam_client, policy_arn):
+    """
+    Fetch the default version document of a managed policy that is not in
+    the authorization graph (e.g. an AWS managed policy used only as a
+    permissions boundary). Returns (version ID, document).
+    """
+    policy = iam_client.get_policy(PolicyArn=policy_arn)['Policy']
+    version_id = policy['DefaultVersionId']
+    version = iam_client.get_policy_version(PolicyArn=policy_arn, VersionId=version_id)['PolicyVersion']
+    return version_id, version['Document']
+
+
+class EffectivePermissionEvaluator:
+    """
+    Evaluates users of an AuthorizationGraph against an ActionCatalog.
+    Compiled policies are memoized by (ARN, version) for managed policies
+    and by document digest for inline ones. Managed policies missing from
+    the graph are fetched once through `iam_client`, when given.
+    """
+
+    def __init__(self, graph, catalog, iam_client=None):
+        self.graph = graph
+        self.catalog = catalog
+        self.iam_client = iam_client
+        self._compiled = {}
+        self._fetched = {}
+
+    def _compile(self, key, document):
+        grants = self._compiled.get(key)
+        if grants is None:
+            grants = self._compiled[key] = PolicyGrants(document, self.catalog)
+        return grants
+
+    def managed_policy(self, policy_arn):
+        """
+        Return the PolicyGrants of a managed policy's default version, or None
+        if its document is unavailable.
+        """
+        policy = self.graph.policies.get(policy_arn)
+        if policy and policy.get('Document') is not None:
+            return self._compile(('managed', policy_arn, policy['DefaultVersionId']), policy['Document'])
+
+        if policy_arn not in self._fetched:
+            self._fetched[policy_arn] = None
+            if self.iam_client is not None:
+                try:
+                    self._fetched[policy_arn] = fetch_policy_document(self.iam_client, policy_arn)
+                except Exception as e:
+                    print(f"[WARN] Could not fetch policy {policy_arn}: {e}", file=sys.stderr)
+        fetched = self._fetched[policy_arn]
+        if fetched is None:
+            return None
+        return self._compile(('managed', policy_arn, fetched[0]), fetched[1])
+
+    def inline_policy(self, document):
+        digest = hashlib.sha256(json.dumps(document, sort_keys=True).encode('utf-8')).hexdigest()
+        return self._compile(('inline', digest), document)
+
+    def identity_policies(self, username):
+        """
+        Return (label, PolicyGrants) for every identity policy of the user:
+        managed policies by name, inline ones as 'user/<name>/<policy>' or
+        'group/<name>/<policy>'.
+        """
+        graph = self.graph
+        user = graph.users[username]
+        policies = []
+        for policy_arn in graph.managed_policies_for_user(username):
+            grants = self.managed_policy(policy_arn)
+            if grants is None:
+                print(f"[WARN] No document for policy {policy_arn}; its grants are not evaluated.",
+                      file=sys.stderr)
+                continue
+            policies.append((graph.policy_name(policy_arn), grants))
+        for policy_name, document in user['InlinePolicies'].items():
+            policies.append((f"user/{username}/{policy_name}", self.inline_policy(document)))
+        for group_name in user['Groups']:
+            group = graph.groups.get(group_name)
+            if group:
+                for policy_name, document in group['InlinePolicies'].items():
+                    policies.append((f"group/{group_name}/{policy_name}", self.inline_policy(document)))
+        return policies
+
+    def evaluate(self, username):
+        """
+        Return the UserPermissions of `username`.
+        """
+        catalog = self.catalog
+        policies = self.identity_policies(username)
+
+        allow = allow_conditional = deny = deny_conditional = 0
+        for _, grants in policies:
+            allow |= grants.allow
+            allow_conditional |= grants.allow_conditional
+            deny |= grants.deny
+            deny_conditional |= grants.deny_conditional
+
+        boundary_full, boundary_conditional = catalog.all, 0
+        boundary_arn = self.graph.users[username].get('PermissionsBoundaryArn')
+        if boundary_arn:
+            boundary = self.managed_policy(boundary_arn)
+            if boundary is None:
+                print(f"[WARN] No document for permissions boundary {boundary_arn} of '{username}'; "
+                      f"it is not applied.", file=sys.stderr)
+            else:
+                boundary_full, boundary_conditional = boundary.allow, boundary.allow_conditional
+                deny |= boundary.deny
+                deny_conditional |= boundary.deny_conditional
+
+        granted = (allow | allow_conditional) & (boundary_full | boundary_conditional) & ~deny
+        full = allow & boundary_full & ~deny & ~deny_conditional
+        granted_by = {label: grants.granted & granted for label, grants in policies}
+        return UserPermissions(full, granted & ~full, granted_by)
+
+
+def used_actions(job_details):
+    """
+    Return {service prefix: (service LastAuthenticated epoch, {action: epoch})}
+    from a user's finished ACTION_LEVEL job; action names are lower case and
+    only services with tracked actions have any.
+    """
+    if job_details is None or job_details['JobStatus'] == 'FAILED':
+        return {}
+    used = {}
+    for service in job_details.get('ServicesLastAccessed', []):
+        namespace = service.get('ServiceNamespace', '').lower()
+        tracked = {
+            action.get('ActionName', '').lower(): to_epoch(action.get('LastAccessedTime'))
+            for action in service.get('TrackedActionsLastAccessed') or []
+        }
+        used[namespace] = (to_epoch(service.get('LastAuthenticated')), tracked)
+    return used
+
+
+def tracked_action_names(job_details):
+    """
+    Return the "service:Action" names of the actions a job reports as tracked.
+    """
+    if job_details is None or job_details['JobStatus'] == 'FAILED':
+        return []
+    return [
+        f"{service.get('ServiceNamespace', '')}:{action.get('ActionName', '')}"
+        for service in job_details.get('ServicesLastAccessed', [])
+        for action in service.get('TrackedActionsLastAccessed') or []
+    ]
+
+
+def iter_permission_matrix_rows(evaluator, user_jobs, usernames, levels=LEVELS):
+    """
+    Yield (level, row dict) tuples of the granted-vs-used matrix for every
+    user in `usernames`. `user_jobs` maps username -> the user's ACTION_LEVEL
+    job details; users without one are reported as never having used anything.
+    """
+    catalog = evaluator.catalog
+    for username in usernames:
+        permissions = evaluator.evaluate(username)
+        used = used_actions(user_jobs.get(username))
+        used_mask = indices_mask([
+            catalog.index[f"{namespace}:{action}"]
+            for namespace, (_, tracked) in used.items()
+            for action, last_accessed in tracked.items()
+            if last_accessed is not None and f"{namespace}:{action}" in catalog.index
+        ])
+
+        if 'service' in levels:
+            ranges = catalog.service_ranges()
+            granted_all, conditional_all = permissions.granted, permissions.conditional
+            for service in dict.fromkeys(list(ranges) + list(used)):
+                # Shift the service's slice down so the per-service masks stay small
+                lo, hi = ranges.get(service, (0, 0))
+                width = (1 << (hi - lo)) - 1
+                granted = (granted_all >> lo) & width
+                last_authenticated, tracked = used.get(service, (None, {}))
+                if not granted and last_authenticated is None:
+                    continue
+                tracked_granted = tracked_used = 0
+                for action, last_accessed in tracked.items():
+                    i = catalog.index.get(f"{service}:{action}")
+                    if i is not None and (granted >> (i - lo)) & 1:
+                        tracked_granted += 1
+                        tracked_used += last_accessed is not None
+                yield 'service', {
+                    "UserName": username,
+                    "Service": service,
+                    "GrantedActions": _count(granted),
+                    "ConditionalActions": _count((conditional_all >> lo) & width),
+                    "TrackedActions": tracked_granted,
+                    "UsedActions": tracked_used,
+                    "UnusedActions": tracked_granted - tracked_used,
+                    "LastAccessed": format_timestamp(last_authenticated),
+                }
+
+        if 'action' in levels:
+            granted_by = {}
+            for label, mask in permissions.granted_by.items():
+                for i in iter_bits(mask):
+                    granted_by.setdefault(i, []).append(label)
+
+            full = set(iter_bits(permissions.full))
+            for i in iter_bits(permissions.granted | used_mask):
+                service, action = catalog.keys[i].split(":", 1)
+                if i in full:
+                    access = FULL
+                elif i in granted_by:
+                    access = CONDITIONAL
+                else:
+                    access = NOT_GRANTED
+                tracked = used.get(service, (None, {}))[1]
+                if action in tracked:
+                    last_accessed = format_timestamp(tracked[action])
+                else:
+                    last_accessed = NOT_TRACKED
+                yield 'action', {
+                    "UserName": username,
+                    "Service": service,
+                    "ActionName": catalog.names[i].split(":", 1)[1],
+                    "Access": access,
+                    "GrantedBy": ";".join(granted_by.get(i, ())),
+                    "LastAccessed": last_accessed,
+                }
+
+
+def collect_effective_permissions(usernames=None, catalog_path=None, max_workers=DEFAULT_MAX_WORKERS,
+                                  governor=None, cache=None, session=None, metrics=None):
+    """
+    Load the authorization graph, run one ACTION_LEVEL last accessed job per
+    user (cached under the same keys as --job-mode principal) and build the
+    action catalog extended with every action the policies name literally
+    or IAM reports as tracked.
+
+    Returns (evaluator, usernames, user_jobs) for iter_permission_matrix_rows.
+    """
+    # Imported here: iam_access_report is the heavier pipeline module
+    from iam_access_report import governed_iam_client
+    from iam_metrics import timed_stage
+
+    iam_client = governed_iam_client(governor, session, max_workers, metrics)
+    with timed_stage(metrics, "authorization_graph"):
+        graph = load_authorization_graph(iam_client)
+        user_policy_map = build_user_policy_map(graph, usernames)
+
+    user_arns = {graph.users[username]['Arn']: username for username in user_policy_map}
+    with timed_stage(metrics, "last_accessed_jobs"):
+        jobs = run_last_accessed_jobs(
+            iam_client,
+            list(user_arns),
+            JOB_GRANULARITY,
+            max_workers=max_workers,
+            cache=cache,
+            versions={arn: principal_version(graph, username) for arn, username in user_arns.items()},
+            metrics=metrics
+        )
+    user_jobs = {user_arns[arn]: job_details for arn, job_details in jobs}
+
+    with timed_stage(metrics, "action_catalog"):
+        documents = [policy['Document'] for policy in graph.policies.values()]
+        for principal in list(graph.users.values()) + list(graph.groups.values()):
+            documents.extend(principal['InlinePolicies'].values())
+        extra_actions = literal_actions(documents)
+        for job_details in user_jobs.values():
+            extra_actions.update(tracked_action_names(job_details))
+        catalog = load_action_catalog(catalog_path, extra_actions)
+
+    return EffectivePermissionEvaluator(graph, catalog, iam_client), list(user_policy_map), user_jobs
+
+
+def default_output_name(level):
+    """
+    Timestamped base name used when --output is not given.
+    """
+    from iam_access_report import default_output_name as report_output_name
+    return report_output_name(level, prefix="iam-effective-permissions")
+
+
+def build_parser(prog=None):
+    from iam_access_report import (
+        add_cache_arguments,
+        add_metrics_arguments,
+        add_output_arguments,
+        add_rate_arguments,
+        add_target_arguments,
+    )
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Evaluate the policies of IAM users into their effective permissions and report "
+                    "them next to what IAM saw used (a granted-vs-used matrix)."
+    )
+    add_target_arguments(parser)
+    add_output_arguments(parser, "action", views="Matrix view(s) to produce")
+    parser.add_argument(
+        "--action-catalog",
+        metavar="FILE",
+        help="Action catalog to evaluate wildcards against: a JSON list or one 'service:Action' per "
+             "line (default: derived from the botocore service models)"
+    )
+    add_rate_arguments(parser)
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser
+
+
+def main(argv=None, prog=None):
+    from iam_access_report import (
+        output_names,
+        rate_governor,
+        requested_usernames,
+        result_cache_options,
+        run_with_metrics,
+    )
+
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+
+    governor = rate_governor(parser, args)
+    if args.action_catalog and not os.path.isfile(args.action_catalog):
+        parser.error(f"action catalog {args.action_catalog} not found")
+
+    usernames = requested_usernames(args)
+    levels = LEVELS if args.level == "both" else (args.level,)
+    outputs = output_names(args, levels, default_output_name)
+
+    cache_options = result_cache_options(args)
+    cache = ResultCache(**cache_options) if cache_options is not None else None
+    try:
+        run_with_metrics(args, lambda metrics: run_matrix(args, levels, outputs, usernames, governor, cache, metrics))
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def run_matrix(args, levels, outputs, usernames, governor, cache, metrics=None):
+    """
+    Collect the inputs and stream the matrix of every level in `levels` into
+    the --format writers of `outputs`.
+    """
+    evaluator, usernames, user_jobs = collect_effective_permissions(
+        usernames,
+        catalog_path=args.action_catalog,
+        max_workers=args.max_workers,
+        governor=governor,
+        cache=cache,
+        metrics=metrics
+    )
+    print(f"[INFO] Evaluating {len(usernames)} users against {len(evaluator.catalog)} actions")
+
+    # Opened only now, so a failed collection leaves no empty output files behind
+    writers = {level: [] for level in levels}
+    try:
+        for level in levels:
+            for fmt in args.format:
+                writer = open_writer(fmt, output_path(outputs[level], fmt))
+                if writer:
+                    if metrics is not None:
+                        writer = TimedWriter(writer, metrics, fmt, level)
+                    writers[level].append(writer)
+
+        with timed_stage(metrics, "rows_and_export"):
+            for level, row in iter_permission_matrix_rows(evaluator, user_jobs, usernames, levels):
+                for writer in writers[level]:
+                    writer.write(row)
+    finally:
+        for level_writers in writers.values():
+            for writer in level_writers:
+                writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Simulated IAM backend for offline benchmarks.
+
+SyntheticAccount generates a reproducible account with any number of users,
+groups and managed policies. FakeIAMBackend serves the IAM operations the
+report pipeline uses from that account:
+
+- get_account_authorization_details, paged by MaxItems/Marker
+- generate_service_last_accessed_details, with jobs that complete after a
+  configurable latency
+- get_service_last_accessed_details, paged by MaxItems/Marker
+
+It can also throttle: calls beyond `throttle_rps` per second fail with a
+Throttling error, like IAM does.
+
+The backend can be used in two ways. As an in-process client, through
+FakeIAMSession, it costs almost nothing, so the pipeline itself is measured.
+Through FakeIAMServer, a local HTTP endpoint that speaks the IAM query
+protocol, real boto3 clients exercise botocore's serialization, parsing,
+retries and event hooks. Nothing ever leaves the machine.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote
+from xml.sax.saxutils import escape
+
+import boto3
+import botocore.session
+from botocore.exceptions import ClientError
+
+
+ACCOUNT_ID = "123456789012"
+IAM_XML_NAMESPACE = "https://iam.amazonaws.com/doc/2010-05-08/"
+DEFAULT_PAGE_SIZE = 100
+
+
+class SyntheticAccount:
+    """
+    A reproducible synthetic account.
+
+    Users are attached to `policies_per_user` managed policies directly and
+    belong to `groups_per_user` groups, each with `policies_per_group`
+    policies. Every policy allows `services_per_policy` services, each with
+    `actions_per_service` tracked actions. About `used_fraction` of all
+    services and actions have a last accessed time; the rest were never used.
+    """
+
+    def __init__(self, users=1000, groups=50, policies=300, policies_per_user=3, groups_per_user=2,
+                 policies_per_group=3, services=60, services_per_policy=4, actions_per_service=5,
+                 used_fraction=0.5, seed=0):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.used_fraction = used_fraction
+        self.actions_per_service = actions_per_service
+        self.now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+        self.services = [(f"Synthetic Service {i}", f"svc{i}") for i in range(services)]
+        self.policies = {}
+        for i in range(policies):
+            arn = f"arn:aws:iam::{ACCOUNT_ID}:policy/synthetic-policy-{i}"
+            allowed = rng.sample(range(services), min(services_per_policy, services))
+            self.policies[arn] = {
+                "PolicyName": f"synthetic-policy-{i}",
+                "Services": allowed,
+                "Document": {
+                    "Version": "2012-10-17",
+                    "Statement": [{
+                        "Effect": "Allow",
+                        "Action": [f"{self.services[s][1]}:*" for s in allowed],
+                        "Resource": "*",
+                    }],
+                },
+            }
+        policy_arns = list(self.policies)
+
+        self.groups = {}
+        for i in range(groups):
+            self.groups[f"synthetic-group-{i}"] = {
+                "Arn": f"arn:aws:iam::{ACCOUNT_ID}:group/synthetic-group-{i}",
+                "Policies": rng.sample(policy_arns, min(policies_per_group, policies)),
+            }
+        group_names = list(self.groups)
+
+        self.users = {}
+        for i in range(users):
+            self.users[f"synthetic-user-{i}"] = {
+                "Arn": f"arn:aws:iam::{ACCOUNT_ID}:user/synthetic-user-{i}",
+                "Policies": rng.sample(policy_arns, min(policies_per_user, policies)),
+                "Groups": rng.sample(group_names, min(groups_per_user, groups)),
+            }
+        self._user_arns = {user["Arn"]: name for name, user in self.users.items()}
+
+    def authorization_details(self):
+        """
+        Return every item get_account_authorization_details would list, as
+        (list key, item) pairs in response order.
+        """
+        items = []
+        for name, user in self.users.items():
+            items.append(("UserDetailList", {
+                "UserName": name,
+                "UserId": name.upper(),
+                "Arn": user["Arn"],
+                "Path": "/",
+                "CreateDate": self.now,
+                "GroupList": user["Groups"],
+                "AttachedManagedPolicies": [
+                    {"PolicyName": self.policies[arn]["PolicyName"], "PolicyArn": arn} for arn in user["Policies"]
+                ],
+            }))
+        for name, group in self.groups.items():
+            items.append(("GroupDetailList", {
+                "GroupName": name,
+                "GroupId": name.upper(),
+                "Arn": group["Arn"],
+                "Path": "/",
+                "CreateDate": self.now,
+                "AttachedManagedPolicies": [
+                    {"PolicyName": self.policies[arn]["PolicyName"], "PolicyArn": arn} for arn in group["Policies"]
+                ],
+            }))
+        for arn, policy in self.policies.items():
+            items.append(("Policies", {
+                "PolicyName": policy["PolicyName"],
+                "PolicyId": policy["PolicyName"].upper(),
+                "Arn": arn,
+                "Path": "/",
+                "DefaultVersionId": "v1",
+                "AttachmentCount": 1,
+                "IsAttachable": True,
+                "CreateDate": self.now,
+                "UpdateDate": self.now,
+                "PolicyVersionList": [{
+                    "Document": policy["Document"],
+                    "VersionId": "v1",
+                    "IsDefaultVersion": True,
+                    "CreateDate": self.now,
+                }],
+            }))
+        return items
+
+    def _services_for(self, arn):
+        if arn in self.policies:
+            return self.policies[arn]["Services"]
+        user = self.users[self._user_arns[arn]]
+        arns = list(user["Policies"])
+        for group_name in user["Groups"]:
+            arns.extend(self.groups[group_name]["Policies"])
+        return sorted({s for policy_arn in arns for s in self.policies[policy_arn]["Services"]})
+
+    def services_last_accessed(self, arn, granularity):
+        """
+        Return the ServicesLastAccessed list of a finished job for `arn` (a
+        policy or user ARN). Results are the same on every call.
+        """
+        rng = random.Random(zlib.crc32(f"{self.seed}:{arn}".encode("utf-8")))
+
+        def last_used():
+            if rng.random() < self.used_fraction:
+                return self.now - timedelta(days=rng.randint(0, 400), seconds=rng.randint(0, 86399))
+            return None
+
+        services = []
+        for index in self._services_for(arn):
+            name, namespace = self.services[index]
+            service = {"ServiceName": name, "ServiceNamespace": namespace, "TotalAuthenticatedEntities": 0}
+            last_authenticated = last_used()
+            if last_authenticated:
+                service["LastAuthenticated"] = last_authenticated
+                service["LastAuthenticatedEntity"] = arn
+                service["TotalAuthenticatedEntities"] = 1
+            if granularity == "ACTION_LEVEL":
+                actions = []
+                for a in range(self.actions_per_service):
+                    action = {"ActionName": f"Action{a}"}
+                    last_accessed = last_used() if last_authenticated else None
+                    if last_accessed:
+                        action["LastAccessedTime"] = last_accessed
+                        action["LastAccessedEntity"] = arn
+                        action["LastAccessedRegion"] = "us-east-1"
+                    actions.append(action)
+                service["TrackedActionsLastAccessed"] = actions
+            services.append(service)
+        return services
+
+
+def _throttling_error(operation_name):
+    return ClientError(
+        {"Error": {"Code": "Throttling", "Message": "Rate exceeded"}, "ResponseMetadata": {"HTTPStatusCode": 400}},
+        operation_name
+    )
+
+
+class FakeIAMBackend:
+    """
+    The subset of the IAM API used by the report pipeline, served from a
+    SyntheticAccount.
+
+    `job_latency` is how long (in seconds) a job stays IN_PROGRESS.
+    `page_size` is the default MaxItems of paged calls. With `throttle_rps`,
+    calls beyond that many per second raise a Throttling ClientError.
+    `calls` counts calls (including throttled ones) per API operation, and
+    `throttled` counts the throttled ones.
+    """
+
+    def __init__(self, account, job_latency=0.2, page_size=DEFAULT_PAGE_SIZE, throttle_rps=None):
+        self.account = account
+        self.job_latency = job_latency
+        self.page_size = page_size
+        self.throttle_rps = throttle_rps
+        self.calls = {}
+        self.throttled = 0
+        self._jobs = {}
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._authorization_details = None
+        self._window = (0, 0)
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls = {}
+            self.throttled = 0
+
+    def _call(self, operation_name):
+        with self._lock:
+            self.calls[operation_name] = self.calls.get(operation_name, 0) + 1
+            if not self.throttle_rps:
+                return
+            second = int(time.monotonic())
+            window_second, count = self._window
+            count = count + 1 if window_second == second else 1
+            self._window = (second, count)
+            if count > self.throttle_rps:
+                self.throttled += 1
+                raise _throttling_error(operation_name)
+
+    @staticmethod
+    def _page(items, marker, max_items):
+        start = int(marker or 0)
+        end = start + max_items
+        page = {"IsTruncated": end < len(items)}
+        if page["IsTruncated"]:
+            page["Marker"] = str(end)
+        return items[start:end], page
+
+    def get_account_authorization_details(self, Filter=None, MaxItems=None, Marker=None):
+        self._call("GetAccountAuthorizationDetails")
+        if self._authorization_details is None:
+            self._authorization_details = self.account.authorization_details()
+        items, response = self._page(self._authorization_details, Marker, MaxItems or self.page_size)
+        for key in ("UserDetailList", "GroupDetailList", "RoleDetailList", "Policies"):
+            response[key] = []
+        for key, item in items:
+            response[key].append(item)
+        return response
+
+    def generate_service_last_accessed_details(self, Arn, Granularity="SERVICE_LEVEL"):
+        self._call("GenerateServiceLastAccessedDetails")
+        job_id = str(uuid.UUID(int=next(self._job_ids)))
+        with self._lock:
+            self._jobs[job_id] = (Arn, Granularity, time.monotonic(), datetime.now(timezone.utc))
+        return {"JobId": job_id}
+
+    def get_service_last_accessed_details(self, JobId, MaxItems=None, Marker=None):
+        self._call("GetServiceLastAccessedDetails")
+        job = self._jobs.get(JobId)
+        if job is None:
+            raise ClientError(
+                {"Error": {"Code": "NoSuchEntity", "Message": f"Job {JobId} not found"}},
+                "GetServiceLastAccessedDetails"
+            )
+        arn, granularity, started, created = job
+        response = {"JobType": granularity, "JobCreationDate": created}
+        if time.monotonic() - started < self.job_latency:
+            response.update(JobStatus="IN_PROGRESS", ServicesLastAccessed=[], IsTruncated=False)
+            return response
+
+        services = self.account.services_last_accessed(arn, granularity)
+        page, paging = self._page(services, Marker, MaxItems or self.page_size)
+        response.update(
+            paging,
+            JobStatus="COMPLETED",
+            JobCompletionDate=created + timedelta(seconds=self.job_latency),
+            ServicesLastAccessed=page,
+        )
+        return response
+
+
+class FakeIAMSession:
+    """
+    Stand-in for a boto3 Session whose IAM clients are `backend` itself; pass
+    it as `session` to the report pipeline.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def client(self, service_name, config=None, **kwargs):
+        return self.backend
+
+
+# --- Local HTTP endpoint --------------------------------------------------------------------
+
+_service_model = None
+
+
+def _iam_model():
+    global _service_model
+    if _service_model is None:
+        _service_model = botocore.session.get_session().get_service_model("iam")
+    return _service_model
+
+
+def _xml_value(shape, value, out):
+    """
+    Append `value` to `out` as IAM query-protocol XML for botocore `shape`.
+    """
+    if shape.type_name == "structure":
+        for name, member in shape.members.items():
+            if name in value and value[name] is not None:
+                out.append(f"<{name}>")
+                _xml_value(member, value[name], out)
+                out.append(f"</{name}>")
+    elif shape.type_name == "list":
+        for item in value:
+            out.append("<member>")
+            _xml_value(shape.member, item, out)
+            out.append("</member>")
+    elif shape.type_name == "timestamp":
+        out.append(value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"))
+    elif shape.type_name == "boolean":
+        out.append("true" if value else "false")
+    elif isinstance(value, (dict, list)):
+        # Policy documents travel as URL-encoded JSON strings
+        out.append(escape(quote(json.dumps(value))))
+    else:
+        out.append(escape(str(value)))
+
+
+def _xml_response(operation_name, response):
+    output_shape = _iam_model().operation_model(operation_name).output_shape
+    out = [f'<{operation_name}Response xmlns="{IAM_XML_NAMESPACE}"><{operation_name}Result>']
+    _xml_value(output_shape, response, out)
+    out.append(f"</{operation_name}Result><ResponseMetadata><RequestId>{uuid.uuid4()}</RequestId>"
+               f"</ResponseMetadata></{operation_name}Response>")
+    return "".join(out).encode("utf-8")
+
+
+def _xml_error(code, message):
+    return (f'<ErrorResponse xmlns="{IAM_XML_NAMESPACE}"><Error><Type>Sender</Type><Code>{escape(code)}</Code>'
+            f"<Message>{escape(message)}</Message></Error><RequestId>{uuid.uuid4()}</RequestId>"
+            f"</ErrorResponse>").encode("utf-8")
+
+
+_OPERATIONS = {
+    "GetAccountAuthorizationDetails": ("get_account_authorization_details", ("Marker", "MaxItems")),
+    "GenerateServiceLastAccessedDetails": ("generate_service_last_accessed_details", ("Arn", "Granularity")),
+    "GetServiceLastAccessedDetails": ("get_service_last_accessed_details", ("JobId", "Marker", "MaxItems")),
+}
+
+
+class _IAMRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        params = {k: v[0] for k, v in parse_qs(body).items()}
+        action = params.get("Action")
+        if action not in _OPERATIONS:
+            return self._send(400, _xml_error("InvalidAction", f"{action} is not supported by the fake backend"))
+
+        method_name, argument_names = _OPERATIONS[action]
+        kwargs = {name: params[name] for name in argument_names if name in params}
+        if "MaxItems" in kwargs:
+            kwargs["MaxItems"] = int(kwargs["MaxItems"])
+        try:
+            response = getattr(self.server.backend, method_name)(**kwargs)
+        except ClientError as e:
+            error = e.response["Error"]
+            return self._send(400 if error["Code"] != "NoSuchEntity" else 404, _xml_error(error["Code"], error["Message"]))
+        self._send(200, _xml_response(action, response))
+
+    def _send(self, status, payload):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _EndpointSession:
+    """
+    A boto3 Session whose IAM clients talk to a local endpoint with dummy
+    credentials.
+    """
+
+    def __init__(self, endpoint_url):
+        self.endpoint_url = endpoint_url
+        self._session = boto3.Session(
+            aws_access_key_id="AKIDBENCHMARK",
+            aws_secret_access_key="benchmark",
+            region_name="us-east-1"
+        )
+
+    def client(self, service_name, config=None, **kwargs):
+        return self._session.client(service_name, config=config, endpoint_url=self.endpoint_url, **kwargs)
+
+
+class FakeIAMServer:
+    """
+    Serve `backend` over HTTP on 127.0.0.1 (an ephemeral port) in a
+    background thread. Use as a context manager; session() returns a
+    boto3-compatible session whose IAM clients use the local endpoint.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _IAMRequestHandler)
+        self._server.daemon_threads = True
+        self._server.backend = backend
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def endpoint_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def session(self):
+        return _EndpointSession(self.endpoint_url)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,692 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Indexed SQLite history of report runs.
+
+Every run appends its rows to one store, so questions such as "which users
+have permissions they have not used in 90 days" or "who used PassRole last
+month" are answered with an indexed query instead of by grepping dated CSV
+files.
+
+Daily snapshots of the same account are mostly identical, so rows are not
+copied per run. Each distinct permission (account, user, policy, service,
+action) is stored once in `grants`, and `observations` records intervals
+of runs during which the permission existed with a given LastAccessed:
+
+- an unchanged row costs nothing;
+- a new permission, or a new LastAccessed, opens a new observation (and
+  closes the previous one);
+- a permission that is missing from a run that covered its user closes its
+  open observation, including every permission of a covered user that has
+  no rows left.
+
+The state as of any run is then "observations opened at or before it and not
+closed by then". Names are dictionary-encoded in `names`, and there are
+indexes on user, policy, service, action and LastAccessed. Years of daily
+runs stay small, and queries take milliseconds.
+
+The (service, action) index on `grants` also serves as the reverse index for
+incident response: who_used() answers "every principal and policy that used
+kms:Decrypt or s3:DeleteObject since D" from the grants of those actions
+alone. Job-based rows name services by display name, so the namespace of
+each service ("kms" for "AWS Key Management Service") is recorded from the
+job results of each run, in every job mode (service_namespaces and
+record_service_namespaces).
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+from iam_report_rows import ACCOUNT_FIELD, ACTION_FIELDS, SERVICE_FIELDS, ReportRow, format_timestamp
+from iam_result_cache import default_cache_path
+
+
+SCHEMA_VERSION = 1
+COMMIT_INTERVAL = 50000
+NO_ACTION = ""
+
+HISTORY_SERVICE_FIELDS = (ACCOUNT_FIELD,) + SERVICE_FIELDS
+HISTORY_ACTION_FIELDS = (ACCOUNT_FIELD,) + ACTION_FIELDS
+RUN_FIELDS = ("RunId", "CollectedAt", "Level", "AccountId", "Rows")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    collected_at INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY,
+    value TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS grants (
+    id INTEGER PRIMARY KEY,
+    level TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    policy_arn_id INTEGER NOT NULL,
+    policy_name_id INTEGER NOT NULL,
+    service_id INTEGER NOT NULL,
+    action_id INTEGER NOT NULL,
+    UNIQUE (level, account_id, user_id, policy_arn_id, service_id, action_id)
+);
+CREATE INDEX IF NOT EXISTS grants_user ON grants (user_id);
+CREATE INDEX IF NOT EXISTS grants_policy ON grants (policy_arn_id);
+CREATE INDEX IF NOT EXISTS grants_service_action ON grants (service_id, action_id);
+CREATE INDEX IF NOT EXISTS grants_action ON grants (action_id);
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    grant_id INTEGER NOT NULL,
+    first_run INTEGER NOT NULL,
+    closed_run INTEGER,
+    last_accessed INTEGER
+);
+CREATE INDEX IF NOT EXISTS observations_grant ON observations (grant_id, first_run);
+CREATE INDEX IF NOT EXISTS observations_open ON observations (grant_id) WHERE closed_run IS NULL;
+CREATE INDEX IF NOT EXISTS observations_last_accessed ON observations (last_accessed);
+CREATE TABLE IF NOT EXISTS service_namespaces (
+    namespace TEXT NOT NULL,
+    service_id INTEGER NOT NULL,
+    PRIMARY KEY (namespace, service_id)
+);
+"""
+
+
+def default_history_path():
+    """
+    Return the default history store, next to the result cache.
+    """
+    return os.path.join(os.path.dirname(default_cache_path()), "history.sqlite")
+
+
+def parse_date(value):
+    """
+    argparse type for dates: YYYY-MM-DD or a full ISO 8601 timestamp, as
+    epoch seconds (UTC unless the value has an offset).
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}; use YYYY-MM-DD or ISO 8601")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def service_namespaces(job_results):
+    """
+    The (namespace, ServiceName) pairs of every service named in
+    `job_results` (last accessed job responses), for
+    HistoryStore.record_service_namespaces.
+    """
+    return {
+        (service['ServiceNamespace'].lower(), service['ServiceName'])
+        for job_details in job_results if job_details
+        for service in job_details.get('ServicesLastAccessed', [])
+        if service.get('ServiceNamespace') and service.get('ServiceName')
+    }
+
+
+class HistoryStore:
+    """
+    The SQLite store; see the module docstring for the layout. Rows are
+    appended through writer(), and the query methods yield row dicts.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_history_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+        self._conn.commit()
+        self._names = {}
+
+    def name_id(self, value):
+        """
+        Return the id of a dictionary-encoded name, adding it if it is new.
+        """
+        name_id = self._names.get(value)
+        if name_id is None:
+            row = self._conn.execute("SELECT id FROM names WHERE value = ?", (value,)).fetchone()
+            if row is None:
+                name_id = self._conn.execute("INSERT INTO names (value) VALUES (?)", (value,)).lastrowid
+            else:
+                name_id = row[0]
+            self._names[value] = name_id
+        return name_id
+
+    def _lookup_name(self, value):
+        """
+        Return the id of an existing name (matched exactly, then ignoring
+        case), or None; never adds one.
+        """
+        row = self._conn.execute("SELECT id FROM names WHERE value = ?", (value,)).fetchone()
+        if row is None:
+            row = self._conn.execute("SELECT id FROM names WHERE value = ? COLLATE NOCASE", (value,)).fetchone()
+        return row[0] if row else None
+
+    def writer(self, level, collected_at=None):
+        """
+        Start a run of `level` rows and return a HistoryWriter for it.
+        """
+        return HistoryWriter(self, level, collected_at)
+
+    def record(self, rows, level="action", collected_at=None, usernames=None, account_id=""):
+        """
+        Append a run from ReportRow objects grouped by user, such as the rows
+        of generate_users_permissions_report(), covering `usernames` of
+        `account_id` (every user when None; see HistoryWriter.cover).
+        Returns the rows recorded.
+        """
+        writer = self.writer(level, collected_at)
+        for row in rows:
+            writer.write(row)
+        writer.cover(account_id, usernames)
+        writer.close()
+        return writer.rows_written
+
+    def record_service_namespaces(self, namespaces):
+        """
+        Remember the IAM namespace of services from (namespace, ServiceName)
+        pairs (see service_namespaces), so "kms:Decrypt" finds the rows whose
+        ServiceName is "AWS Key Management Service".
+        """
+        if not namespaces:
+            return
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO service_namespaces VALUES (?, ?)",
+            [(namespace, self.name_id(name)) for namespace, name in namespaces]
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    # -- queries ----------------------------------------------------------
+
+    def runs(self):
+        """
+        Yield every recorded run, oldest first.
+        """
+        for run_id, collected_at, level, account_id, rows in self._conn.execute(
+            "SELECT id, collected_at, level, account_id, rows FROM runs ORDER BY id"
+        ):
+            yield dict(zip(RUN_FIELDS, (run_id, format_timestamp(collected_at), level, account_id, rows)))
+
+    def _as_of_run(self, as_of):
+        """
+        Return the id of the last run collected at or before `as_of` (epoch
+        seconds; the latest run when None), or 0 if there is none.
+        """
+        if as_of is None:
+            row = self._conn.execute("SELECT MAX(id) FROM runs").fetchone()
+        else:
+            row = self._conn.execute("SELECT MAX(id) FROM runs WHERE collected_at <= ?", (as_of,)).fetchone()
+        return row[0] or 0
+
+    def service_ids(self, service):
+        """
+        Return the ids of the services called `service`: by the name rows
+        carry (a display name from the last accessed jobs, the IAM prefix in
+        CloudTrail mode) or by a namespace recorded with
+        record_service_namespaces().
+        """
+        ids = set()
+        name_id = self._lookup_name(service)
+        if name_id is not None:
+            ids.add(name_id)
+        ids.update(service_id for (service_id,) in self._conn.execute(
+            "SELECT service_id FROM service_namespaces WHERE namespace = ? COLLATE NOCASE", (service,)
+        ))
+        return ids
+
+    def _action_clause(self, actions):
+        """
+        Build one clause matching any of `actions`, each "Action" or
+        "prefix:Action". Returns (None, None) when none can match.
+        """
+        terms, params = [], []
+        for action in actions:
+            service, _, action_name = action.rpartition(":")
+            action_id = self._lookup_name(action_name)
+            if action_id is None:
+                continue
+            service_ids = self.service_ids(service) if service else ()
+            if service and not service_ids:
+                print(f"[WARN] Service '{service}' is not known to the history; matching {action_name} "
+                      f"in every service.", file=sys.stderr)
+            if service_ids:
+                terms.append(f"(g.action_id = ? AND g.service_id IN ({', '.join('?' * len(service_ids))}))")
+                params += [action_id] + sorted(service_ids)
+            else:
+                terms.append("g.action_id = ?")
+                params.append(action_id)
+        if not terms:
+            return None, None
+        return "(" + " OR ".join(terms) + ")", params
+
+    def _filters(self, user=None, policy=None, service=None, action=None, level="action", account_id=None):
+        """
+        Build the WHERE clauses and parameters shared by the queries. Unknown
+        names can match nothing, which is answered without touching the rows.
+        `action` is one action or a list of them, see _action_clause.
+        """
+        clauses, params = ["g.level = ?"], [level]
+        if account_id is not None:
+            clauses.append("g.account_id = ?")
+            params.append(account_id)
+        # Policies may be given by ARN or by name
+        policy_column = "policy_arn_id" if policy is not None and policy.startswith("arn:") else "policy_name_id"
+        for column, value in (("user_id", user), (policy_column, policy)):
+            if value is None:
+                continue
+            name_id = self._lookup_name(value)
+            if name_id is None:
+                return None, None
+            clauses.append(f"g.{column} = ?")
+            params.append(name_id)
+        if service is not None:
+            service_ids = self.service_ids(service)
+            if not service_ids:
+                return None, None
+            clauses.append(f"g.service_id IN ({', '.join('?' * len(service_ids))})")
+            params += sorted(service_ids)
+        if action is not None:
+            clause, action_params = self._action_clause([action] if isinstance(action, str) else action)
+            if clause is None:
+                return None, None
+            clauses.append(clause)
+            params += action_params
+        return clauses, params
+
+    def _select(self, clauses, params, order, level, distinct=False, latest=False):
+        """
+        Run a query over observations joined to their grants and yield row
+        dicts. With `latest`, each grant appears once, with its most recent
+        LastAccessed among the matching observations.
+        """
+        last_accessed = "MAX(o.last_accessed)" if latest else "o.last_accessed"
+        sql = f"""
+            SELECT {'DISTINCT' if distinct else ''} g.account_id, u.value, pn.value, pa.value, s.value, a.value,
+                   {last_accessed}
+            FROM observations o
+            JOIN grants g ON g.id = o.grant_id
+            JOIN names u ON u.id = g.user_id
+            JOIN names pn ON pn.id = g.policy_name_id
+            JOIN names pa ON pa.id = g.policy_arn_id
+            JOIN names s ON s.id = g.service_id
+            JOIN names a ON a.id = g.action_id
+            WHERE {' AND '.join(clauses)}
+            {'GROUP BY g.id' if latest else ''}
+            ORDER BY {order}
+        """
+        # AccountId is only a column once a multi-account run has been recorded
+        start = 0 if self._conn.execute("SELECT 1 FROM runs WHERE account_id != '' LIMIT 1").fetchone() else 1
+        fields = HISTORY_SERVICE_FIELDS if level == "service" else HISTORY_ACTION_FIELDS
+        for values in self._conn.execute(sql, params):
+            values = values[:len(fields) - 1] + (format_timestamp(values[6]),)
+            yield dict(zip(fields[start:], values[start:]))
+
+    def unused(self, days, as_of=None, now=None, level="action", **filters):
+        """
+        Yield the permissions that existed as of `as_of` (the latest run when
+        None) and had not been used for `days` days at that time, including
+        those never used. `filters` are user, policy (ARN or name), service,
+        action, level and account_id.
+        """
+        run_id = self._as_of_run(as_of)
+        clauses, params = self._filters(level=level, **filters)
+        if clauses is None or not run_id:
+            return
+        cutoff = (as_of if as_of is not None else (now or time.time())) - days * 86400
+        if run_id == self._as_of_run(None):
+            # The state after the latest run is exactly the open observations
+            clauses.append("o.closed_run IS NULL")
+        else:
+            clauses += ["o.first_run <= ?", "(o.closed_run IS NULL OR o.closed_run > ?)"]
+            params += [run_id, run_id]
+        clauses.append("(o.last_accessed IS NULL OR o.last_accessed < ?)")
+        params.append(cutoff)
+        yield from self._select(clauses, params, "u.value, pn.value, s.value, a.value", level)
+
+    def used(self, since=None, until=None, level="action", **filters):
+        """
+        Yield every recorded use with a LastAccessed between `since` and
+        `until` (epoch seconds, either may be None), newest first, across all
+        runs. `filters` are as for unused().
+        """
+        clauses, params = self._filters(level=level, **filters)
+        if clauses is None:
+            return
+        clauses.append("o.last_accessed IS NOT NULL")
+        if since is not None:
+            clauses.append("o.last_accessed >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("o.last_accessed < ?")
+            params.append(until)
+        # A permission detached and attached again may repeat a use
+        yield from self._select(clauses, params, "o.last_accessed DESC, u.value", level, distinct=True)
+
+
+    def who_used(self, actions, since=None, until=None, **filters):
+        """
+        The reverse lookup: yield one row per principal, policy and action
+        that used any of `actions` ("prefix:Action" or "Action") between
+        `since` and `until`, with its latest use in that window, by action and
+        then newest first. `filters` are user, policy and account_id.
+        """
+        clauses, params = self._filters(action=list(actions), **filters)
+        if clauses is None:
+            return
+        clauses.append("o.last_accessed IS NOT NULL")
+        if since is not None:
+            clauses.append("o.last_accessed >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("o.last_accessed < ?")
+            params.append(until)
+        yield from self._select(clauses, params, "s.value, a.value, MAX(o.last_accessed) DESC, u.value", "action",
+                                latest=True)
+
+
+class HistoryWriter:
+    """
+    Report writer that appends one run's rows to a HistoryStore. It accepts
+    the ReportRow stream of a report (rows arrive user by user) and can sit
+    next to the file writers of a run.
+
+    For each user only that user's open observations are loaded, so memory
+    stays proportional to the largest user, not to the account. Users that
+    write no rows at all (every policy detached, or the user deleted) are
+    only known from cover(), which the caller invokes once an account's rows
+    are complete.
+    """
+    label = "History"
+
+    def __init__(self, store, level, collected_at=None):
+        self.store = store
+        self.level = level
+        self.output_file = store.path
+        self.rows_written = 0
+        self._conn = store._conn
+        self.collected_at = int(collected_at or time.time())
+        self._runs = {}
+        self._counts = {}
+        self._user = None
+        self._open = {}
+        self._seen = set()
+        self._users_written = set()
+        self._pending = 0
+
+    def _run_id(self, account_id):
+        # One run per account, so a multi-account run can be queried per account
+        run_id = self._runs.get(account_id)
+        if run_id is None:
+            run_id = self._conn.execute(
+                "INSERT INTO runs (collected_at, level, account_id) VALUES (?, ?, ?)",
+                (self.collected_at, self.level, account_id)
+            ).lastrowid
+            self._runs[account_id] = run_id
+        return run_id
+
+    def _start_user(self, account_id, user_id):
+        self._finish_user()
+        self._user = (account_id, user_id)
+        self._open = {
+            (policy_arn_id, service_id, action_id): (grant_id, observation_id, last_accessed)
+            for grant_id, policy_arn_id, service_id, action_id, observation_id, last_accessed in self._conn.execute(
+                """
+                SELECT g.id, g.policy_arn_id, g.service_id, g.action_id, o.id, o.last_accessed
+                FROM grants g JOIN observations o ON o.grant_id = g.id AND o.closed_run IS NULL
+                WHERE g.level = ? AND g.account_id = ? AND g.user_id = ?
+                """,
+                (self.level, account_id, user_id)
+            )
+        }
+        self._seen = set()
+        self._users_written.add(self._user)
+
+    def _finish_user(self):
+        if self._user is None:
+            return
+        run_id = self._runs[self._user[0]]
+        gone = [(run_id, observation_id) for key, (_, observation_id, _) in self._open.items() if key not in self._seen]
+        self._conn.executemany("UPDATE observations SET closed_run = ? WHERE id = ?", gone)
+        self._user = None
+
+    def cover(self, account_id, usernames=None):
+        """
+        Record that this run covered `usernames` of `account_id` (every user
+        of the account when None), and end the open observations of those
+        that wrote no rows. Call it only after all of the account's rows have
+        been written: a user without rows is taken to have no permissions.
+        """
+        self._finish_user()
+        account_id = account_id or ""
+        run_id = self._run_id(account_id)
+        if usernames is None:
+            user_ids = [user_id for (user_id,) in self._conn.execute(
+                """
+                SELECT DISTINCT g.user_id
+                FROM grants g JOIN observations o ON o.grant_id = g.id AND o.closed_run IS NULL
+                WHERE g.level = ? AND g.account_id = ?
+                """,
+                (self.level, account_id)
+            )]
+        else:
+            user_ids = [user_id for user_id in map(self.store._lookup_name, usernames) if user_id is not None]
+        self._conn.executemany(
+            """
+            UPDATE observations SET closed_run = ?
+            WHERE closed_run IS NULL AND grant_id IN (
+                SELECT id FROM grants WHERE level = ? AND account_id = ? AND user_id = ?
+            )
+            """,
+            [(run_id, self.level, account_id, user_id) for user_id in user_ids
+             if (account_id, user_id) not in self._users_written]
+        )
+
+    def write(self, row):
+        if not isinstance(row, ReportRow):
+            raise TypeError("the history store records ReportRow objects")
+        store = self.store
+        account_id = row.account_id or ""
+        run_id = self._run_id(account_id)
+        user_id = store.name_id(row.user_name)
+        if self._user != (account_id, user_id):
+            self._start_user(account_id, user_id)
+
+        key = (store.name_id(row.policy_arn), store.name_id(row.service_name),
+               store.name_id(row.action_name or NO_ACTION))
+        self._seen.add(key)
+        self._counts[account_id] = self._counts.get(account_id, 0) + 1
+        current = self._open.get(key)
+        if current is not None and current[2] == row.last_accessed:
+            self.rows_written += 1
+            return
+
+        if current is not None:
+            grant_id = current[0]
+            self._conn.execute("UPDATE observations SET closed_run = ? WHERE id = ?", (run_id, current[1]))
+        else:
+            self._conn.execute(
+                """
+                INSERT OR IGNORE INTO grants
+                    (level, account_id, user_id, policy_arn_id, policy_name_id, service_id, action_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (self.level, account_id, user_id, key[0], store.name_id(row.policy_name), key[1], key[2])
+            )
+            grant_id = self._conn.execute(
+                "SELECT id FROM grants WHERE level = ? AND account_id = ? AND user_id = ? AND policy_arn_id = ? "
+                "AND service_id = ? AND action_id = ?",
+                (self.level, account_id, user_id) + key
+            ).fetchone()[0]
+        observation_id = self._conn.execute(
+            "INSERT INTO observations (grant_id, first_run, last_accessed) VALUES (?, ?, ?)",
+            (grant_id, run_id, row.last_accessed)
+        ).lastrowid
+        self._open[key] = (grant_id, observation_id, row.last_accessed)
+        self.rows_written += 1
+
+        self._pending += 1
+        if self._pending >= COMMIT_INTERVAL:
+            self._conn.commit()
+            self._pending = 0
+
+    def abort(self):
+        """
+        Give up on a run that failed partway. The current user's rows may be
+        incomplete, so nothing is closed for it: what was not committed yet
+        is rolled back and its open observations stay open.
+        """
+        self._conn.rollback()
+        self._user = None
+        print(f"[WARN] History run not completed; {self.output_file} keeps the observations it had.",
+              file=sys.stderr)
+
+    def close(self):
+        self._finish_user()
+        self._conn.executemany(
+            "UPDATE runs SET rows = ? WHERE id = ?",
+            [(self._counts.get(account_id, 0), run_id) for account_id, run_id in self._runs.items()]
+        )
+        self._conn.commit()
+        print(f"[INFO] {self.rows_written} {self.level}-level rows recorded in history {self.output_file}")
+
+
+def print_table(rows, out=None):
+    """
+    Print row dicts as an aligned text table; returns the number of rows.
+    """
+    out = out or sys.stdout
+    rows = list(rows)
+    if not rows:
+        print("[INFO] No matching rows.", file=out)
+        return 0
+    headers = list(rows[0])
+    widths = [max(len(str(h)), *(len(str(row[h])) for row in rows)) for h in headers]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)).rstrip(), file=out)
+    for row in rows:
+        print("  ".join(str(row[h]).ljust(w) for h, w in zip(headers, widths)).rstrip(), file=out)
+    return len(rows)
+
+
+def build_parser(prog=None):
+    from iam_access_report import parse_formats
+    from iam_report_writers import WRITERS
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Query the history of report runs recorded with --history."
+    )
+    parser.add_argument(
+        "--history",
+        metavar="PATH",
+        help=f"History store to query (default: {default_history_path()})"
+    )
+    queries = parser.add_subparsers(dest="query", required=True, metavar="query")
+
+    def add_filters(sub):
+        sub.add_argument("--level", default="action", choices=["service", "action"],
+                         help="Rows to query (default: action)")
+        sub.add_argument("--account", help="Only rows of this account ID")
+        sub.add_argument("--user", help="Only rows of this IAM user")
+        sub.add_argument("--policy", help="Only rows of this policy (ARN or name)")
+        sub.add_argument("--service", help="Only rows of this service, by name as reported "
+                                           "(e.g. 'AWS Identity and Access Management')")
+        sub.add_argument("--action", help="Only rows of this action, e.g. PassRole or iam:PassRole")
+        sub.add_argument("--format", type=parse_formats,
+                         help=f"Write the rows to files in these formats ({', '.join(WRITERS)}) "
+                              "instead of printing a table")
+        sub.add_argument("--output", help="Base name (without extension) for --format files")
+
+    unused = queries.add_parser("unused", help="Permissions not used for N days (including never used)")
+    unused.add_argument("--days", type=int, required=True, help="Days without use")
+    unused.add_argument("--as-of", type=parse_date, metavar="DATE",
+                        help="Evaluate against the last run on or before this date (default: the latest run)")
+    add_filters(unused)
+
+    used = queries.add_parser("used", help="Recorded uses within a time window")
+    used.add_argument("--since", type=parse_date, metavar="DATE", help="Uses on or after this date")
+    used.add_argument("--until", type=parse_date, metavar="DATE", help="Uses before this date")
+    add_filters(used)
+
+    who = queries.add_parser("who", help="Principals and policies that used any of the given actions")
+    who.add_argument("--action", action="append", required=True,
+                     help="Action as prefix:Action (e.g. kms:Decrypt) or Action. May be given more than once.")
+    who.add_argument("--since", type=parse_date, metavar="DATE", help="Uses on or after this date")
+    who.add_argument("--until", type=parse_date, metavar="DATE", help="Uses before this date")
+    who.add_argument("--account", help="Only rows of this account ID")
+    who.add_argument("--user", help="Only rows of this IAM user")
+    who.add_argument("--policy", help="Only rows of this policy (ARN or name)")
+    who.add_argument("--format", type=parse_formats,
+                     help=f"Write the rows to files in these formats ({', '.join(WRITERS)}) "
+                          "instead of printing a table")
+    who.add_argument("--output", help="Base name (without extension) for --format files")
+
+    queries.add_parser("runs", help="List the recorded runs")
+    return parser
+
+
+def main(argv=None, prog=None):
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+
+    path = args.history or default_history_path()
+    if not os.path.isfile(path):
+        parser.error(f"history store {path} not found; record runs with --history first")
+    store = HistoryStore(path)
+
+    try:
+        if args.query == "runs":
+            print_table(store.runs())
+            return
+
+        filters = dict(account_id=args.account, user=args.user, policy=args.policy)
+        if args.query == "who":
+            rows = store.who_used(args.action, since=args.since, until=args.until, **filters)
+        else:
+            filters.update(level=args.level, service=args.service, action=args.action)
+            if args.query == "unused":
+                rows = store.unused(args.days, as_of=args.as_of, **filters)
+            else:
+                rows = store.used(since=args.since, until=args.until, **filters)
+
+        if not args.format:
+            print_table(rows)
+            return
+
+        from iam_report_writers import open_writer, output_path, write_rows
+
+        base_name = args.output or f"iam-history-{args.query}-" + datetime.now().strftime('%m-%d-%Y')
+        writers = [w for w in (open_writer(fmt, output_path(base_name, fmt)) for fmt in args.format) if w]
+        write_rows(rows, writers)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Concurrent engine for IAM "last accessed" jobs.
+
+Every job is submitted up front, then all of them are polled together on a
+thread pool. Each job has its own exponential backoff with jitter, so the total
+runtime is bounded by the slowest job rather than the sum of all jobs.
+"""
+import random
+import sys
+import time
+
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_INITIAL_DELAY = 0.5
+DEFAULT_MAX_DELAY = 5.0
+
+FINISHED_STATUSES = ('COMPLETED', 'FAILED')
+
+
+class _JobBackoff:
+    """
+    Per-job polling schedule: exponential backoff with "equal jitter".
+    The delay doubles after every poll that finds the job still running,
+    capped at `max_delay`.
+    """
+
+    def __init__(self, initial_delay, max_delay):
+        self.delay = initial_delay
+        self.max_delay = max_delay
+        self.next_poll = time.monotonic() + self._jittered()
+
+    def _jittered(self):
+        return self.delay / 2 + random.uniform(0, self.delay / 2)
+
+    def reschedule(self):
+        self.delay = min(self.delay * 2, self.max_delay)
+        self.next_poll = time.monotonic() + self._jittered()
+
+
+def submit_job(iam_client, arn, granularity):
+    """
+    Start a generate_service_last_accessed_details job and return its JobId.
+    """
+    job_response = iam_client.generate_service_last_accessed_details(
+        Arn=arn,
+        Granularity=granularity
+    )
+    return job_response['JobId']
+
+
+def start_job(iam_client, arn, granularity, journal=None, version_id=None):
+    """
+    Return the JobId of a running job for `arn`: the one a checkpoint journal
+    recorded for an interrupted earlier attempt while IAM still knows it,
+    otherwise a newly submitted job (which is then journaled).
+    """
+    if journal is not None:
+        job_id = journal.job_id(arn, granularity, version_id)
+        if job_id:
+            from botocore.exceptions import ClientError
+
+            try:
+                iam_client.get_service_last_accessed_details(JobId=job_id, MaxItems=1)
+                return job_id
+            except ClientError:
+                pass  # The job has expired or is unknown; start a new one
+
+    job_id = submit_job(iam_client, arn, granularity)
+    if journal is not None:
+        journal.record_job_id(arn, granularity, version_id, job_id)
+    return job_id
+
+
+def poll_job(iam_client, job_id):
+    """
+    Fetch the current state of a last accessed job.
+
+    Once the job has completed, every result page is followed through
+    Marker/IsTruncated and merged, so the returned ServicesLastAccessed list
+    is never truncated.
+    """
+    job_details = iam_client.get_service_last_accessed_details(JobId=job_id)
+    if job_details['JobStatus'] != 'COMPLETED' or not job_details.get('IsTruncated'):
+        return job_details
+
+    services = list(job_details.get('ServicesLastAccessed', []))
+    page = job_details
+    while page.get('IsTruncated'):
+        page = iam_client.get_service_last_accessed_details(JobId=job_id, Marker=page['Marker'])
+        services.extend(page.get('ServicesLastAccessed', []))
+
+    job_details = dict(job_details, ServicesLastAccessed=services, IsTruncated=False)
+    job_details.pop('Marker', None)
+    return job_details
+
+
+def run_last_accessed_jobs(iam_client, arns, granularity,
+                           max_workers=DEFAULT_MAX_WORKERS,
+                           initial_delay=DEFAULT_INITIAL_DELAY,
+                           max_delay=DEFAULT_MAX_DELAY,
+                           cache=None,
+                           versions=None,
+                           journal=None,
+                           metrics=None):
+    """
+    Run one last accessed job per ARN concurrently and wait for all of them.
+
+    Returns a list of (arn, job_details) tuples in the same order as `arns`.
+    `job_details` is the final get_service_last_accessed_details response, whose
+    'JobStatus' is either 'COMPLETED' or 'FAILED'.
+
+    When a ResultCache is given, ARNs with a cached result for their version
+    (looked up in the optional `versions` dict of ARN -> version ID) are not
+    submitted at all, and newly completed results are stored in the cache.
+
+    With a CheckpointJournal (see iam_checkpoint), results it already holds
+    are reused, jobs it recorded are reattached rather than resubmitted, and
+    every job's JobId and result are journaled as soon as they are known.
+
+    An optional RunMetrics (see iam_metrics) receives where each result came
+    from, every job's queue-to-complete time and poll count, and the time the
+    poll loop slept.
+    """
+    arns = list(arns)
+    if not arns:
+        return []
+
+    versions = versions or {}
+    results = {}
+    for name, source in (('journal', journal), ('cache', cache)):
+        if source is None:
+            continue
+        found = len(results)
+        for arn in arns:
+            if arn not in results:
+                cached = source.get(arn, granularity, versions.get(arn))
+                if cached is not None:
+                    results[arn] = cached
+                    if source is cache and journal is not None:
+                        # Keep a resumed run on the same results as the interrupted one
+                        journal.put(arn, granularity, versions.get(arn), cached)
+        if metrics is not None:
+            metrics.record_job_sources(name, len(results) - found)
+
+    to_run = [arn for arn in arns if arn not in results]
+    if to_run:
+        if metrics is not None:
+            metrics.record_job_sources('iam', len(to_run))
+        results.update(_run_jobs(
+            iam_client, to_run, granularity, max_workers, initial_delay, max_delay, journal, versions, metrics
+        ))
+        if cache is not None:
+            for arn in to_run:
+                if results[arn]['JobStatus'] == 'COMPLETED':
+                    cache.put(arn, granularity, versions.get(arn), results[arn])
+
+    return [(arn, results[arn]) for arn in arns]
+
+
+def _run_jobs(iam_client, arns, granularity, max_workers, initial_delay, max_delay, journal=None, versions=None,
+              metrics=None):
+    """
+    Submit and poll the jobs for `arns`; return a dict of ARN -> job details.
+    """
+    versions = versions or {}
+    workers = max(1, min(max_workers, len(arns)))
+    results = {}
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # 1. Submit every job up front so IAM can work on them in parallel
+        job_ids = dict(zip(arns, pool.map(
+            lambda arn: start_job(iam_client, arn, granularity, journal, versions.get(arn)), arns
+        )))
+        pending = {arn: _JobBackoff(initial_delay, max_delay) for arn in arns}
+        submitted_at = time.monotonic()
+        polls = dict.fromkeys(arns, 0)
+
+        # 2. Poll whichever jobs are due, sleeping only until the next one is
+        while pending:
+            now = time.monotonic()
+            due = [arn for arn, backoff in pending.items() if backoff.next_poll <= now]
+            if not due:
+                delay = max(0.0, min(b.next_poll for b in pending.values()) - now)
+                time.sleep(delay)
+                if metrics is not None:
+                    metrics.record_poll_sleep(delay)
+                continue
+
+            polled = pool.map(lambda arn: poll_job(iam_client, job_ids[arn]), due)
+            for arn, job_details in zip(due, polled):
+                polls[arn] += 1
+                if job_details['JobStatus'] in FINISHED_STATUSES:
+                    results[arn] = job_details
+                    del pending[arn]
+                    if metrics is not None:
+                        metrics.record_job(time.monotonic() - submitted_at, job_details['JobStatus'], polls[arn])
+                    if journal is not None and job_details['JobStatus'] == 'COMPLETED':
+                        journal.put(arn, granularity, versions.get(arn), job_details)
+                else:
+                    pending[arn].reschedule()
+
+    for arn in arns:
+        if results[arn]['JobStatus'] == 'FAILED':
+            print(f"[ERROR] Failed to get service last accessed details for {arn}", file=sys.stderr)
+
+    return results
@@ -0,0 +1,434 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Run instrumentation: where does the time of a report run go?
+
+RunMetrics collects, thread-safely:
+
+- a latency histogram per IAM operation, with retry, throttle and error
+  counts, taken from botocore's before-call/after-call/needs-retry events
+  (see instrument_client),
+- the queue-to-complete time of every last accessed job, how often jobs were
+  polled and how long the poll loop slept,
+- wall-clock time per pipeline stage (see RunMetrics.stage), and
+- rows and rows/sec per exporter (see TimedWriter).
+
+write_metrics saves them as JSON or in the Prometheus text exposition
+format. profile_run wraps a whole run in cProfile.
+"""
+import io
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+from iam_rate_governor import THROTTLE_ERROR_CODES, is_throttling_error
+
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+JOB_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+METRIC_PREFIX = "iam_report"
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket bounds, like a Prometheus histogram.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """
+        Return [(upper bound, cumulative count)], ending with ("+Inf", count).
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket that holds it.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return self.max if bound == "+Inf" else min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": {str(bound): total for bound, total in self.cumulative()},
+        }
+
+
+class _ApiStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.retries = 0
+        self.throttles = 0
+        self.errors = 0
+
+
+class RunMetrics:
+    """
+    Measurements of one report run. Every method is safe to call from the
+    job polling threads.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.api = {}
+        self.jobs = Histogram(JOB_BUCKETS)
+        self.job_statuses = {}
+        self.job_sources = {}
+        self.job_polls = 0
+        self.poll_sleep_seconds = 0.0
+        self.stages = {}
+        self.exporters = {}
+        self._lock = threading.Lock()
+
+    def _api(self, operation):
+        stats = self.api.get(operation)
+        if stats is None:
+            stats = self.api[operation] = _ApiStats()
+        return stats
+
+    def record_call(self, operation, seconds, retries=0, error_code=None):
+        with self._lock:
+            stats = self._api(operation)
+            stats.latency.observe(seconds)
+            stats.retries += retries
+            if error_code:
+                stats.errors += 1
+
+    def record_throttle(self, operation):
+        with self._lock:
+            self._api(operation).throttles += 1
+
+    def record_job(self, seconds, status, polls):
+        """
+        Record one job: seconds from submission to a finished status.
+        """
+        with self._lock:
+            self.jobs.observe(seconds)
+            self.job_statuses[status] = self.job_statuses.get(status, 0) + 1
+            self.job_polls += polls
+
+    def record_job_sources(self, source, count):
+        """
+        Count jobs answered from `source` ('cache', 'journal' or 'iam').
+        """
+        if count:
+            with self._lock:
+                self.job_sources[source] = self.job_sources.get(source, 0) + count
+
+    def record_poll_sleep(self, seconds):
+        with self._lock:
+            self.poll_sleep_seconds += seconds
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a pipeline stage; repeated stages accumulate.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def record_export(self, fmt, level, rows, seconds):
+        with self._lock:
+            self.exporters[(fmt, level)] = (rows, seconds)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "wall_seconds": round(time.time() - self.started_at, 6),
+                "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+                "api": {
+                    operation: {
+                        "calls": stats.latency.count,
+                        "retries": stats.retries,
+                        "throttles": stats.throttles,
+                        "errors": stats.errors,
+                        "latency_seconds": stats.latency.to_dict(),
+                    }
+                    for operation, stats in sorted(self.api.items())
+                },
+                "jobs": {
+                    "sources": dict(self.job_sources),
+                    "statuses": dict(self.job_statuses),
+                    "polls": self.job_polls,
+                    "poll_sleep_seconds": round(self.poll_sleep_seconds, 6),
+                    "queue_to_complete_seconds": self.jobs.to_dict(),
+                },
+                "exporters": [
+                    {
+                        "format": fmt,
+                        "level": level,
+                        "rows": rows,
+                        "seconds": round(seconds, 6),
+                        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+                    }
+                    for (fmt, level), (rows, seconds) in self.exporters.items()
+                ],
+            }
+
+
+def timed_stage(metrics, name):
+    """
+    metrics.stage(name), or a no-op context when `metrics` is None.
+    """
+    return metrics.stage(name) if metrics is not None else nullcontext()
+
+
+def _prometheus_histogram(lines, name, histogram, labels=""):
+    separator = "," if labels else ""
+    for bound, total in histogram.cumulative():
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {total}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+
+
+def to_prometheus(metrics):
+    """
+    Render `metrics` in the Prometheus text exposition format.
+    """
+    p = METRIC_PREFIX
+    lines = []
+    with metrics._lock:
+        lines += [f"# HELP {p}_stage_seconds Wall-clock time per pipeline stage.",
+                  f"# TYPE {p}_stage_seconds gauge"]
+        lines += [f'{p}_stage_seconds{{stage="{name}"}} {seconds:.6f}' for name, seconds in metrics.stages.items()]
+
+        lines += [f"# HELP {p}_api_call_seconds IAM API call latency, including botocore retries.",
+                  f"# TYPE {p}_api_call_seconds histogram"]
+        for operation, stats in sorted(metrics.api.items()):
+            _prometheus_histogram(lines, f"{p}_api_call_seconds", stats.latency, f'operation="{operation}"')
+        for metric, attribute, help_text in (
+            ("api_retries_total", "retries", "Retried IAM API attempts."),
+            ("api_throttles_total", "throttles", "IAM API attempts rejected by throttling."),
+            ("api_errors_total", "errors", "IAM API calls that ended in an error."),
+        ):
+            lines += [f"# HELP {p}_{metric} {help_text}", f"# TYPE {p}_{metric} counter"]
+            lines += [f'{p}_{metric}{{operation="{operation}"}} {getattr(stats, attribute)}'
+                      for operation, stats in sorted(metrics.api.items())]
+
+        lines += [f"# HELP {p}_job_seconds Last accessed job time from submission to a finished status.",
+                  f"# TYPE {p}_job_seconds histogram"]
+        _prometheus_histogram(lines, f"{p}_job_seconds", metrics.jobs)
+        lines += [f"# HELP {p}_jobs_total Last accessed job results by source.", f"# TYPE {p}_jobs_total counter"]
+        lines += [f'{p}_jobs_total{{source="{source}"}} {count}' for source, count in metrics.job_sources.items()]
+        lines += [f"# HELP {p}_job_polls_total Status polls of last accessed jobs.",
+                  f"# TYPE {p}_job_polls_total counter",
+                  f"{p}_job_polls_total {metrics.job_polls}",
+                  f"# HELP {p}_poll_sleep_seconds_total Time the job poll loop spent sleeping.",
+                  f"# TYPE {p}_poll_sleep_seconds_total counter",
+                  f"{p}_poll_sleep_seconds_total {metrics.poll_sleep_seconds:.6f}"]
+
+        lines += [f"# HELP {p}_export_rows_total Rows written per exporter.", f"# TYPE {p}_export_rows_total counter"]
+        lines += [f'{p}_export_rows_total{{format="{fmt}",level="{level}"}} {rows}'
+                  for (fmt, level), (rows, _) in metrics.exporters.items()]
+        lines += [f"# HELP {p}_export_seconds Time spent inside each exporter.", f"# TYPE {p}_export_seconds gauge"]
+        lines += [f'{p}_export_seconds{{format="{fmt}",level="{level}"}} {seconds:.6f}'
+                  for (fmt, level), (_, seconds) in metrics.exporters.items()]
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(metrics, path, fmt=None):
+    """
+    Write `metrics` to `path` as 'json' or 'prometheus'. Without `fmt`, files
+    ending in .prom or .txt get the Prometheus format and all others JSON.
+    """
+    if fmt is None:
+        fmt = "prometheus" if path.endswith((".prom", ".txt")) else "json"
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "prometheus":
+            f.write(to_prometheus(metrics))
+        else:
+            json.dump(metrics.to_dict(), f, indent=2)
+    print(f"[INFO] Metrics written to {path}")
+
+
+def _operation_name(event_name):
+    return event_name.rsplit(".", 1)[-1]
+
+
+class _InstrumentedProxy:
+    """
+    Timing wrapper for client objects without botocore events (test doubles).
+    """
+
+    def __init__(self, client, metrics):
+        self._client = client
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        operation = "".join(part.capitalize() for part in name.split("_"))
+        metrics = self._metrics
+
+        def instrumented_call(*args, **kwargs):
+            start = time.perf_counter()
+            error_code = None
+            try:
+                return attr(*args, **kwargs)
+            except Exception as e:
+                error_code = getattr(e, "response", {}).get("Error", {}).get("Code", type(e).__name__)
+                if is_throttling_error(e):
+                    metrics.record_throttle(operation)
+                raise
+            finally:
+                metrics.record_call(operation, time.perf_counter() - start, error_code=error_code)
+
+        return instrumented_call
+
+
+def instrument_client(iam_client, metrics):
+    """
+    Record the latency, retries, throttles and errors of every call made
+    through `iam_client` in `metrics`.
+
+    Real botocore clients get event handlers and are returned unchanged: the
+    call is timed from before-call to after-call (so botocore's retries are
+    included) and throttled attempts are counted in needs-retry. Other objects
+    are wrapped in a timing proxy.
+    """
+    events = getattr(getattr(iam_client, "meta", None), "events", None)
+    if events is None:
+        return _InstrumentedProxy(iam_client, metrics)
+
+    def before_call(event_name, context=None, **kwargs):
+        context["iam_metrics_start"] = time.perf_counter()
+
+    def after_call(event_name, parsed=None, context=None, **kwargs):
+        start = context.pop("iam_metrics_start", None)
+        if start is None:
+            return
+        response_metadata = (parsed or {}).get("ResponseMetadata", {})
+        metrics.record_call(
+            _operation_name(event_name),
+            time.perf_counter() - start,
+            retries=response_metadata.get("RetryAttempts", 0),
+            error_code=(parsed or {}).get("Error", {}).get("Code")
+        )
+
+    def after_call_error(event_name, exception=None, context=None, **kwargs):
+        start = context.pop("iam_metrics_start", None)
+        if start is not None:
+            metrics.record_call(_operation_name(event_name), time.perf_counter() - start,
+                                error_code=type(exception).__name__)
+
+    def needs_retry(event_name, response=None, **kwargs):
+        if response is not None and response[1].get("Error", {}).get("Code") in THROTTLE_ERROR_CODES:
+            metrics.record_throttle(_operation_name(event_name))
+        return None
+
+    events.register("before-call.iam", before_call, unique_id="iam-metrics-before-call")
+    events.register("after-call.iam", after_call, unique_id="iam-metrics-after-call")
+    events.register("after-call-error.iam", after_call_error, unique_id="iam-metrics-after-call-error")
+    events.register("needs-retry.iam", needs_retry, unique_id="iam-metrics-needs-retry")
+    return iam_client
+
+
+class TimedWriter:
+    """
+    Wrap a report writer and record its rows and the time spent in it
+    (including close(), where columnar writers do most of their work).
+    """
+
+    def __init__(self, writer, metrics, fmt, level):
+        self._writer = writer
+        self._metrics = metrics
+        self._fmt = fmt
+        self._level = level
+        self._seconds = 0.0
+
+    @property
+    def output_file(self):
+        return self._writer.output_file
+
+    @property
+    def rows_written(self):
+        return self._writer.rows_written
+
+    def position(self):
+        return self._writer.position()
+
+    def write(self, row):
+        start = time.perf_counter()
+        self._writer.write(row)
+        self._seconds += time.perf_counter() - start
+
+    def close(self):
+        start = time.perf_counter()
+        try:
+            self._writer.close()
+        finally:
+            self._seconds += time.perf_counter() - start
+            self._metrics.record_export(self._fmt, self._level, self._writer.rows_written, self._seconds)
+
+
+def profile_run(func, path, top=25):
+    """
+    Run `func()` under cProfile, save the stats to `path` (readable with
+    pstats or snakeviz) and print the `top` functions by cumulative time to
+    stderr. Returns what `func` returns.
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(top)
+        print(summary.getvalue(), file=sys.stderr)
+        print(f"[INFO] Profile written to {path}")
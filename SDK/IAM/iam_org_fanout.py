@@ -0,0 +1,297 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Organization mode: audit many accounts in one run.
+
+Accounts come from a file (account IDs or role ARNs, one per line) or from
+AWS Organizations. Each account's report runs in a worker process. The worker
+assumes a role in that account and runs the normal single-account pipeline
+with the role's credentials. Assumed-role sessions are cached per worker
+process and refresh their credentials before they expire. Finished accounts
+stream back to the parent, which merges their rows into one output stream
+with every row tagged with its AccountId.
+
+Each account gets its own rate governor (IAM quotas are per account) and its
+own result cache keys, so the total run time scales with the number of
+workers rather than the number of accounts.
+"""
+import re
+import sys
+import threading
+from iam_history_store import service_namespaces
+from iam_rate_governor import RateGovernor
+from iam_report_model import LEVELS, iter_report_rows
+from iam_report_rows import intern_str
+from iam_result_cache import ResultCache
+
+
+DEFAULT_ROLE_ARN_TEMPLATE = "arn:aws:iam::{account_id}:role/OrganizationAccountAccessRole"
+DEFAULT_SESSION_NAME = "iam-access-report"
+DEFAULT_ACCOUNT_WORKERS = 4
+DEFAULT_SESSION_DURATION = 3600
+# Principal-mode workers stream one batch of rows per user; a full queue
+# makes them wait for the parent instead of piling rows up in memory
+QUEUED_BATCHES_PER_WORKER = 16
+QUEUE_POLL_SECONDS = 1.0
+
+ACCOUNT_ID_PATTERN = re.compile(r"^\d{12}$")
+ROLE_ARN_PATTERN = re.compile(r"^arn:aws[\w-]*:iam::(\d{12}):role/.+$")
+
+# Assumed-role sessions of this process, keyed by role ARN
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def assumed_role_session(role_arn, session_name=DEFAULT_SESSION_NAME, duration_seconds=DEFAULT_SESSION_DURATION):
+    """
+    Return a boto3 Session for `role_arn`, reusing this process's cached one.
+    The session's credentials are refreshed with a new AssumeRole call shortly
+    before they expire, so long account runs never fail on expired tokens.
+    """
+    with _sessions_lock:
+        session = _sessions.get(role_arn)
+        if session is not None:
+            return session
+
+        import boto3
+        import botocore.session
+        from botocore.credentials import CredentialProvider, CredentialResolver, RefreshableCredentials
+
+        sts = boto3.client("sts")
+
+        def refresh():
+            credentials = sts.assume_role(
+                RoleArn=role_arn,
+                RoleSessionName=session_name,
+                DurationSeconds=duration_seconds
+            )["Credentials"]
+            return {
+                "access_key": credentials["AccessKeyId"],
+                "secret_key": credentials["SecretAccessKey"],
+                "token": credentials["SessionToken"],
+                "expiry_time": credentials["Expiration"].isoformat(),
+            }
+
+        class AssumeRoleProvider(CredentialProvider):
+            METHOD = "sts-assume-role"
+
+            def load(self):
+                return RefreshableCredentials.create_from_metadata(
+                    metadata=refresh(),
+                    refresh_using=refresh,
+                    method=self.METHOD
+                )
+
+        # The role is the session's only credential source
+        botocore_session = botocore.session.Session()
+        botocore_session.register_component("credential_provider", CredentialResolver([AssumeRoleProvider()]))
+        session = boto3.Session(botocore_session=botocore_session)
+        _sessions[role_arn] = session
+        return session
+
+
+def read_accounts_file(path, role_arn_template=DEFAULT_ROLE_ARN_TEMPLATE):
+    """
+    Read a file of 12-digit account IDs and/or role ARNs, one per line (blank
+    lines and '#' comments are ignored). Account IDs are turned into role
+    ARNs with `role_arn_template`. Returns a list of (account_id, role_arn).
+    """
+    accounts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = line.strip()
+            if not entry or entry.startswith('#'):
+                continue
+            match = ROLE_ARN_PATTERN.match(entry)
+            if match:
+                accounts.append((match.group(1), entry))
+            elif ACCOUNT_ID_PATTERN.match(entry):
+                accounts.append((entry, role_arn_template.format(account_id=entry)))
+            else:
+                raise ValueError(f"{path}: '{entry}' is neither an account ID nor a role ARN")
+    return list(dict.fromkeys(accounts))
+
+
+def list_organization_accounts(role_arn_template=DEFAULT_ROLE_ARN_TEMPLATE):
+    """
+    Return (account_id, role_arn) for every ACTIVE account of the caller's
+    organization. Must run with the management (or a delegated
+    administrator) account's credentials.
+    """
+    import boto3
+
+    organizations = boto3.client("organizations")
+    accounts = []
+    for page in organizations.get_paginator("list_accounts").paginate():
+        for account in page["Accounts"]:
+            if account.get("Status") == "ACTIVE":
+                accounts.append((account["Id"], role_arn_template.format(account_id=account["Id"])))
+    return accounts
+
+
+class AccountScopedCache:
+    """
+    Wrap a ResultCache so entries of different accounts never collide: AWS
+    managed policy ARNs are the same in every account, their usage is not.
+    """
+
+    def __init__(self, cache, account_id):
+        self.cache = cache
+        self.account_id = account_id
+
+    def get(self, arn, granularity, version_id):
+        return self.cache.get(f"{self.account_id}/{arn}", granularity, version_id)
+
+    def put(self, arn, granularity, version_id, job_details):
+        self.cache.put(f"{self.account_id}/{arn}", granularity, version_id, job_details)
+
+
+def iter_user_batches(rows):
+    """
+    Group (level, ReportRow) tuples, which arrive user by user, into one
+    list per user.
+    """
+    batch = []
+    user = None
+    for item in rows:
+        if item[1].user_name != user and batch:
+            yield batch
+            batch = []
+        user = item[1].user_name
+        batch.append(item)
+    if batch:
+        yield batch
+
+
+def run_account_report(task):
+    """
+    Worker-process entry point: assume the account's role and run its report.
+
+    Returns (account_id, ReportInputs, namespaces, error). Policy mode
+    returns the compact ReportInputs, which the parent fans out into rows.
+    Principal mode streams its rows to the parent through the task's
+    `batches` queue, one (account_id, rows) batch per user, and returns the
+    service_namespaces of its user jobs. On failure only `error` is set.
+    Either way the worker ends by queueing (account_id, None).
+    """
+    # Imported here: iam_access_report imports this module for its CLI
+    from iam_access_report import collect_report_inputs, iter_principal_permissions_rows
+
+    account_id = task["account_id"]
+    batches = task["batches"]
+    cache = None
+    try:
+        session = assumed_role_session(task["role_arn"], task["session_name"])
+
+        governor_options = dict(task["governor"])
+        if governor_options.get("state_file"):
+            governor_options["state_file"] = f"{governor_options['state_file']}.{account_id}"
+        governor = RateGovernor(**governor_options)
+
+        if task["cache"] is not None:
+            cache = ResultCache(**task["cache"])
+        scoped_cache = AccountScopedCache(cache, account_id) if cache is not None else None
+
+        options = dict(max_workers=task["max_workers"], governor=governor, cache=scoped_cache, session=session)
+        if task["job_mode"] == "principal":
+            namespaces = set()
+            rows = iter_principal_permissions_rows(
+                task["usernames"], levels=task["levels"], account_id=account_id,
+                on_complete=lambda _account_id, _usernames, job_namespaces: namespaces.update(job_namespaces),
+                **options
+            )
+            for batch in iter_user_batches(rows):
+                batches.put((account_id, batch))
+            return account_id, None, namespaces, None
+        return account_id, collect_report_inputs(task["usernames"], **options), None, None
+    except Exception as e:
+        return account_id, None, None, f"{type(e).__name__}: {e}"
+    finally:
+        if cache is not None:
+            cache.close()
+        batches.put((account_id, None))
+
+
+def iter_organization_rows(accounts, usernames=None, levels=LEVELS, job_mode="policy",
+                           account_workers=DEFAULT_ACCOUNT_WORKERS, session_name=DEFAULT_SESSION_NAME,
+                           max_workers=8, governor_options=None, cache_options=None, on_complete=None):
+    """
+    Run the report of every (account_id, role_arn) in `accounts` in a pool
+    of `account_workers` processes and yield (level, ReportRow) tuples tagged
+    with their AccountId. Policy-mode accounts are yielded whole in order of
+    completion; principal-mode accounts stream in user by user, so the rows
+    of several accounts interleave.
+
+    `governor_options` are RateGovernor keyword arguments, applied per
+    account. `cache_options` are ResultCache keyword arguments, or None to
+    run without the result cache. Accounts that fail are reported and skipped
+    (in principal mode, the users streamed before the failure stay in the
+    output); `on_complete` is called with (account_id, usernames, namespaces)
+    after the last row of every account that succeeded, where `namespaces`
+    are the service_namespaces of the account's jobs.
+    """
+    base_task = {
+        "usernames": usernames,
+        "levels": tuple(levels),
+        "job_mode": job_mode,
+        "session_name": session_name,
+        "max_workers": max_workers,
+        "governor": governor_options or {},
+        "cache": cache_options,
+    }
+    workers = max(1, min(account_workers, len(accounts)))
+
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import Manager
+    from queue import Empty
+
+    # The manager is shut down first, so workers blocked on a full queue fail
+    # instead of holding up the pool when the caller stops early
+    with ProcessPoolExecutor(max_workers=workers) as pool, Manager() as manager:
+        batches = manager.Queue(maxsize=QUEUED_BATCHES_PER_WORKER * workers)
+        futures = {
+            account_id: pool.submit(
+                run_account_report, dict(base_task, account_id=account_id, role_arn=role_arn, batches=batches)
+            )
+            for account_id, role_arn in accounts
+        }
+        pending = set(futures)
+        while pending:
+            try:
+                account_id, batch = batches.get(timeout=QUEUE_POLL_SECONDS)
+            except Empty:
+                # A worker that was killed outright never queues its end marker
+                for account_id in [a for a in pending if futures[a].done() and futures[a].exception()]:
+                    pending.discard(account_id)
+                    print(f"[ERROR] Account {account_id} failed: {futures[account_id].exception()}", file=sys.stderr)
+                continue
+            if batch is not None:
+                yield from batch
+                continue
+
+            pending.discard(account_id)
+            try:
+                _, inputs, namespaces, error = futures[account_id].result()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            if error:
+                print(f"[ERROR] Account {account_id} failed: {error}", file=sys.stderr)
+                continue
+            if inputs is not None:
+                yield from iter_report_rows(inputs, levels, account_id=intern_str(account_id))
+                namespaces = service_namespaces(inputs.job_results.values()) if on_complete is not None else None
+            if on_complete is not None:
+                on_complete(account_id, usernames, namespaces)
+            print(f"[INFO] Account {account_id} done")
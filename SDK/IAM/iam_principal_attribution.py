@@ -0,0 +1,175 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Principal-level mode: one last accessed job per user instead of per policy.
+
+IAM accepts a user ARN in generate_service_last_accessed_details. The job
+reports what the user actually used, whichever policy granted it. The rows of
+each managed policy are then worked out locally by matching every reported
+service and tracked action against the Allow statements of the policy's
+default version. A user with 30 policies therefore costs one job instead of
+30.
+
+The attribution is an approximation: a use is credited to every attached
+policy that allows it, because IAM does not record which policy granted a
+request. Deny statements and permissions boundaries are not evaluated.
+"""
+import hashlib
+import json
+import re
+from fnmatch import translate
+
+from iam_report_model import PARSERS
+from iam_report_rows import ReportRow, intern_str, to_epoch
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _compile(patterns):
+    """
+    Compile IAM action patterns ("s3:Get*", "*") into one case-insensitive regex.
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join(translate(p) for p in patterns), re.IGNORECASE)
+
+
+class PolicyActionMatcher:
+    """
+    The actions a policy document allows, as compiled Action / NotAction
+    patterns taken from its Allow statements.
+    """
+
+    def __init__(self, document):
+        self.allowed = []
+        self.not_allowed = []
+        self.service_prefixes = set()
+        self.allows_any_service = False
+
+        for statement in _as_list((document or {}).get('Statement')):
+            if statement.get('Effect') != 'Allow':
+                continue
+            if 'NotAction' in statement:
+                not_action = _compile(_as_list(statement['NotAction']))
+                if not_action is not None:
+                    self.not_allowed.append(not_action)
+                    self.allows_any_service = True
+                continue
+            patterns = _as_list(statement.get('Action'))
+            self.allowed.extend(patterns)
+            for pattern in patterns:
+                prefix = pattern.split(':', 1)[0]
+                if '*' in prefix or '?' in prefix:
+                    self.allows_any_service = True
+                else:
+                    self.service_prefixes.add(prefix.lower())
+        self._allowed = _compile(self.allowed)
+
+    def allows_service(self, namespace):
+        """
+        True if the policy allows at least one action of the service.
+        """
+        return self.allows_any_service or namespace.lower() in self.service_prefixes
+
+    def allows(self, namespace, action_name):
+        """
+        True if the policy allows `namespace:action_name`.
+        """
+        action = f"{namespace}:{action_name}"
+        if self._allowed is not None and self._allowed.match(action):
+            return True
+        return any(not pattern.match(action) for pattern in self.not_allowed)
+
+
+def attribute_job_details(job_details, matcher):
+    """
+    Return a copy of a principal's finished job response that only keeps the
+    services and tracked actions `matcher` allows, in the same shape the
+    report parsers read.
+    """
+    if job_details['JobStatus'] == 'FAILED':
+        return job_details
+
+    services = []
+    for service in job_details.get('ServicesLastAccessed', []):
+        namespace = service.get('ServiceNamespace', '')
+        if not matcher.allows_service(namespace):
+            continue
+        tracked = service.get('TrackedActionsLastAccessed')
+        if tracked:
+            actions = [a for a in tracked if matcher.allows(namespace, a.get('ActionName', ''))]
+            if not actions:
+                continue
+            service = dict(service, TrackedActionsLastAccessed=actions)
+        services.append(service)
+    return dict(job_details, ServicesLastAccessed=services)
+
+
+def principal_version(graph, username):
+    """
+    A digest of everything that decides what the user is allowed to do:
+    attached managed policies and their default versions, plus the user's
+    and its groups' inline policies. Used as the cache key version of the
+    user's job, so any change to it forces a new job.
+    """
+    user = graph.users[username]
+    state = {
+        'managed': [(arn, graph.policy_version(arn)) for arn in graph.managed_policies_for_user(username)],
+        'inline': user['InlinePolicies'],
+        'groups': {
+            name: graph.groups[name]['InlinePolicies'] for name in user['Groups'] if name in graph.groups
+        },
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+
+def iter_principal_report_rows(graph, user_policy_map, user_jobs, levels, account_id=None):
+    """
+    Yield (level, ReportRow) tuples for every user of `user_policy_map`,
+    attributing the user's own job result (`user_jobs` maps username ->
+    job details) to each of the user's managed policies. Rows are tagged
+    with `account_id` when one is given.
+    """
+    matchers = {}
+    for username, policy_arns in user_policy_map.items():
+        job_details = user_jobs.get(username)
+        if job_details is None:
+            continue
+        username = intern_str(username)
+        for policy_arn in policy_arns:
+            if policy_arn not in matchers:
+                policy = graph.policies.get(policy_arn) or {}
+                matchers[policy_arn] = PolicyActionMatcher(policy.get('Document'))
+        attributed = {
+            policy_arn: attribute_job_details(job_details, matchers[policy_arn]) for policy_arn in policy_arns
+        }
+
+        for level in levels:
+            for policy_arn in policy_arns:
+                policy_name = intern_str(graph.policy_name(policy_arn))
+                for item in PARSERS[level](policy_arn, attributed[policy_arn]):
+                    yield level, ReportRow(
+                        username,
+                        policy_name,
+                        intern_str(policy_arn),
+                        intern_str(item["ServiceName"]),
+                        intern_str(item.get("ActionName")),
+                        to_epoch(item["LastAccessed"]),
+                        account_id,
+                    )
@@ -0,0 +1,308 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Token-bucket rate governor for IAM API calls.
+
+Every request goes through two buckets: one for the whole account and one for
+the individual API operation. When IAM answers with a throttling error the
+rates are cut in half, and they recover slowly again on success (AIMD).
+
+Bucket state lives in memory by default, which is safe to share between
+threads. Pass `state_file` to keep the state in a locked JSON file instead so
+several processes (for example, parallel report runs) share one budget.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+
+# IAM quotas are account-wide. Stay a little below them so that other tooling
+# in the same account keeps some headroom.
+QUOTA_HEADROOM = 0.9
+DEFAULT_ACCOUNT_RATE = 15.0
+DEFAULT_API_RATES = {
+    'GenerateServiceLastAccessedDetails': 2.0,
+    'GetServiceLastAccessedDetails': 10.0,
+    'GetServiceLastAccessedDetailsWithEntities': 10.0,
+    'GetAccountAuthorizationDetails': 2.0,
+    'GetPolicy': 10.0,
+    'GetPolicyVersion': 10.0,
+}
+DEFAULT_API_RATE = 10.0
+
+THROTTLE_ERROR_CODES = frozenset([
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+])
+
+# Let botocore keep retrying throttled calls; the governor slows the retries down.
+IAM_CLIENT_RETRIES = {'mode': 'standard', 'max_attempts': 10}
+
+MIN_RATE_FACTOR = 0.05
+RECOVERY_STEP = 0.02
+ACCOUNT_BUCKET = '__account__'
+
+
+def is_throttling_error(error):
+    """
+    Return True if a botocore ClientError is a throttling response.
+    Checked by shape rather than class, so botocore is not imported for it.
+    """
+    response = getattr(error, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    return response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+
+
+def iam_client_config(**options):
+    """
+    Return the botocore Config for IAM clients: IAM_CLIENT_RETRIES plus any
+    other Config `options`, such as max_pool_connections.
+    """
+    from botocore.config import Config
+
+    return Config(retries=IAM_CLIENT_RETRIES, **options)
+
+
+class RateGovernor:
+    """
+    Per-API token buckets plus an account-wide bucket, with throttling feedback.
+
+    `account_rate` and `api_rates` are the nominal IAM quotas in requests per
+    second; the governor targets QUOTA_HEADROOM of them. Each bucket can burst
+    up to one second's worth of requests.
+    """
+
+    def __init__(self, account_rate=DEFAULT_ACCOUNT_RATE, api_rates=None, state_file=None):
+        if account_rate <= 0:
+            raise ValueError(f"Account rate must be positive, got {account_rate:g}")
+        for api, rate in (api_rates or {}).items():
+            if rate <= 0:
+                raise ValueError(f"Rate for {api} must be positive, got {rate:g}")
+        self.account_rate = account_rate
+        self.api_rates = dict(DEFAULT_API_RATES)
+        self.api_rates.update(api_rates or {})
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._state = {}
+
+        if state_file and not HAS_FCNTL:
+            raise RuntimeError("A shared rate state file requires fcntl (POSIX only).")
+
+    def _nominal_rate(self, bucket):
+        if bucket == ACCOUNT_BUCKET:
+            return self.account_rate
+        return self.api_rates.get(bucket, DEFAULT_API_RATE)
+
+    @contextmanager
+    def _locked_state(self):
+        """
+        Yield the mutable bucket state while holding the thread lock and, when
+        a state file is configured, an exclusive lock on that file.
+        """
+        with self._lock:
+            if not self.state_file:
+                yield self._state
+                return
+
+            directory = os.path.dirname(self.state_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.state_file, 'a+', encoding='utf-8') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    content = f.read()
+                    state = json.loads(content) if content else {}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(state, f)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state, bucket, now):
+        """
+        Return the bucket's [tokens, updated_at, rate_factor] entry after
+        adding the tokens earned since it was last touched.
+        """
+        rate = self._nominal_rate(bucket) * QUOTA_HEADROOM
+        capacity = max(1.0, rate)
+        entry = state.get(bucket)
+        if entry is None:
+            entry = [capacity, now, 1.0]
+        tokens, updated_at, factor = entry
+        effective_rate = rate * factor
+        tokens = min(capacity, tokens + max(0.0, now - updated_at) * effective_rate)
+        entry = [tokens, now, factor]
+        state[bucket] = entry
+        return entry, effective_rate
+
+    def acquire(self, api_name):
+        """
+        Block until a request to `api_name` fits in both its own budget and
+        the account budget, then consume one token from each.
+        """
+        buckets = (ACCOUNT_BUCKET, api_name)
+        while True:
+            with self._locked_state() as state:
+                now = time.time()
+                wait = 0.0
+                entries = []
+                for bucket in buckets:
+                    entry, effective_rate = self._refill(state, bucket, now)
+                    entries.append(entry)
+                    if entry[0] < 1.0:
+                        wait = max(wait, (1.0 - entry[0]) / effective_rate)
+                if wait == 0.0:
+                    for entry in entries:
+                        entry[0] -= 1.0
+                    return
+            time.sleep(wait)
+
+    def on_throttle(self, api_name):
+        """
+        Multiplicative decrease: halve the rate of the throttled API and of
+        the account bucket, and drain their tokens.
+        """
+        with self._locked_state() as state:
+            now = time.time()
+            for bucket in (ACCOUNT_BUCKET, api_name):
+                entry, _ = self._refill(state, bucket, now)
+                entry[0] = 0.0
+                entry[2] = max(MIN_RATE_FACTOR, entry[2] / 2)
+
+    def on_success(self, api_name):
+        """
+        Additive increase: move a throttled rate back towards its budget.
+        """
+        with self._locked_state() as state:
+            for bucket in (ACCOUNT_BUCKET, api_name):
+                entry = state.get(bucket)
+                if entry is not None and entry[2] < 1.0:
+                    entry[2] = min(1.0, entry[2] + RECOVERY_STEP)
+
+
+def _api_name(method_name):
+    """
+    Convert a boto3 method name such as 'get_policy' to its API name ('GetPolicy').
+    """
+    return ''.join(part.capitalize() for part in method_name.split('_'))
+
+
+class _GovernedProxy:
+    """
+    Wrapper used for client objects that do not expose botocore events (for
+    example test doubles). Every API method call is metered by the governor and
+    retried with jittered backoff when it is throttled.
+    """
+
+    def __init__(self, client, governor, max_attempts):
+        self._client = client
+        self._governor = governor
+        self._max_attempts = max_attempts
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr) or name in ('get_paginator', 'get_waiter', 'can_paginate'):
+            return attr
+
+        api_name = _api_name(name)
+        governor = self._governor
+        max_attempts = self._max_attempts
+
+        def governed_call(*args, **kwargs):
+            from botocore.exceptions import ClientError
+
+            for attempt in range(1, max_attempts + 1):
+                governor.acquire(api_name)
+                try:
+                    response = attr(*args, **kwargs)
+                except ClientError as error:
+                    if not is_throttling_error(error) or attempt == max_attempts:
+                        raise
+                    governor.on_throttle(api_name)
+                    time.sleep(random.uniform(0, min(20.0, 0.5 * 2 ** attempt)))
+                    continue
+                governor.on_success(api_name)
+                return response
+
+        return governed_call
+
+
+def governed_client(iam_client, governor, max_attempts=8):
+    """
+    Put `governor` between `iam_client` and IAM.
+
+    For real botocore clients this registers event handlers, so every HTTP
+    attempt (including botocore's own retries and paginator pages) takes a
+    token and every throttling response feeds back into the governor. The
+    same client is returned. Any other object is wrapped in a proxy.
+    """
+    events = getattr(getattr(iam_client, 'meta', None), 'events', None)
+    if events is None:
+        return _GovernedProxy(iam_client, governor, max_attempts)
+
+    def before_send(event_name, **kwargs):
+        governor.acquire(event_name.rsplit('.', 1)[-1])
+
+    def needs_retry(event_name, response=None, **kwargs):
+        api_name = event_name.rsplit('.', 1)[-1]
+        if response is None:
+            return None
+        error_code = response[1].get('Error', {}).get('Code')
+        if error_code in THROTTLE_ERROR_CODES:
+            governor.on_throttle(api_name)
+        elif error_code is None:
+            governor.on_success(api_name)
+        return None
+
+    events.register('before-send.iam', before_send, unique_id='iam-rate-governor-before-send')
+    events.register('needs-retry.iam', needs_retry, unique_id='iam-rate-governor-needs-retry')
+    return iam_client
+
+
+def parse_api_rates(values):
+    """
+    Parse repeated "ApiName=rate" command line values into a dict. Rates
+    must be positive numbers.
+    """
+    rates = {}
+    for value in values or []:
+        match = re.fullmatch(r'\s*(\w+)\s*=\s*([0-9.]+)\s*', value)
+        try:
+            rate = float(match.group(2)) if match else None
+        except ValueError:
+            rate = None
+        if rate is None:
+            raise ValueError(f"Invalid API rate '{value}', expected ApiName=requests_per_second")
+        if rate <= 0:
+            raise ValueError(f"Invalid API rate '{value}', the rate must be positive")
+        rates[match.group(1)] = rate
+    return rates
@@ -0,0 +1,170 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Report model shared by every way of producing IAM access reports.
+
+ReportInputs captures everything a report is built from: which policies apply
+to which users, the policies' names and versions, and one finished last
+accessed job result per policy. The parsers and iter_report_rows turn those
+inputs into ReportRow objects for the service-level and action-level views.
+"""
+from iam_report_rows import ReportRow, intern_str, to_epoch
+
+
+LEVELS = ('service', 'action')
+JOB_GRANULARITY = 'ACTION_LEVEL'
+
+
+def parse_service_level_details(policy_arn, job_details):
+    """
+    Turn a finished last accessed job response (either granularity) into a
+    list of dictionaries where each dict contains:
+
+        {
+          "PolicyArn": policy_arn,
+          "ServiceName": <string>,
+          "LastAccessed": <datetime or None>
+        }
+
+    A failed job yields no rows.
+    """
+    if job_details['JobStatus'] == 'FAILED':
+        return []
+
+    services_last_accessed = job_details.get('ServicesLastAccessed', [])
+    results = []
+
+    for service_info in services_last_accessed:
+        service_name = service_info.get('ServiceName', 'UnknownService')
+        last_auth = service_info.get('LastAuthenticated')  # datetime or None if never used
+
+        results.append({
+            "PolicyArn": policy_arn,
+            "ServiceName": service_name,
+            "LastAccessed": last_auth
+        })
+
+    return results
+
+
+def parse_action_level_details(policy_arn, job_details):
+    """
+    Turn a finished ACTION_LEVEL job response into a list of dictionaries
+    where each dict contains:
+
+        {
+          "PolicyArn": policy_arn,
+          "ServiceName": <string>,
+          "ActionName": <string>,
+          "LastAccessed": <datetime or None>
+        }
+
+    A failed job yields no rows.
+    """
+    if job_details['JobStatus'] == 'FAILED':
+        return []
+
+    services_last_accessed = job_details.get('ServicesLastAccessed', [])
+    results = []
+
+    for service_info in services_last_accessed:
+        service_name = service_info.get('ServiceName', 'UnknownService')
+        tracked_actions = service_info.get('TrackedActionsLastAccessed', [])
+
+        if not tracked_actions:
+            # Possibly no recorded usage for that service or no tracked actions found
+            # We'll log a single row showing the service with "NO_ACTION_DATA"
+            last_authenticated = service_info.get('LastAuthenticated')
+            results.append({
+                "PolicyArn": policy_arn,
+                "ServiceName": service_name,
+                "ActionName": "NO_ACTION_DATA",
+                "LastAccessed": last_authenticated
+            })
+        else:
+            # If there are tracked actions, list them all
+            for action_info in tracked_actions:
+                action_name = action_info.get('ActionName', 'UnknownAction')
+                last_access_time = action_info.get('LastAccessedTime')  # may be None
+                results.append({
+                    "PolicyArn": policy_arn,
+                    "ServiceName": service_name,
+                    "ActionName": action_name,
+                    "LastAccessed": last_access_time
+                })
+
+    return results
+
+
+PARSERS = {
+    'service': parse_service_level_details,
+    'action': parse_action_level_details,
+}
+
+
+class ReportInputs:
+    """
+    The inputs of one report run.
+
+    `user_policy_map` is username -> list of policy ARNs, `policy_names` and
+    `policy_versions` map ARN -> name / default version ID, and `job_results`
+    maps ARN -> finished get_service_last_accessed_details response, in the
+    order the policies were first seen.
+    """
+
+    def __init__(self, user_policy_map, policy_names, policy_versions, job_results):
+        self.user_policy_map = user_policy_map
+        self.policy_names = policy_names
+        self.policy_versions = policy_versions
+        self.job_results = job_results
+
+
+def policy_row_templates(inputs, level):
+    """
+    Parse every policy of `inputs` once for `level`. Returns a dict of
+    ARN -> list of (PolicyName, PolicyArn, ServiceName, ActionName, epoch)
+    tuples with interned strings; rows only differ between users by UserName.
+    """
+    templates = {}
+    for policy_arn, job_details in inputs.job_results.items():
+        policy_name = intern_str(inputs.policy_names[policy_arn])
+        policy_arn = intern_str(policy_arn)
+        templates[policy_arn] = [
+            (
+                policy_name,
+                policy_arn,
+                intern_str(item["ServiceName"]),
+                intern_str(item.get("ActionName")),
+                to_epoch(item["LastAccessed"]),
+            )
+            for item in PARSERS[level](policy_arn, job_details)
+        ]
+    return templates
+
+
+def iter_report_rows(inputs, levels=LEVELS, account_id=None):
+    """
+    Yield (level, ReportRow) tuples for every user of `inputs`, user by user,
+    fanning each policy's parsed rows out to every user it applies to. Rows
+    are tagged with `account_id` when one is given.
+    """
+    templates = {level: policy_row_templates(inputs, level) for level in levels}
+
+    for username, user_policy_arns in inputs.user_policy_map.items():
+        username = intern_str(username)
+        for level in levels:
+            for policy_arn in user_policy_arns:
+                for template in templates[level][policy_arn]:
+                    yield level, ReportRow(username, *template, account_id=account_id)
@@ -0,0 +1,134 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Compact row type for large report runs.
+
+A ReportRow stores its fields in __slots__ instead of a per-row dict. Its
+strings are interned, so millions of rows share one copy of each user,
+policy and service name. Timestamps are kept as integer epoch seconds and
+are only formatted when a row is exported.
+"""
+import sys
+from datetime import datetime, timezone
+
+
+SERVICE_FIELDS = ("UserName", "PolicyName", "PolicyArn", "ServiceName", "LastAccessed")
+ACTION_FIELDS = ("UserName", "PolicyName", "PolicyArn", "ServiceName", "ActionName", "LastAccessed")
+ACCOUNT_FIELD = "AccountId"
+ACCOUNT_SERVICE_FIELDS = (ACCOUNT_FIELD,) + SERVICE_FIELDS
+ACCOUNT_ACTION_FIELDS = (ACCOUNT_FIELD,) + ACTION_FIELDS
+
+NEVER = "Never"
+
+
+def intern_str(value):
+    """
+    Intern a string so every row that repeats it shares one object.
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def to_epoch(value):
+    """
+    Convert a datetime (or None) into integer epoch seconds (or None).
+    """
+    if value is None:
+        return None
+    return int(value.timestamp())
+
+
+def format_timestamp(epoch):
+    """
+    Format integer epoch seconds the way the reports always have: an ISO 8601
+    UTC timestamp, or "Never" when there is no value.
+    """
+    if epoch is None:
+        return NEVER
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+class ReportRow:
+    """
+    One report row. `action_name` is None for service-level rows, which then
+    have the SERVICE_FIELDS columns instead of ACTION_FIELDS. Rows of a
+    multi-account run carry an `account_id`, exported as a leading AccountId
+    column.
+
+    Rows behave like read-only mappings of column name -> exported value, so
+    code written for the old dict rows (row["LastAccessed"], row.items())
+    keeps working.
+    """
+    __slots__ = ("user_name", "policy_name", "policy_arn", "service_name", "action_name", "last_accessed",
+                 "account_id")
+
+    def __init__(self, user_name, policy_name, policy_arn, service_name, action_name, last_accessed,
+                 account_id=None):
+        self.user_name = user_name
+        self.policy_name = policy_name
+        self.policy_arn = policy_arn
+        self.service_name = service_name
+        self.action_name = action_name
+        self.last_accessed = last_accessed
+        self.account_id = account_id
+
+    def keys(self):
+        if self.account_id is not None:
+            return ACCOUNT_SERVICE_FIELDS if self.action_name is None else ACCOUNT_ACTION_FIELDS
+        return SERVICE_FIELDS if self.action_name is None else ACTION_FIELDS
+
+    def _values(self, last_accessed):
+        if self.action_name is None:
+            values = (self.user_name, self.policy_name, self.policy_arn, self.service_name, last_accessed)
+        else:
+            values = (self.user_name, self.policy_name, self.policy_arn, self.service_name,
+                      self.action_name, last_accessed)
+        if self.account_id is not None:
+            return (self.account_id,) + values
+        return values
+
+    def values(self):
+        return self._values(format_timestamp(self.last_accessed))
+
+    def raw_values(self):
+        """
+        Like values(), but with LastAccessed left as epoch seconds (or None).
+        """
+        return self._values(self.last_accessed)
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __getitem__(self, key):
+        try:
+            return self.values()[self.keys().index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, ReportRow):
+            return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ReportRow({self.to_dict()!r})"
@@ -0,0 +1,450 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Long-running report server for portals and other frequent callers.
+
+Shelling out to a report script per request pays for interpreter startup, a
+new boto3 client and fresh IAM jobs every time. ReportService instead keeps
+one governed IAM client (and its connection pool) for its whole lifetime and
+answers from memory wherever it can:
+
+- the authorization graph is reloaded at most every `graph_ttl` seconds;
+- policy results live in MemoryResultCache, an LRU with a TTL in front of
+  the on-disk ResultCache, so repeated requests need no IAM job at all;
+- concurrent requests for the same user share one computation: the first
+  request runs it and the others wait for its result;
+- a background thread re-runs the jobs of the most requested policies
+  before their entries expire, so popular users stay fast.
+
+serve() exposes the service as a small JSON API over local HTTP or a Unix
+socket:
+
+    GET /report/<username>?level=action|service   report rows of one user
+    GET /stats                                     cache and request counters
+    GET /health                                    liveness check
+"""
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from iam_authorization_graph import load_authorization_graph
+from iam_last_accessed_jobs import DEFAULT_MAX_WORKERS, run_last_accessed_jobs
+from iam_report_model import JOB_GRANULARITY, LEVELS, ReportInputs, iter_report_rows
+from iam_result_cache import ResultCache
+from iam_user_policies import build_user_policy_map, distinct_policy_arns
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8642
+DEFAULT_MEMORY_TTL = 3600.0
+DEFAULT_MEMORY_MAX_ENTRIES = 2000
+DEFAULT_GRAPH_TTL = 300.0
+DEFAULT_REFRESH_INTERVAL = 600.0
+DEFAULT_REFRESH_TOP = 50
+DEFAULT_POPULARITY_HALF_LIFE = 3600.0
+
+
+class MemoryResultCache:
+    """
+    Thread-safe LRU of job results with a time-to-live, with the same get/put
+    interface as ResultCache. Misses fall through to `fallback` (normally the
+    on-disk ResultCache, or None) and its hits are kept in memory with the
+    time they were created, so a result older than `ttl_seconds` is a miss
+    wherever it comes from; new results are written to both.
+
+    Every get() that returns a result counts towards the entry's popularity,
+    which popular_stale() uses to pick the entries worth refreshing. Counts
+    halve every `popularity_half_life` seconds, so the ranking follows
+    recent demand.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MEMORY_MAX_ENTRIES, ttl_seconds=DEFAULT_MEMORY_TTL, fallback=None,
+                 popularity_half_life=DEFAULT_POPULARITY_HALF_LIFE):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.fallback = fallback
+        self.popularity_half_life = popularity_half_life
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (arn, granularity, version) -> (created_at, job_details)
+        self._popularity = Counter()
+        self._decayed_at = time.time()
+        self._lock = threading.Lock()
+
+    def get(self, arn, granularity, version_id):
+        key = (arn, granularity, version_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._count(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        entry = self.fallback.get_entry(arn, granularity, version_id) if self.fallback is not None else None
+        if entry is None or time.time() - entry[0] > self.ttl_seconds:
+            return None
+        self._store(key, entry[1], created_at=entry[0])
+        with self._lock:
+            self._count(key)
+        return entry[1]
+
+    def put(self, arn, granularity, version_id, job_details):
+        self._store((arn, granularity, version_id), job_details)
+        if self.fallback is not None:
+            self.fallback.put(arn, granularity, version_id, job_details)
+
+    def _store(self, key, job_details, created_at=None):
+        with self._lock:
+            self._entries[key] = (created_at or time.time(), job_details)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._popularity.pop(evicted, None)
+
+    def _count(self, key):
+        # Later requests weigh more, which is the same ranking as decaying every
+        # count continuously; _decay() rescales them now and then
+        self._popularity[key] += 2.0 ** ((time.time() - self._decayed_at) / self.popularity_half_life)
+
+    def _decay(self, now):
+        factor = 0.5 ** ((now - self._decayed_at) / self.popularity_half_life)
+        self._decayed_at = now
+        self._popularity = Counter({
+            key: count * factor for key, count in self._popularity.items() if count * factor >= 0.01
+        })
+
+    def popular_stale(self, count, older_than):
+        """
+        Return up to `count` of the most requested (arn, granularity, version)
+        keys whose results are older than `older_than` seconds.
+        """
+        now = time.time()
+        with self._lock:
+            self._decay(now)
+            return [
+                key for key, _ in self._popularity.most_common()
+                if key in self._entries and now - self._entries[key][0] > older_than
+            ][:count]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class ReportService:
+    """
+    Answers report requests from a warm IAM client and in-memory caches; see
+    the module docstring. `cache` is the result cache the jobs go through
+    (normally a MemoryResultCache).
+    """
+
+    def __init__(self, cache, governor=None, session=None, max_workers=DEFAULT_MAX_WORKERS,
+                 graph_ttl=DEFAULT_GRAPH_TTL):
+        # Imported here: iam_access_report is the heavier pipeline module
+        from iam_access_report import governed_iam_client
+
+        self.cache = cache
+        self.max_workers = max_workers
+        self.graph_ttl = graph_ttl
+        self.iam_client = governed_iam_client(governor, session, max_workers)
+        self.requests = 0
+        self.coalesced = 0
+        self.refreshed = 0
+        self._graph = None
+        self._graph_loaded_at = 0
+        self._graph_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def graph(self):
+        """
+        Return the authorization graph, reloading it once it is `graph_ttl` old.
+        """
+        with self._graph_lock:
+            if self._graph is None or time.time() - self._graph_loaded_at > self.graph_ttl:
+                self._graph = load_authorization_graph(self.iam_client)
+                self._graph_loaded_at = time.time()
+            return self._graph
+
+    def user_inputs(self, username):
+        """
+        Return the ReportInputs of one user, or None if the user does not
+        exist. Concurrent calls for the same user share one computation.
+        """
+        with self._inflight_lock:
+            self.requests += 1
+            pending = self._inflight.get(username)
+            if pending is None:
+                pending = self._inflight[username] = {"done": threading.Event()}
+                owner = True
+            else:
+                self.coalesced += 1
+                owner = False
+
+        if owner:
+            try:
+                pending["result"] = self._compute(username)
+            except Exception as e:
+                pending["error"] = e
+            finally:
+                with self._inflight_lock:
+                    del self._inflight[username]
+                pending["done"].set()
+        else:
+            pending["done"].wait()
+
+        if "error" in pending:
+            raise pending["error"]
+        return pending["result"]
+
+    def _compute(self, username):
+        graph = self.graph()
+        if username not in graph.users:
+            return None
+        user_policy_map = build_user_policy_map(graph, [username])
+        policy_arns = distinct_policy_arns(user_policy_map)
+        policy_versions = {arn: graph.policy_version(arn) for arn in policy_arns}
+        jobs = run_last_accessed_jobs(
+            self.iam_client,
+            policy_arns,
+            JOB_GRANULARITY,
+            max_workers=self.max_workers,
+            cache=self.cache,
+            versions=policy_versions
+        )
+        return ReportInputs(
+            user_policy_map,
+            {arn: graph.policy_name(arn) for arn in policy_arns},
+            policy_versions,
+            dict(jobs)
+        )
+
+    def report(self, username, level="action"):
+        """
+        Return the report rows (dicts) of one user, or None if the user does not exist.
+        """
+        inputs = self.user_inputs(username)
+        if inputs is None:
+            return None
+        return [row.to_dict() for _, row in iter_report_rows(inputs, (level,))]
+
+    def refresh_popular(self, count=DEFAULT_REFRESH_TOP, older_than=None):
+        """
+        Re-run the jobs of the `count` most requested policies whose results
+        are older than `older_than` seconds (half the cache TTL by default),
+        so they are fresh before they expire. Returns how many were refreshed.
+        """
+        if older_than is None:
+            older_than = self.cache.ttl_seconds / 2
+        keys = self.cache.popular_stale(count, older_than)
+        by_granularity = {}
+        for arn, granularity, version_id in keys:
+            by_granularity.setdefault(granularity, {})[arn] = version_id
+        for granularity, versions in by_granularity.items():
+            jobs = run_last_accessed_jobs(self.iam_client, list(versions), granularity, max_workers=self.max_workers)
+            for arn, job_details in jobs:
+                if job_details['JobStatus'] == 'COMPLETED':
+                    self.cache.put(arn, granularity, versions[arn], job_details)
+                    self.refreshed += 1
+        return len(keys)
+
+    def start_refresher(self, interval=DEFAULT_REFRESH_INTERVAL, count=DEFAULT_REFRESH_TOP):
+        """
+        Call refresh_popular() every `interval` seconds on a daemon thread until stop().
+        """
+        def refresh_loop():
+            while not self._stop.wait(interval):
+                try:
+                    refreshed = self.refresh_popular(count)
+                    if refreshed:
+                        print(f"[INFO] Refreshed {refreshed} popular policy results")
+                except Exception as e:
+                    print(f"[WARN] Background refresh failed: {e}", file=sys.stderr)
+
+        thread = threading.Thread(target=refresh_loop, name="iam-report-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._inflight_lock:
+            requests = {"total": self.requests, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+        return {
+            "requests": requests,
+            "cache": self.cache.stats(),
+            "refreshed": self.refreshed,
+            "graph_age_seconds": round(time.time() - self._graph_loaded_at, 1) if self._graph else None,
+        }
+
+
+class _ReportHandler(BaseHTTPRequestHandler):
+    server_version = "iam-access-report"
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._send_json(200, {"status": "ok"})
+        if url.path == "/stats":
+            return self._send_json(200, service.stats())
+        if not url.path.startswith("/report/"):
+            return self._send_json(404, {"error": f"unknown path {url.path}"})
+
+        username = unquote(url.path[len("/report/"):])
+        level = parse_qs(url.query).get("level", ["action"])[0]
+        if level not in LEVELS:
+            return self._send_json(400, {"error": f"level must be one of {', '.join(LEVELS)}"})
+        try:
+            rows = service.report(username, level)
+        except Exception as e:
+            print(f"[ERROR] Report for '{username}' failed: {e}", file=sys.stderr)
+            return self._send_json(502, {"error": f"{type(e).__name__}: {e}"})
+        if rows is None:
+            return self._send_json(404, {"error": f"IAM user '{username}' not found"})
+        self._send_json(200, {"user": username, "level": level, "rows": rows})
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, verbose=False):
+    """
+    Return an HTTP server for `service`, listening on a Unix socket when
+    `socket_path` is given and on host:port otherwise.
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = _UnixHTTPServer(socket_path, _ReportHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), _ReportHandler)
+        server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def build_parser(prog=None):
+    # Imported here: iam_access_report is the heavier pipeline module
+    from iam_access_report import add_cache_arguments, add_rate_arguments
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Serve IAM access reports over local HTTP or a Unix socket, with warm IAM clients, "
+                    "an in-memory result cache and background refresh of popular policies."
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--socket", metavar="PATH", help="Listen on this Unix socket instead of TCP")
+    add_rate_arguments(parser)
+    parser.add_argument(
+        "--memory-ttl",
+        type=float,
+        default=DEFAULT_MEMORY_TTL,
+        help=f"Seconds a policy result is served from memory (default: {DEFAULT_MEMORY_TTL:g})"
+    )
+    parser.add_argument(
+        "--memory-max-entries",
+        type=int,
+        default=DEFAULT_MEMORY_MAX_ENTRIES,
+        help=f"Policy results kept in memory before the least recently used are evicted "
+             f"(default: {DEFAULT_MEMORY_MAX_ENTRIES})"
+    )
+    parser.add_argument(
+        "--graph-ttl",
+        type=float,
+        default=DEFAULT_GRAPH_TTL,
+        help=f"Seconds before users, groups and policies are reloaded (default: {DEFAULT_GRAPH_TTL:g})"
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=DEFAULT_REFRESH_INTERVAL,
+        help=f"Seconds between background refreshes of popular policies; 0 disables them "
+             f"(default: {DEFAULT_REFRESH_INTERVAL:g})"
+    )
+    parser.add_argument(
+        "--refresh-top",
+        type=int,
+        default=DEFAULT_REFRESH_TOP,
+        help=f"Number of most requested policies refreshed each time (default: {DEFAULT_REFRESH_TOP})"
+    )
+    # The on-disk cache behind the in-memory one; --no-cache keeps results in memory only
+    add_cache_arguments(parser)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser
+
+
+def main(argv=None, prog=None):
+    from iam_access_report import rate_governor, result_cache_options
+
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+
+    governor = rate_governor(parser, args)
+    cache_options = result_cache_options(args)
+    fallback = ResultCache(**cache_options) if cache_options is not None else None
+    cache = MemoryResultCache(args.memory_max_entries, args.memory_ttl, fallback)
+    service = ReportService(cache, governor=governor, max_workers=args.max_workers, graph_ttl=args.graph_ttl)
+    if args.refresh_interval > 0:
+        service.start_refresher(args.refresh_interval, args.refresh_top)
+
+    server = make_server(service, args.host, args.port, args.socket, args.verbose)
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"[INFO] Serving IAM access reports on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+        if fallback is not None:
+            fallback.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Summary tables computed from the report rows while they are exported.
+
+SummaryWriter sits next to the file writers of a run. It keeps each row as a
+few integers in column arrays: a dictionary code per user, policy and
+service, and LastAccessed as epoch seconds. When the run finishes it computes
+one rollup per dimension (user, policy, service) and exports each one
+alongside the detail report as `<output>-by-<dimension>.<format>`:
+
+    Permissions         rows of the group
+    Used / NeverUsed    rows with and without a LastAccessed
+    NeverUsedFraction   NeverUsed / Permissions
+    Stale               rows not used within `stale_days` (never used included)
+    StaleFraction       Stale / Permissions
+    Services / Users    distinct services (users, for the service rollup) ...
+    UnusedServices/...  ... and how many of those have no used row at all
+    LastUsed            most recent LastAccessed of the group
+    DaysSinceUseP50/P90 percentiles of the days since use over the used rows
+                        (empty when nothing in the group was used)
+
+The arithmetic runs on NumPy arrays when NumPy is installed. Otherwise a
+pure-Python implementation produces the same tables. Percentiles use linear
+interpolation, like numpy.percentile.
+"""
+import time
+from array import array
+
+from iam_report_rows import ACCOUNT_FIELD, ReportRow, format_timestamp
+
+
+DEFAULT_STALE_DAYS = 90
+PERCENTILES = (50, 90)
+NULL_TIMESTAMP = -(2 ** 63)
+SECONDS_PER_DAY = 86400.0
+
+# dimension -> (key columns, column counted as distinct values and unused values)
+DIMENSIONS = {
+    "user": (("UserName",), "Services"),
+    "policy": (("PolicyName", "PolicyArn"), "Services"),
+    "service": (("ServiceName",), "Users"),
+}
+
+
+def load_numpy():
+    """
+    Return the numpy module, or None when it is not installed. It is only
+    imported once a summary is computed, so it adds nothing to startup.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class RowColumns:
+    """
+    Report rows reduced to column arrays: one dictionary code per user,
+    policy and service, and LastAccessed (NULL_TIMESTAMP when never used).
+    `keys[dimension]` lists the key tuples in code order.
+    """
+
+    def __init__(self):
+        self.codes = {dimension: array("q") for dimension in DIMENSIONS}
+        self.keys = {dimension: [] for dimension in DIMENSIONS}
+        self.last_accessed = array("q")
+        self.has_accounts = False
+        self._index = {dimension: {} for dimension in DIMENSIONS}
+        self._user = (None, None)
+
+    def _code(self, dimension, key):
+        index = self._index[dimension]
+        code = index.get(key)
+        if code is None:
+            code = index[key] = len(index)
+            self.keys[dimension].append(key)
+        return code
+
+    def add(self, row):
+        account_id = row.account_id
+        if account_id is not None:
+            self.has_accounts = True
+        # Rows arrive user by user, so the user code is usually the previous one
+        user_key = (account_id, row.user_name)
+        if self._user[0] != user_key:
+            self._user = (user_key, self._code("user", user_key))
+        self.codes["user"].append(self._user[1])
+        self.codes["policy"].append(self._code("policy", (account_id, row.policy_name, row.policy_arn)))
+        self.codes["service"].append(self._code("service", (account_id, row.service_name)))
+        last_accessed = row.last_accessed
+        self.last_accessed.append(NULL_TIMESTAMP if last_accessed is None else last_accessed)
+
+    def __len__(self):
+        return len(self.last_accessed)
+
+
+def _secondary(dimension):
+    return "user" if dimension == "service" else "service"
+
+
+def _aggregate_numpy(np, columns, dimension, now, cutoff):
+    """
+    Return one tuple of statistics per group of `dimension`, in code order:
+    (total, used, stale, distinct, unused_distinct, last_used, percentiles).
+    """
+    groups = len(columns.keys[dimension])
+    codes = np.frombuffer(columns.codes[dimension], dtype=np.int64)
+    other = np.frombuffer(columns.codes[_secondary(dimension)], dtype=np.int64)
+    last_accessed = np.frombuffer(columns.last_accessed, dtype=np.int64)
+
+    used_mask = last_accessed != NULL_TIMESTAMP
+    total = np.bincount(codes, minlength=groups)
+    used = np.bincount(codes[used_mask], minlength=groups)
+    stale = np.bincount(codes[~used_mask | (last_accessed < cutoff)], minlength=groups)
+
+    # Distinct secondary values per group, and those without any use
+    pairs, inverse = np.unique(codes * len(columns.keys[_secondary(dimension)]) + other, return_inverse=True)
+    pair_groups = pairs // len(columns.keys[_secondary(dimension)])
+    pair_used = np.bincount(inverse.ravel(), weights=used_mask, minlength=len(pairs)) > 0
+    distinct = np.bincount(pair_groups, minlength=groups)
+    unused_distinct = np.bincount(pair_groups[~pair_used], minlength=groups)
+
+    # Days since use of the used rows, sorted by group and then by days, so
+    # each group's first entry is its most recent use
+    used_codes = codes[used_mask]
+    used_at = last_accessed[used_mask]
+    days = (now - used_at) / SECONDS_PER_DAY
+    order = np.lexsort((days, used_codes))
+    days = days[order]
+    used_at = used_at[order]
+    starts = np.searchsorted(used_codes[order], np.arange(groups))
+    has_use = used > 0
+    last_used = np.full(groups, NULL_TIMESTAMP, dtype=np.int64)
+    last_used[has_use] = used_at[starts[has_use]]
+
+    percentiles = []
+    for percentile in PERCENTILES:
+        position = (used - 1).clip(min=0) * (percentile / 100.0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        fraction = position - lower
+        if len(days):
+            low = days[np.minimum(starts + lower, len(days) - 1)]
+            high = days[np.minimum(starts + upper, len(days) - 1)]
+            values = low + (high - low) * fraction
+        else:
+            values = np.zeros(groups)
+        percentiles.append(np.where(has_use, values, np.nan))
+
+    last_used = [None if value == NULL_TIMESTAMP else value for value in last_used.tolist()]
+    percentiles = zip(*([None if value != value else value for value in p.tolist()] for p in percentiles))
+    return list(zip(total.tolist(), used.tolist(), stale.tolist(), distinct.tolist(), unused_distinct.tolist(),
+                    last_used, percentiles))
+
+
+def _aggregate_python(columns, dimension, now, cutoff):
+    """
+    Pure-Python counterpart of _aggregate_numpy, with the same results.
+    """
+    groups = len(columns.keys[dimension])
+    total = [0] * groups
+    stale = [0] * groups
+    days = [[] for _ in range(groups)]
+    last_used = [None] * groups
+    pair_used = {}
+    for code, other, last_accessed in zip(columns.codes[dimension], columns.codes[_secondary(dimension)],
+                                          columns.last_accessed):
+        total[code] += 1
+        was_used = last_accessed != NULL_TIMESTAMP
+        if was_used:
+            days[code].append((now - last_accessed) / SECONDS_PER_DAY)
+            if last_used[code] is None or last_accessed > last_used[code]:
+                last_used[code] = last_accessed
+        if not was_used or last_accessed < cutoff:
+            stale[code] += 1
+        pair = (code, other)
+        pair_used[pair] = pair_used.get(pair, False) or was_used
+
+    distinct = [0] * groups
+    unused_distinct = [0] * groups
+    for (code, _), was_used in pair_used.items():
+        distinct[code] += 1
+        if not was_used:
+            unused_distinct[code] += 1
+
+    results = []
+    for g in range(groups):
+        group_days = sorted(days[g])
+        percentiles = []
+        for percentile in PERCENTILES:
+            if not group_days:
+                percentiles.append(None)
+                continue
+            position = (len(group_days) - 1) * (percentile / 100.0)
+            lower = int(position)
+            upper = min(lower + 1, len(group_days) - 1) if position > lower else lower
+            low, high = group_days[lower], group_days[upper]
+            percentiles.append(low + (high - low) * (position - lower))
+        results.append((total[g], len(group_days), stale[g], distinct[g], unused_distinct[g], last_used[g],
+                        tuple(percentiles)))
+    return results
+
+
+def summarize(columns, dimension, now=None, stale_days=DEFAULT_STALE_DAYS, numpy=None):
+    """
+    Yield the summary rows (dicts) of `dimension` for RowColumns `columns`,
+    ordered by key. `numpy` is the numpy module to use, or None for the
+    pure-Python implementation.
+    """
+    if not len(columns):
+        return
+    now = int(now if now is not None else time.time())
+    cutoff = now - stale_days * 86400
+    if numpy is not None:
+        stats = _aggregate_numpy(numpy, columns, dimension, now, cutoff)
+    else:
+        stats = _aggregate_python(columns, dimension, now, cutoff)
+
+    key_columns, distinct_column = DIMENSIONS[dimension]
+    if columns.has_accounts:
+        key_columns = (ACCOUNT_FIELD,) + key_columns
+    keys = columns.keys[dimension]
+    for g in sorted(range(len(keys)), key=lambda g: tuple("" if k is None else k for k in keys[g])):
+        key = keys[g] if columns.has_accounts else keys[g][1:]
+        total, used, stale, distinct, unused_distinct, last_used, percentiles = stats[g]
+        row = dict(zip(key_columns, key))
+        row.update({
+            "Permissions": total,
+            "Used": used,
+            "NeverUsed": total - used,
+            "NeverUsedFraction": round((total - used) / total, 4),
+            "Stale": stale,
+            "StaleFraction": round(stale / total, 4),
+            distinct_column: distinct,
+            f"Unused{distinct_column}": unused_distinct,
+            f"Unused{distinct_column}Fraction": round(unused_distinct / distinct, 4),
+            "LastUsed": format_timestamp(last_used),
+        })
+        for percentile, value in zip(PERCENTILES, percentiles):
+            row[f"DaysSinceUseP{percentile}"] = None if value is None else round(value, 1)
+        yield row
+
+
+class SummaryWriter:
+    """
+    Report writer that collects a run's rows of one level into RowColumns
+    and, on close(), exports the user, policy and service rollups in each of
+    `formats` next to the detail report `base_name`.
+    """
+    label = "Summary"
+
+    def __init__(self, base_name, formats, stale_days=DEFAULT_STALE_DAYS, now=None):
+        self.base_name = base_name
+        self.output_file = f"{base_name}-by-*"
+        self.formats = formats
+        self.stale_days = stale_days
+        self.now = now
+        self.rows_written = 0
+        self.columns = RowColumns()
+
+    def write(self, row):
+        if not isinstance(row, ReportRow):
+            raise TypeError("summaries are computed from ReportRow objects")
+        self.columns.add(row)
+        self.rows_written += 1
+
+    def close(self):
+        from iam_report_writers import open_writer, output_path, write_rows
+
+        if not self.rows_written:
+            print("[WARN] No data to summarize.")
+            return
+        numpy = load_numpy()
+        now = self.now if self.now is not None else time.time()
+        for dimension in DIMENSIONS:
+            base_name = f"{self.base_name}-by-{dimension}"
+            writers = [w for w in (open_writer(fmt, output_path(base_name, fmt)) for fmt in self.formats) if w]
+            write_rows(summarize(self.columns, dimension, now, self.stale_days, numpy), writers)
+        engine = "NumPy" if numpy is not None else "pure Python"
+        print(f"[INFO] Summarized {self.rows_written} rows by user, policy and service ({engine})")
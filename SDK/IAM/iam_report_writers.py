@@ -0,0 +1,280 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Streaming report writers.
+
+Every writer consumes rows one at a time through write() and keeps nothing
+but the open file, so memory stays flat however many rows a report has.
+Several writers can be fed from a single pass over the rows (see write_rows).
+
+Rows are ReportRow objects (see iam_report_rows) or plain dicts; writers only
+rely on keys(), values() and items(), so timestamps are formatted here, at
+export time.
+
+The text formats can also resume a partial file: position() reports how far
+the file is written, and a writer opened with resume=(position, rows_written)
+truncates the file back to that point and carries on appending, which is how
+checkpointed runs (see iam_checkpoint) continue after an interruption.
+
+Each writer imports its serializer (csv, PyYAML, xml.sax) when it is opened,
+so a run only pays for the formats it writes.
+"""
+import json
+import sys
+
+
+class ReportWriter:
+    """
+    Base class: open `output_file`, accept rows through write(), finish the
+    document in close(). Writers are also context managers.
+
+    `resume` is a (position, rows_written) pair from an earlier position()
+    call; the file is truncated back to it and writing continues from there.
+    A resume point without rows simply starts the file over.
+    """
+    label = None
+
+    def __init__(self, output_file, resume=None):
+        self.output_file = output_file
+        self.rows_written = 0
+        self._f = self._open(resume)
+
+    def _open(self, resume):
+        if not resume or not resume[1]:
+            return open(self.output_file, 'w', newline='', encoding='utf-8')
+        f = open(self.output_file, 'r+', newline='', encoding='utf-8')
+        f.seek(resume[0])
+        f.truncate()
+        self.rows_written = resume[1]
+        return f
+
+    @property
+    def resumed(self):
+        return self.rows_written > 0
+
+    def position(self):
+        """
+        Flush and return (position, rows_written) for a later resume.
+        """
+        if self._f is None:
+            return 0, 0
+        self._f.flush()
+        return self._f.tell(), self.rows_written
+
+    def write(self, row):
+        self._write(row)
+        self.rows_written += 1
+
+    def _write(self, row):
+        raise NotImplementedError
+
+    def _finish(self):
+        pass
+
+    def close(self):
+        self._finish()
+        self._f.close()
+        print(f"[INFO] {self.label} report written to {self.output_file}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvWriter(ReportWriter):
+    """
+    CSV with a header taken from the keys of the first row.
+    """
+    label = "CSV"
+
+    def __init__(self, output_file, resume=None):
+        self.output_file = output_file
+        self.rows_written = 0
+        self._f = None
+        self._writer = None
+        if resume and resume[1]:
+            self._f = self._open(resume)
+            self._writer = self._csv_writer()
+
+    def _csv_writer(self):
+        import csv
+        return csv.writer(self._f)
+
+    def _write(self, row):
+        if self._writer is None:
+            self._f = open(self.output_file, mode='w', newline='', encoding='utf-8')
+            self._writer = self._csv_writer()
+            self._writer.writerow(row.keys())
+        self._writer.writerow(row.values())
+
+    def close(self):
+        if self._f is None:
+            print("[WARN] No data to export to CSV.")
+            return
+        super().close()
+
+
+class JsonWriter(ReportWriter):
+    """
+    A single JSON array, formatted like json.dump(rows, indent=2).
+    """
+    label = "JSON"
+
+    def _write(self, row):
+        encoded = json.dumps(dict(row.items()), indent=2, default=str)  # default=str to handle datetime if any remain
+        self._f.write(",\n  " if self.rows_written else "[\n  ")
+        self._f.write(encoded.replace("\n", "\n  "))
+
+    def _finish(self):
+        self._f.write("\n]" if self.rows_written else "[]")
+
+
+class NdjsonWriter(ReportWriter):
+    """
+    Newline-delimited JSON: one compact object per line.
+    """
+    label = "NDJSON"
+
+    def _write(self, row):
+        self._f.write(json.dumps(dict(row.items()), default=str))
+        self._f.write("\n")
+
+
+class YamlWriter(ReportWriter):
+    """
+    A YAML sequence of mappings, emitted one item at a time.
+    Requires PyYAML to be installed.
+    """
+    label = "YAML"
+
+    def __init__(self, output_file, resume=None):
+        # For YAML output (requires "pip install PyYAML")
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("PyYAML is not installed. Install via 'pip install PyYAML' to enable YAML export.")
+        self._yaml = yaml
+        super().__init__(output_file, resume)
+
+    def _write(self, row):
+        self._yaml.dump([dict(row.items())], self._f, sort_keys=False, default_flow_style=False)
+
+    def _finish(self):
+        if not self.rows_written:
+            self._f.write("[]\n")
+
+
+class XmlWriter(ReportWriter):
+    """
+    A root <Report> element with one <Record> per row, written incrementally.
+    """
+    label = "XML"
+
+    def __init__(self, output_file, resume=None):
+        from xml.sax.saxutils import XMLGenerator
+
+        super().__init__(output_file, resume)
+        self._xml = XMLGenerator(self._f, encoding='utf-8', short_empty_elements=True)
+        if not self.resumed:
+            self._xml.startDocument()
+            self._xml.startElement("Report", {})
+
+    def _write(self, row):
+        self._xml.startElement("Record", {})
+        for key, value in row.items():
+            # For convenience, store everything as string
+            self._xml.startElement(key, {})
+            self._xml.characters(str(value))
+            self._xml.endElement(key)
+        self._xml.endElement("Record")
+
+    def _finish(self):
+        self._xml.endElement("Report")
+        self._xml.endDocument()
+
+
+def _columnar_writer(fmt):
+    """
+    Factory for the columnar formats; iam_columnar (and pyarrow, if present)
+    is only imported when one of them is requested.
+    """
+    def open_columnar(output_file):
+        from iam_columnar import open_columnar_writer
+        return open_columnar_writer(fmt, output_file)
+    return open_columnar
+
+
+WRITERS = {
+    "csv": CsvWriter,
+    "json": JsonWriter,
+    "ndjson": NdjsonWriter,
+    "yaml": YamlWriter,
+    "xml": XmlWriter,
+    "parquet": _columnar_writer("parquet"),
+    "arrow": _columnar_writer("arrow"),
+    "columnar": _columnar_writer("columnar"),
+}
+
+# Formats whose writers accept `resume`; the columnar formats are always rewritten
+RESUMABLE_FORMATS = ("csv", "json", "ndjson", "yaml", "xml")
+
+FILE_EXTENSIONS = {
+    "columnar": "iamcol",
+}
+
+
+def output_path(base_name, fmt):
+    """
+    Return the file name for `fmt` output with the given base name.
+    """
+    return f"{base_name}.{FILE_EXTENSIONS.get(fmt, fmt)}"
+
+
+def open_writer(fmt, output_file, resume=None):
+    """
+    Return a writer for `fmt`, or None (after reporting why) if it can't be used.
+    `resume` is ignored for formats that are not in RESUMABLE_FORMATS.
+    """
+    try:
+        if resume and fmt in RESUMABLE_FORMATS:
+            return WRITERS[fmt](output_file, resume)
+        return WRITERS[fmt](output_file)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return None
+
+
+def write_rows(rows, writers):
+    """
+    Feed every row of `rows` to each writer in `writers`, then close them.
+    """
+    try:
+        for row in rows:
+            for writer in writers:
+                writer.write(row)
+    finally:
+        for writer in writers:
+            writer.close()
+
+
+def export_rows(fmt, rows, output_file):
+    """
+    Stream `rows` into a single file of format `fmt`.
+    """
+    writer = open_writer(fmt, output_file)
+    if writer is not None:
+        write_rows(rows, [writer])
@@ -0,0 +1,176 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Persistent SQLite cache of finished "last accessed" job results.
+
+Entries are keyed by ARN, granularity and the policy's default version ID, so
+editing a policy automatically invalidates its cached result. Entries expire
+after a TTL and the least recently used ones are evicted once the cache holds
+more than `max_entries` results.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+
+DEFAULT_TTL_HOURS = 24.0
+DEFAULT_MAX_ENTRIES = 5000
+# Organization runs share one cache file between worker processes: wait this
+# long for another writer's lock instead of failing with "database is locked"
+BUSY_TIMEOUT = 30.0
+
+
+def default_cache_path():
+    """
+    Return the default cache file, under $XDG_CACHE_HOME or ~/.cache.
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'iam-access-report', 'last-accessed.sqlite')
+
+
+def encode_datetime(value):
+    """
+    json `default` hook: datetimes become {"__datetime__": <ISO 8601>}.
+    """
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def decode_datetime(obj):
+    """
+    json `object_hook` that reverses encode_datetime.
+    """
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+def dump_job_details(job_details):
+    """
+    Serialize a job response to JSON, keeping its datetimes and dropping
+    ResponseMetadata.
+    """
+    job_details = {k: v for k, v in job_details.items() if k != 'ResponseMetadata'}
+    return json.dumps(job_details, default=encode_datetime)
+
+
+def load_job_details(text):
+    """
+    Inverse of dump_job_details.
+    """
+    return json.loads(text, object_hook=decode_datetime)
+
+
+class ResultCache:
+    """
+    Cache of get_service_last_accessed_details responses.
+
+    With `refresh=True` every lookup misses, but fresh results are still
+    stored, which is how the `--refresh` flag forces new jobs.
+    """
+
+    def __init__(self, path=None, ttl_hours=DEFAULT_TTL_HOURS, max_entries=DEFAULT_MAX_ENTRIES, refresh=False):
+        self.path = path or default_cache_path()
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        # WAL lets readers carry on while another process writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                arn TEXT NOT NULL,
+                granularity TEXT NOT NULL,
+                version_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                job_details TEXT NOT NULL,
+                PRIMARY KEY (arn, granularity, version_id)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._conn.commit()
+
+    def get(self, arn, granularity, version_id):
+        """
+        Return the cached job details, or None if missing, expired or refreshing.
+        """
+        entry = self.get_entry(arn, granularity, version_id)
+        return entry[1] if entry is not None else None
+
+    def get_entry(self, arn, granularity, version_id):
+        """
+        Like get(), but return (created_at, job_details) so callers can tell
+        how old the result is.
+        """
+        if self.refresh:
+            return None
+
+        key = (arn, granularity, version_id or '')
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at, job_details FROM results WHERE arn = ? AND granularity = ? AND version_id = ?",
+                key
+            ).fetchone()
+            if row is None:
+                return None
+
+            now = time.time()
+            if now - row[0] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM results WHERE arn = ? AND granularity = ? AND version_id = ?", key)
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                "UPDATE results SET last_used = ? WHERE arn = ? AND granularity = ? AND version_id = ?",
+                (now,) + key
+            )
+            self._conn.commit()
+        return row[0], load_job_details(row[1])
+
+    def put(self, arn, granularity, version_id, job_details):
+        """
+        Store a completed job's details and evict the least recently used
+        entries beyond `max_entries`.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (arn, granularity, version_id or '', now, now, dump_job_details(job_details))
+            )
+            self._conn.execute(
+                """
+                DELETE FROM results WHERE rowid IN (
+                    SELECT rowid FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,57 @@
+# AWS SDK Scripts - IAM
+# Copyright (C) 2025 Aaron Mathis
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Helpers that map IAM users to the managed policies that apply to them.
+
+All lookups are answered from an AuthorizationGraph (see
+iam_authorization_graph), so mapping any number of users costs no extra IAM calls.
+"""
+import sys
+
+
+def read_users_file(path):
+    """
+    Read IAM usernames from a text file, one per line.
+    Blank lines and lines starting with '#' are ignored, and duplicates are
+    dropped, keeping the first occurrence.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        names = (line.strip() for line in f)
+        return list(dict.fromkeys(name for name in names if name and not name.startswith('#')))
+
+
+def build_user_policy_map(graph, usernames=None):
+    """
+    Return a dict of username -> list of managed policy ARNs, keeping the
+    order of `usernames` (every user in the graph when None). Users that do
+    not exist in the account are reported and skipped.
+    """
+    if usernames is None:
+        usernames = graph.usernames()
+
+    user_policy_map = {}
+    for username in usernames:
+        if username not in graph.users:
+            print(f"[WARN] IAM user '{username}' not found, skipping.", file=sys.stderr)
+            continue
+        user_policy_map[username] = graph.managed_policies_for_user(username)
+    return user_policy_map
+
+
+def distinct_policy_arns(user_policy_map):
+    """
+    Return every policy ARN in `user_policy_map` exactly once, in first-seen order.
+    """
+    return list(dict.fromkeys(arn for arns in user_policy_map.values() for arn in arns))
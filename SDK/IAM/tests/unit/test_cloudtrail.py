@@ -0,0 +1,21 @@
+import gzip
+import os
+import sys
+
+IAM_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, IAM_DIR)
+
+import iam_cloudtrail  # noqa: E402
+from iam_cloudtrail import iter_records  # noqa: E402
+
+
+def test_records_array_after_a_key_split_across_reads(tmp_path, monkeypatch):
+    # Small reads put the '[' of Records in a later chunk than the key,
+    # after other fields that hold arrays of their own
+    monkeypatch.setattr(iam_cloudtrail, "READ_SIZE", 16)
+    path = str(tmp_path / "log.json.gz")
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write('{"Tags": ["a", "b"], "Other": [1, 2], "Records"' + " " * 40 +
+                ': [{"eventName": "GetObject"}, {"eventName": "PutObject"}]}')
+
+    assert [record["eventName"] for record in iter_records(path)] == ["GetObject", "PutObject"]
@@ -0,0 +1,93 @@
+import os
+import sys
+
+import pytest
+
+IAM_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, IAM_DIR)
+
+from iam_checkpoint import write_checkpointed_rows  # noqa: E402
+from iam_history_store import HistoryStore, service_namespaces  # noqa: E402
+from iam_report_rows import ReportRow  # noqa: E402
+
+DAY = 86400
+NOW = 1_750_000_000
+
+
+def rows_for(user, policies, actions=("GetObject", "PutObject")):
+    return [
+        ReportRow(user, f"policy-{n}", f"arn:aws:iam::123456789012:policy/policy-{n}",
+                  "Amazon S3", action, None)
+        for n in policies for action in actions
+    ]
+
+
+def unused(store, **filters):
+    return list(store.unused(90, now=NOW, **filters))
+
+
+def test_users_without_rows_lose_their_permissions(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    store.record(rows_for("alice", [1, 2]) + rows_for("bob", [3]), collected_at=NOW - DAY)
+    assert len(unused(store, user="alice")) == 4
+
+    # Every policy of alice detached: she writes no rows in the next all-users run
+    store.record(rows_for("bob", [3]), collected_at=NOW)
+
+    assert unused(store, user="alice") == []
+    assert len(unused(store, user="bob")) == 2
+    # The earlier run still shows what alice had then
+    assert len(list(store.unused(90, as_of=NOW - DAY, user="alice"))) == 4
+
+
+def test_users_outside_the_run_keep_their_permissions(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    store.record(rows_for("alice", [1]) + rows_for("bob", [3]), collected_at=NOW - DAY)
+
+    # A run for bob alone (his policies all detached) says nothing about alice
+    store.record([], collected_at=NOW, usernames=["bob"])
+
+    assert unused(store, user="bob") == []
+    assert len(unused(store, user="alice")) == 2
+
+
+def test_policy_filter_by_name_or_arn(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    store.record(rows_for("alice", [1, 2]), collected_at=NOW)
+
+    by_name = unused(store, policy="policy-1")
+    by_arn = unused(store, policy="arn:aws:iam::123456789012:policy/policy-1")
+    assert len(by_name) == 2
+    assert by_name == by_arn
+
+
+def test_service_prefixes_resolve_from_job_namespaces(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    store.record(rows_for("alice", [1]), collected_at=NOW)
+    assert unused(store, service="s3") == []
+
+    job = {"ServicesLastAccessed": [
+        {"ServiceName": "Amazon S3", "ServiceNamespace": "S3"},
+        {"ServiceName": "AWS Key Management Service", "ServiceNamespace": "kms"},
+    ]}
+    assert service_namespaces([job, None]) == {("s3", "Amazon S3"), ("kms", "AWS Key Management Service")}
+    store.record_service_namespaces(service_namespaces([job]))
+
+    assert len(unused(store, service="s3")) == 2
+    assert len(unused(store, service="s3", action="GetObject")) == 1
+
+
+def test_failed_run_keeps_the_interrupted_user_open(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    store.record(rows_for("alice", [1, 2]), collected_at=NOW - DAY)
+
+    def failing_rows():
+        # The run dies after the first of alice's four rows
+        yield "action", rows_for("alice", [1])[0]
+        raise RuntimeError("credentials expired")
+
+    writers = {"action": [("history", store.writer("action", NOW))]}
+    with pytest.raises(RuntimeError):
+        write_checkpointed_rows(failing_rows(), writers)
+
+    assert len(unused(store, user="alice")) == 4
@@ -0,0 +1,78 @@
+import os
+import sys
+
+IAM_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, IAM_DIR)
+
+import iam_report_server  # noqa: E402
+from iam_report_server import MemoryResultCache  # noqa: E402
+
+KEY = ("arn:aws:iam::123456789012:policy/p", "ACTION_LEVEL", "v1")
+RESULT = {"JobStatus": "COMPLETED", "ServicesLastAccessed": []}
+
+
+class DiskCache:
+    """
+    Stand-in for ResultCache holding entries with their creation time.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def get_entry(self, arn, granularity, version_id):
+        return self.entries.get((arn, granularity, version_id))
+
+    def put(self, arn, granularity, version_id, job_details):
+        self.entries[(arn, granularity, version_id)] = (iam_report_server.time.time(), job_details)
+
+
+def at(monkeypatch, now):
+    monkeypatch.setattr(iam_report_server.time, "time", lambda: now)
+
+
+def test_fallback_results_keep_their_age(monkeypatch):
+    disk = DiskCache()
+    at(monkeypatch, 1000.0)
+    disk.put(*KEY, RESULT)
+    cache = MemoryResultCache(ttl_seconds=3600, fallback=disk)
+
+    at(monkeypatch, 1000.0 + 3000)
+    assert cache.get(*KEY) == RESULT
+    # Loaded from disk 3000 s after it was created: stale after another 600 s, not 3600
+    assert cache.popular_stale(10, older_than=1800) == [KEY]
+    at(monkeypatch, 1000.0 + 3700)
+    assert cache.get(*KEY) is None
+
+
+def test_popularity_counts_requests_not_refreshes(monkeypatch):
+    at(monkeypatch, 1000.0)
+    cache = MemoryResultCache(ttl_seconds=3600)
+    other = KEY[:2] + ("v2",)
+    cache.put(*KEY, RESULT)
+    cache.put(*other, RESULT)
+    cache.get(*other)
+
+    for _ in range(5):
+        cache.put(*KEY, RESULT)
+    at(monkeypatch, 3000.0)
+    assert cache.popular_stale(1, older_than=0) == [other]
+
+
+def test_popularity_decays(monkeypatch):
+    at(monkeypatch, 1000.0)
+    cache = MemoryResultCache(ttl_seconds=100000, popularity_half_life=3600)
+    old, recent = KEY, KEY[:2] + ("v2",)
+    cache.put(*old, RESULT)
+    cache.put(*recent, RESULT)
+    for _ in range(4):
+        cache.get(*old)
+
+    # Four requests three half-lives ago weigh less than two requests now
+    at(monkeypatch, 1000.0 + 3 * 3600)
+    cache.get(*recent)
+    cache.get(*recent)
+    assert cache.popular_stale(2, older_than=0) == [recent, old]
+
+    # And a day later nobody has asked for either
+    at(monkeypatch, 1000.0 + 86400)
+    assert cache.popular_stale(2, older_than=0) == []
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+IAM_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, IAM_DIR)
+
+from iam_rate_governor import RateGovernor, parse_api_rates  # noqa: E402
+
+
+def test_parse_api_rates():
+    assert parse_api_rates(["GetPolicy=5", " GenerateServiceLastAccessedDetails = 0.5 "]) == {
+        "GetPolicy": 5.0,
+        "GenerateServiceLastAccessedDetails": 0.5,
+    }
+
+
+@pytest.mark.parametrize("value", ["GetPolicy=0", "GetPolicy=0.0", "GetPolicy=-1", "GetPolicy=1.2.3", "GetPolicy"])
+def test_parse_api_rates_rejects_invalid_rates(value):
+    with pytest.raises(ValueError):
+        parse_api_rates([value])
+
+
+@pytest.mark.parametrize("options", [{"account_rate": 0}, {"account_rate": -2}, {"api_rates": {"GetPolicy": 0}}])
+def test_governor_rejects_non_positive_rates(options):
+    with pytest.raises(ValueError):
+        RateGovernor(**options)
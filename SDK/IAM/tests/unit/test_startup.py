@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+IAM_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, IAM_DIR)
+
+from iam_cli import COMMAND_BUDGET_MS, COMMANDS, STARTUP_BUDGET_MS  # noqa: E402
+
+# Heavy modules that must only be imported once a run actually needs them
+DEFERRED = ("boto3", "botocore", "s3transfer", "urllib3", "yaml", "csv", "xml", "pyarrow", "zstandard",
+            "concurrent", "cProfile")
+
+# Wall-clock budgets depend on the machine and its load, so they are only
+# checked when asked for: IAM_STARTUP_BUDGETS=1 python -m pytest tests
+budgets = pytest.mark.skipif(not os.environ.get("IAM_STARTUP_BUDGETS"),
+                             reason="set IAM_STARTUP_BUDGETS=1 to check import-time budgets")
+
+# The benchmark drives a fake IAM backend built on botocore, so it is exempt
+REPORT_MODULES = sorted({module for name, (module, _, _) in COMMANDS.items() if name != "benchmark"})
+
+
+def import_times(module, runs=3):
+    """
+    Import `module` in fresh interpreters under -X importtime and return
+    ({imported module: cumulative microseconds}, best cumulative time of
+    `module` itself in milliseconds). The first run also warms the bytecode cache.
+    """
+    best = None
+    for _ in range(runs + 1):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=IAM_DIR, capture_output=True, text=True, check=True
+        )
+        times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+        total = times[module] / 1000
+        best = total if best is None else min(best, total)
+    return times, best
+
+
+def deferred_imports(times):
+    return sorted(name for name in times if name.split(".")[0] in DEFERRED)
+
+
+def test_cli_imports_no_tool_modules():
+    times, _ = import_times("iam_cli")
+    assert deferred_imports(times) == []
+    assert not [name for name in times if name.startswith("iam_") and name != "iam_cli"]
+
+
+@budgets
+def test_cli_startup_budget():
+    _, total = import_times("iam_cli")
+    assert total <= STARTUP_BUDGET_MS, f"iam_cli imports in {total:.1f} ms (budget {STARTUP_BUDGET_MS} ms)"
+
+
+@pytest.mark.parametrize("module", REPORT_MODULES)
+def test_command_defers_heavy_imports(module):
+    times, _ = import_times(module)
+    assert deferred_imports(times) == []
+
+
+@budgets
+@pytest.mark.parametrize("module", REPORT_MODULES)
+def test_command_startup_budget(module):
+    _, total = import_times(module)
+    assert total <= COMMAND_BUDGET_MS, f"{module} imports in {total:.1f} ms (budget {COMMAND_BUDGET_MS} ms)"
+
+
+def test_help_runs_without_aws_libraries():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(IAM_DIR, "iam-access-report"), "action", "--help"],
+        cwd=IAM_DIR, capture_output=True, text=True, check=True
+    )
+    assert "usage: iam-access-report action" in result.stdout
+    assert " boto3" not in result.stderr and " botocore" not in result.stderr